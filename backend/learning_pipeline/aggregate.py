@@ -0,0 +1,112 @@
+"""
+Agregación robusta y vectorizada de las cajas de campo de una plantilla.
+
+Todas las muestras de un NIF se procesan como un único array (N, 4) con el
+índice de campo de cada fila. Las estadísticas por campo se calculan por
+grupos con NumPy (orden lexicográfico + bincount), sin bucles Python por
+muestra. Una coordenada ausente va como NaN y solo se ignora en su columna.
+"""
+import numpy as np
+
+COORD_KEYS = ["x", "y", "w", "h"]
+METHODS = ("mean", "median", "trimmed", "robust")
+MAD_SCALE = 1.4826  # MAD -> desviación típica si los datos fueran normales
+# tolerancia mínima de `robust` relativa a la mediana: evita descartar todo
+# lo que no sea idéntico cuando la mayoría de muestras coincide (MAD = 0)
+REL_TOL = 0.005
+
+
+def _group_sort(ids, values, n_groups):
+    """Valores no-NaN ordenados por (grupo, valor), con recuento e inicio de cada grupo."""
+    valid = ~np.isnan(values)
+    g, v = ids[valid], values[valid]
+    order = np.lexsort((v, g))
+    g, v = g[order], v[order]
+    counts = np.bincount(g, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    return g, v, counts, starts
+
+
+def _group_median(v, counts, starts):
+    # `v` ya está ordenado dentro de cada grupo
+    out = np.full(len(counts), np.nan)
+    has = counts > 0
+    lo = starts[has] + (counts[has] - 1) // 2
+    hi = starts[has] + counts[has] // 2
+    out[has] = (v[lo] + v[hi]) / 2
+    return out
+
+
+def _sorted_in_groups(g, values):
+    # `g` ya está ordenado: lexsort conserva los grupos y ordena dentro de cada uno
+    return values[np.lexsort((values, g))]
+
+
+def _group_mean_std(g, v, keep, n_groups):
+    gk, vk = g[keep], v[keep]
+    n = np.bincount(gk, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.bincount(gk, weights=vk, minlength=n_groups) / n
+        var = np.bincount(gk, weights=(vk - mean[gk]) ** 2, minlength=n_groups) / n
+    return mean, np.sqrt(var), n
+
+
+def aggregate_column(ids, values, n_groups, method="robust", trim=0.1, k=3.0):
+    """(centro, dispersión, muestras, muestras usadas) por grupo para una coordenada.
+
+    - mean: media de todas las muestras; dispersión = desviación típica.
+    - median: mediana; dispersión = MAD escalada.
+    - trimmed: media tras descartar la fracción `trim` por cada extremo.
+    - robust: descarta las muestras a más de `k` MAD escaladas de la mediana
+      y promedia el resto.
+    """
+    if method not in METHODS:
+        raise ValueError(f"unknown aggregation method: {method}")
+    g, v, counts, starts = _group_sort(ids, values, n_groups)
+    if method == "median":
+        med = _group_median(v, counts, starts)
+        dev = np.abs(v - med[g])
+        mad = _group_median(_sorted_in_groups(g, dev), counts, starts)
+        return med, MAD_SCALE * mad, counts, counts
+    keep = np.ones(len(v), dtype=bool)
+    if method == "trimmed":
+        rank = np.arange(len(v)) - starts[g]
+        cut = np.floor(counts * trim).astype(np.int64)
+        keep = (rank >= cut[g]) & (rank < (counts - cut)[g])
+    elif method == "robust":
+        med = _group_median(v, counts, starts)
+        dev = np.abs(v - med[g])
+        mad = _group_median(_sorted_in_groups(g, dev), counts, starts)
+        thr = k * np.maximum(MAD_SCALE * mad, REL_TOL * np.abs(med))
+        keep = dev <= thr[g]
+    mean, std, used = _group_mean_std(g, v, keep, n_groups)
+    return mean, std, counts, used
+
+
+def aggregate_boxes(ids, coords, n_fields, method="robust", trim=0.1, k=3.0):
+    """Agrega las muestras (N, 4) de `coords` agrupadas por `ids` (0..n_fields-1).
+
+    Devuelve arrays (n_fields, 4): centro, dispersión, muestras y muestras usadas.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, len(COORD_KEYS))
+    cols = [aggregate_column(ids, coords[:, c], n_fields, method, trim, k)
+            for c in range(len(COORD_KEYS))]
+    center, spread, samples, used = (np.stack(parts, axis=1) for parts in zip(*cols))
+    return center, spread, samples, used
+
+
+def confidence(center, spread, samples, used):
+    """Confianza 0..1 por campo.
+
+    Fracción de muestras usadas × 1 / (1 + dispersión media relativa al
+    tamaño de la caja) × n / (n + 1), para penalizar campos con pocas muestras.
+    Es adimensional: vale igual para píxeles que para coordenadas 0..1.
+    """
+    n = samples.max(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = used.sum(axis=1) / samples.sum(axis=1)
+        size = np.maximum(np.nan_to_num(np.maximum(center[:, 2], center[:, 3])), 1e-9)
+        rel = np.nan_to_num(spread).mean(axis=1) / size
+        conf = np.nan_to_num(ratio) / (1 + rel) * n / (n + 1)
+    return conf
@@ -1,5 +1,183 @@
+import argparse
 import json
+import math
+import os
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from backend.learning_pipeline.template_cache import CompiledTemplate, TemplateCache  # noqa: E402
+from backend.learning_pipeline.template_matcher import LayoutIndex  # noqa: E402
+from scripts.corrections_loader import chunked  # noqa: E402
+
+TEMPLATE_DIR = "backend/templates"
+# puntuación mínima para aplicar la plantilla identificada por maquetación
+MIN_MATCH_SCORE = 0.35
+
+
+def word_box(word):
+    """Devuelve (x0, y0, x1, y1) de una palabra OCR; sin w/h se trata como un punto."""
+    x, y = word.get("x", 0), word.get("y", 0)
+    return (x, y, x + word.get("w", 0), y + word.get("h", 0))
+
+
+class WordIndex:
+    """R-tree empaquetado (Sort-Tile-Recursive) sobre las palabras de un documento OCR.
+
+    Se construye una vez por documento; cada consulta solo desciende por los
+    nodos cuyo rectángulo solapa el pedido en lugar de recorrer todas las palabras.
+    """
+
+    NODE_SIZE = 16
+
+    def __init__(self, words, node_size=NODE_SIZE):
+        self.words = words
+        self.boxes = [word_box(w) for w in words]
+        self.node_size = node_size
+        # Cada nivel es una lista de nodos (x0, y0, x1, y1, hijos); los hijos del
+        # nivel 0 son índices de palabra y los de los demás, índices del nivel inferior
+        self.levels = []
+        rects, items = self.boxes, range(len(self.boxes))
+        while len(items) > 0:
+            nodes = self._pack(items, rects)
+            self.levels.append(nodes)
+            if len(nodes) == 1:
+                break
+            rects, items = nodes, range(len(nodes))
+
+    def _pack(self, items, rects):
+        b = self.node_size
+        x0s, y0s, x1s, y1s = ([r[k] for r in rects] for k in range(4))
+        cx = [a + c for a, c in zip(x0s, x1s)]
+        cy = [a + c for a, c in zip(y0s, y1s)]
+        n_nodes = math.ceil(len(items) / b)
+        per_slice = math.ceil(math.sqrt(n_nodes)) * b
+        by_x = sorted(items, key=cx.__getitem__)
+        nodes = []
+        for s in range(0, len(by_x), per_slice):
+            by_y = sorted(by_x[s:s + per_slice], key=cy.__getitem__)
+            for c in range(0, len(by_y), b):
+                chunk = by_y[c:c + b]
+                nodes.append((
+                    min(map(x0s.__getitem__, chunk)), min(map(y0s.__getitem__, chunk)),
+                    max(map(x1s.__getitem__, chunk)), max(map(y1s.__getitem__, chunk)),
+                    chunk,
+                ))
+        return nodes
+
+    def query(self, x0, y0, x1, y1):
+        """Índices de las palabras cuyo rectángulo intersecta (x0, y0, x1, y1)."""
+        if not self.levels:
+            return []
+        out = []
+        stack = [(len(self.levels) - 1, node) for node in self.levels[-1]]
+        while stack:
+            depth, (nx0, ny0, nx1, ny1, children) = stack.pop()
+            if nx0 > x1 or nx1 < x0 or ny0 > y1 or ny1 < y0:
+                continue
+            if depth == 0:
+                for i in children:
+                    bx0, by0, bx1, by1 = self.boxes[i]
+                    if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0:
+                        out.append(i)
+            else:
+                below = self.levels[depth - 1]
+                stack.extend((depth - 1, below[c]) for c in children)
+        return out
+
+
+def _rank_key(word_rect, field_rect):
+    """Mayor fracción de la palabra dentro del campo primero, luego el centro más cercano."""
+    wx0, wy0, wx1, wy1 = word_rect
+    fx0, fy0, fx1, fy1 = field_rect
+    area = (wx1 - wx0) * (wy1 - wy0)
+    if area > 0:
+        iw = min(wx1, fx1) - max(wx0, fx0)
+        ih = min(wy1, fy1) - max(wy0, fy0)
+        overlap = max(iw, 0) * max(ih, 0) / area
+    else:
+        overlap = 1.0
+    dx = (wx0 + wx1 - fx0 - fx1) / 2.0
+    dy = (wy0 + wy1 - fy0 - fy1) / 2.0
+    return (-overlap, dx * dx + dy * dy)
+
+
+def resolve_rects(names, rects, index):
+    """Resuelve los campos de una plantilla compilada (nombres + rectángulos) contra un WordIndex."""
+    result = {}
+    for field, rect in zip(names, rects):
+        candidates = index.query(*rect)
+        if not candidates:
+            result[field] = ""
+            continue
+        best = min(candidates, key=lambda i: _rank_key(index.boxes[i], rect))
+        result[field] = index.words[best].get("text", "")
+    return result
+
+
+def resolve_fields(fields, index):
+    """Resuelve todos los campos de una plantilla contra un WordIndex ya construido."""
+    compiled = CompiledTemplate.from_template({"fields": fields})
+    return resolve_rects(compiled.names, compiled.rects, index)
+
+
+def load_templates(template_dir=TEMPLATE_DIR):
+    """Carga todas las plantillas `{nif}.json` del directorio en un dict {nif: plantilla}."""
+    templates = {}
+    for path in sorted(Path(template_dir).glob("*.json")):
+        with open(path, encoding="utf-8") as fh:
+            template = json.load(fh)
+        templates[template.get("nif") or path.stem] = template
+    return templates
+
+
+class TemplateEngine:
+    """Plantillas compiladas indexadas por NIF, listas para aplicarse a muchos documentos.
+
+    `templates` es un dict {nif: plantilla JSON} (se compila al crear el motor)
+    o un TemplateCache, que carga los `.tpl` bajo demanda y recarga los regenerados.
+    """
+
+    def __init__(self, templates, matcher=None):
+        if isinstance(templates, dict):
+            templates = {nif: CompiledTemplate.from_template(t) for nif, t in templates.items()}
+        self.templates = templates
+        self.matcher = matcher
+
+    @classmethod
+    def from_dir(cls, template_dir=TEMPLATE_DIR, match=True):
+        return cls(TemplateCache(template_dir), LayoutIndex.load(template_dir) if match else None)
+
+    def template_for(self, ocr, nif=None):
+        key = nif or ocr.get("nif") or ocr.get("template_id")
+        return key, self.templates.get(key)
+
+    def match(self, ocr, k=5):
+        """Top-k plantillas por huella de maquetación (sin usar el NIF del documento como clave)."""
+        return self.matcher.top_k(ocr, k) if self.matcher else []
+
+    def apply(self, ocr, nif=None):
+        key, template = self.template_for(ocr, nif)
+        matched = None
+        # el NIF suele ser justo el campo que el OCR ha leído mal: se busca por maquetación
+        if template is None and not nif and self.matcher:
+            hits = self.matcher.top_k(ocr, 1)
+            if hits and hits[0]["score"] >= MIN_MATCH_SCORE:
+                matched = hits[0]
+                template = self.templates.get(matched["nif"])
+        if template is None:
+            return {"nif": key, "error": "template not found"}
+        index = WordIndex(ocr.get("words", []))
+        result = {"nif": key, "fields": resolve_rects(template.names, template.rects, index)}
+        if matched:
+            result.update(nif=matched["nif"], ocr_nif=key, match_score=matched["score"])
+        return result
+
 
 def apply_template(template_path, ocr_path):
     with open(template_path) as fh:
@@ -7,21 +185,115 @@ def apply_template(template_path, ocr_path):
     with open(ocr_path) as fh:
         ocr = json.load(fh)
 
-    words = ocr.get("words", [])
-    result = {}
+    index = WordIndex(ocr.get("words", []))
+    return resolve_fields(template.get("fields", {}), index)
+
+
+def iter_sources(source):
+    """Tareas (nombre, kind, dato) de un directorio de OCR JSON o de un JSONL ('-' = stdin)."""
+    if source != "-" and Path(source).is_dir():
+        for path in sorted(Path(source).glob("*.json")):
+            yield (path.name, "path", str(path))
+        return
+    fh = sys.stdin if source == "-" else open(source, encoding="utf-8")
+    try:
+        for n, line in enumerate(fh, start=1):
+            if line.strip():
+                yield (f"{source}:{n}", "line", line)
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+_ENGINE = None
+_FORCED_NIF = None
+
+
+def _init_worker(template_dir, nif):
+    global _ENGINE, _FORCED_NIF
+    _ENGINE = TemplateEngine.from_dir(template_dir)
+    _FORCED_NIF = nif
+
+
+def _run_chunk(chunk):
+    out = []
+    for name, kind, data in chunk:
+        try:
+            if kind == "path":
+                with open(data, encoding="utf-8") as fh:
+                    ocr = json.load(fh)
+            else:
+                ocr = json.loads(data)
+            record = {"source": name, **_ENGINE.apply(ocr, _FORCED_NIF)}
+        except Exception as e:
+            record = {"source": name, "error": str(e)}
+        out.append(json.dumps(record, ensure_ascii=False))
+    return out
+
+
+def _bounded_map(pool, fn, iterable, window):
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def run_batch(source, out, template_dir=TEMPLATE_DIR, workers=None, nif=None, chunk_size=64):
+    """Aplica las plantillas a todos los documentos de `source` y escribe JSONL en `out`.
+
+    Las plantillas se cargan una vez por proceso; como mucho hay `workers * 4`
+    bloques en vuelo, así que la memoria no crece con el tamaño de la entrada.
+    """
+    workers = workers or os.cpu_count() or 1
+    if not nif:
+        # actualiza el índice de huellas una vez aquí para que los workers solo lo lean
+        LayoutIndex.load(template_dir)
+    chunks = chunked(iter_sources(source), chunk_size)
+    if workers == 1:
+        _init_worker(template_dir, nif)
+        return _write_lines(map(_run_chunk, chunks), out)
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(template_dir, nif)) as pool:
+        return _write_lines(_bounded_map(pool, _run_chunk, chunks, workers * 4), out)
+
+
+def _write_lines(results, out):
+    written = 0
+    for lines in results:
+        for line in lines:
+            out.write(line + "\n")
+        written += len(lines)
+    return written
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Aplica plantillas de proveedor a documentos OCR.")
+    ap.add_argument("template", nargs="?", help="plantilla JSON (modo de un solo documento)")
+    ap.add_argument("ocr", nargs="?", help="OCR JSON (modo de un solo documento)")
+    ap.add_argument("--batch", metavar="SRC", help="directorio de OCR JSON o fichero JSONL ('-' = stdin)")
+    ap.add_argument("--out", default="-", help="salida JSONL del modo batch ('-' = stdout)")
+    ap.add_argument("--templates", default=TEMPLATE_DIR, help="directorio de plantillas {nif}.json")
+    ap.add_argument("--workers", type=int, default=None, help="procesos (por defecto, núcleos)")
+    ap.add_argument("--nif", help="usar esta plantilla para todos los documentos")
+    args = ap.parse_args(argv)
 
-    for field, coords in template.get("fields", {}).items():
-        x, y, w, h = coords.get("x",0), coords.get("y",0), coords.get("w",0), coords.get("h",0)
-        candidates = [
-            w for w in words
-            if x <= w.get("x",0) <= x+w and y <= w.get("y",0) <= y+h
-        ]
-        result[field] = candidates[0].get("text") if candidates else ""
+    if args.batch:
+        out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+        try:
+            n = run_batch(args.batch, out, args.templates, args.workers, args.nif)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(f"Procesados {n} documentos", file=sys.stderr)
+        return 0
+    if not (args.template and args.ocr):
+        ap.print_usage()
+        return 2
+    print(json.dumps(apply_template(args.template, args.ocr), indent=2))
+    return 0
 
-    print(json.dumps(result, indent=2))
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: apply_template.py <template.json> <ocr.json>")
-        sys.exit(2)
-    apply_template(sys.argv[1], sys.argv[2])
+    sys.exit(main())
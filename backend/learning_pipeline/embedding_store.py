@@ -0,0 +1,298 @@
+"""
+Caché de embeddings de descripciones de producto con búsqueda coseno vectorizada.
+
+Cada descripción conocida (`productos[].descripcion` de las correcciones) se
+embebe una sola vez: la clave es un hash del texto normalizado y los vectores
+se guardan, normalizados, en una matriz float32 en disco que se abre con
+`np.memmap` (abrir el almacén no deserializa nada). Cada embedder tiene su
+propio subdirectorio de `EMB_DIR` (`EMB_DIR/<id del embedder>/`), así que cambiar
+de embedder no toca la caché de otro. Ficheros de cada subdirectorio:
+
+    vectors.f32   filas × dim float32
+    keys.bin      16 bytes (blake2b) por fila
+    texts.jsonl   {"descripcion": ...} por fila; texts.idx = offset int64 de cada línea
+    meta.json     embedder, dim, filas confirmadas y progreso sobre las correcciones
+
+`meta.json` se reescribe (atómicamente) después de fsync de los datos; los
+lectores solo ven las filas confirmadas y lo que haya detrás (un corte a
+medias) lo descarta la siguiente escritura. Solo `--full` vacía la caché.
+
+El embedder es enchufable (`EMBEDDER=modulo:fabrica` o `--embedder`); por
+defecto se usa `HashingEmbedder`, que funciona sin red ni GPU: trigramas de
+caracteres y palabras con hashing de signo y norma L2.
+Se eligió hashing y no TF-IDF porque los pesos IDF cambiarían con cada
+corrección nueva y obligarían a re-embeber toda la caché.
+
+Usage: run from project root:
+    python3 backend/learning_pipeline/embedding_store.py --update [--full]
+    python3 backend/learning_pipeline/embedding_store.py --query "yogur natural" [--top 5]
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import re
+import sys
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_loader import iter_correction_paths, iter_corrections  # noqa: E402
+from scripts.corrections_store import SEGMENTS_SUBDIR, iter_segment_records  # noqa: E402
+from backend.learning_pipeline.product_catalog import normalize_description, trigrams  # noqa: E402
+
+CORRECTIONS_DIR = "artifacts_device/persisted_corrections"
+EMB_DIR = "backend/embeddings"
+DEFAULT_DIM = 256
+KEY_BYTES = 16
+EMBED_BATCH = 1024
+SEARCH_BLOCK = 65536  # filas por bloque del producto matriz-vector
+
+
+class HashingEmbedder:
+    """Embedding sin modelo: hashing de trigramas y palabras, normalizado L2."""
+
+    def __init__(self, dim=DEFAULT_DIM):
+        self.dim = dim
+        self.id = f"hashing-v1:{dim}"
+
+    def __call__(self, texts):
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            norm = normalize_description(text)
+            # crc32: estable entre procesos (al contrario que hash())
+            feats = [zlib.crc32(g.encode("utf-8")) for g in trigrams(norm)]
+            feats += [zlib.crc32(b"w:" + w.encode("utf-8")) for w in norm.split()]
+            rows.extend([row] * len(feats))
+            hashes.extend(feats)
+        h = np.asarray(hashes, dtype=np.int64)
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        # hashing con signo: el bit alto decide +1/-1 para que las colisiones se compensen
+        np.add.at(out, (np.asarray(rows, dtype=np.int64), h % self.dim),
+                  np.where(h & 0x80000000, 1.0, -1.0).astype(np.float32))
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        np.divide(out, norms, out=out, where=norms > 0)
+        return out
+
+
+def load_embedder(spec=None):
+    """`hashing[:dim]` (por defecto) o `modulo:fabrica`, que devuelve un objeto con `id`, `dim` y `__call__(textos)`."""
+    spec = spec or os.environ.get("EMBEDDER", "hashing")
+    if spec == "hashing" or spec.startswith("hashing:"):
+        return HashingEmbedder(int(spec.split(":", 1)[1]) if ":" in spec else DEFAULT_DIM)
+    module, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module), attr)()
+
+
+def embedder_dir(embedder_id):
+    """Nombre de subdirectorio para un id de embedder (legible y sin colisiones)."""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", embedder_id).strip("._") or "embedder"
+    return f"{slug}-{hashlib.blake2b(embedder_id.encode('utf-8'), digest_size=4).hexdigest()}"
+
+
+def content_key(text):
+    return hashlib.blake2b(normalize_description(text).encode("utf-8"), digest_size=KEY_BYTES).digest()
+
+
+class EmbeddingStore:
+    """Matriz de embeddings en disco, abierta con memmap."""
+
+    def __init__(self, root=EMB_DIR, embedder=None):
+        self.embedder = embedder or load_embedder()
+        self.root = Path(root) / embedder_dir(self.embedder.id)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.meta_path = self.root / "meta.json"
+        self.paths = {name: self.root / name for name in ("vectors.f32", "keys.bin", "texts.jsonl", "texts.idx")}
+        self.meta = self._load_meta()
+        self._keys = None
+        self._open()
+
+    def _load_meta(self):
+        try:
+            with open(self.meta_path, encoding="utf-8") as fh:
+                meta = json.load(fh)
+        except (OSError, ValueError):
+            meta = None
+        if not meta:
+            return {"embedder": self.embedder.id, "dim": self.embedder.dim, "rows": 0,
+                    "texts_bytes": 0, "since": None, "segments": {}}
+        if meta.get("embedder") != self.embedder.id or meta.get("dim") != self.embedder.dim:
+            raise ValueError(f"{self.root} es de {meta.get('embedder')}, no de {self.embedder.id}")
+        return meta
+
+    def _discard_uncommitted(self):
+        # antes de escribir: trunca lo añadido después de la última confirmación
+        rows = self.meta["rows"]
+        sizes = {"vectors.f32": rows * self.meta["dim"] * 4, "keys.bin": rows * KEY_BYTES,
+                 "texts.jsonl": self.meta["texts_bytes"], "texts.idx": rows * 8}
+        for name, size in sizes.items():
+            with open(self.paths[name], "ab") as fh:
+                if fh.tell() != size:
+                    fh.truncate(size)
+
+    def _open(self):
+        rows, dim = self.meta["rows"], self.meta["dim"]
+        if rows:
+            self.vectors = np.memmap(self.paths["vectors.f32"], dtype=np.float32, mode="r", shape=(rows, dim))
+            self.offsets = np.memmap(self.paths["texts.idx"], dtype=np.int64, mode="r", shape=(rows,))
+        else:
+            self.vectors = np.zeros((0, dim), dtype=np.float32)
+            self.offsets = np.zeros(0, dtype=np.int64)
+        self._keys = None
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    def _keyset(self):
+        if self._keys is None and not self.meta["rows"]:
+            self._keys = set()
+        elif self._keys is None:
+            with open(self.paths["keys.bin"], "rb") as fh:
+                raw = fh.read(self.meta["rows"] * KEY_BYTES)
+            self._keys = {raw[i:i + KEY_BYTES] for i in range(0, len(raw), KEY_BYTES)}
+        return self._keys
+
+    def _save_meta(self):
+        tmp = self.meta_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(self.meta, fh)
+        os.replace(tmp, self.meta_path)
+
+    def add(self, texts):
+        """Embebe y guarda las descripciones que aún no están; devuelve cuántas se añadieron."""
+        known = self._keyset()
+        new = {}
+        for text in texts:
+            if not text or not normalize_description(text):
+                continue
+            key = content_key(text)
+            if key not in known and key not in new:
+                new[key] = str(text).strip()
+        if not new:
+            return 0
+        keys, items = list(new), list(new.values())
+        self._discard_uncommitted()
+        fhs = {name: open(path, "ab") for name, path in self.paths.items()}
+        try:
+            pos = self.meta["texts_bytes"]
+            for i in range(0, len(items), EMBED_BATCH):
+                batch = items[i:i + EMBED_BATCH]
+                vecs = np.ascontiguousarray(self.embedder(batch), dtype=np.float32)
+                fhs["vectors.f32"].write(vecs.tobytes())
+                fhs["keys.bin"].write(b"".join(keys[i:i + EMBED_BATCH]))
+                lines = [json.dumps({"descripcion": t}, ensure_ascii=False).encode("utf-8") + b"\n" for t in batch]
+                offs = np.cumsum([pos] + [len(line) for line in lines[:-1]], dtype=np.int64)
+                fhs["texts.idx"].write(offs.tobytes())
+                fhs["texts.jsonl"].write(b"".join(lines))
+                pos += sum(len(line) for line in lines)
+            for fh in fhs.values():
+                fh.flush()
+                os.fsync(fh.fileno())
+        finally:
+            for fh in fhs.values():
+                fh.close()
+        self.meta["rows"] += len(items)
+        self.meta["texts_bytes"] = pos
+        self._save_meta()
+        known.update(keys)
+        self._open()
+        self._keys = known
+        return len(items)
+
+    def text(self, row):
+        with open(self.paths["texts.jsonl"], "rb") as fh:
+            fh.seek(int(self.offsets[row]))
+            return json.loads(fh.readline())["descripcion"]
+
+    def search_many(self, queries, k=5):
+        """Top-k por similitud coseno para cada consulta: [[{"descripcion", "score"}]]."""
+        if not len(self) or not queries:
+            return [[] for _ in queries]
+        q = np.ascontiguousarray(self.embedder(list(queries)), dtype=np.float32)
+        k = min(k, len(self))
+        best_s = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_i = np.zeros((len(queries), 0), dtype=np.int64)
+        # por bloques: la memoria no depende del tamaño de la matriz
+        for start in range(0, len(self), SEARCH_BLOCK):
+            sims = q @ self.vectors[start:start + SEARCH_BLOCK].T
+            kk = min(k, sims.shape[1])
+            top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+            best_s = np.concatenate([best_s, np.take_along_axis(sims, top, axis=1)], axis=1)
+            best_i = np.concatenate([best_i, top + start], axis=1)
+            keep = np.argsort(-best_s, axis=1)[:, :k]
+            best_s = np.take_along_axis(best_s, keep, axis=1)
+            best_i = np.take_along_axis(best_i, keep, axis=1)
+        return [[{"descripcion": self.text(int(i)), "score": round(float(s), 4)} for s, i in zip(srow, irow)]
+                for srow, irow in zip(best_s, best_i)]
+
+    def search(self, query, k=5):
+        return self.search_many([query], k)[0]
+
+    def reset(self):
+        for path in self.paths.values():
+            if path.exists():
+                path.unlink()
+        self.meta = {"embedder": self.embedder.id, "dim": self.embedder.dim, "rows": 0,
+                     "texts_bytes": 0, "since": None, "segments": {}}
+        self._save_meta()
+        self._open()
+
+    def update_from_corrections(self, source=CORRECTIONS_DIR, full=False, workers=0):
+        """Añade las descripciones de las correcciones nuevas desde la última actualización.
+
+        Los ficheros sueltos se filtran por mtime >= la marca de agua: los del
+        mismo tick que el último visto se releen (add descarta por hash los
+        textos ya embebidos) en vez de perder los escritos en ese tick.
+        """
+        if full:
+            self.reset()
+        since, offsets = self.meta.get("since"), dict(self.meta.get("segments", {}))
+        texts, newest = [], since
+        paths = iter_correction_paths(source, since=since, inclusive=True)
+        for path, correction in iter_corrections(paths, workers=workers):
+            texts.extend(_descriptions(correction))
+            mtime = os.stat(path).st_mtime
+            newest = mtime if newest is None else max(newest, mtime)
+        for _, correction, seg, end in iter_segment_records(os.path.join(str(source), SEGMENTS_SUBDIR), offsets):
+            if correction is not None:
+                texts.extend(_descriptions(correction))
+            offsets[seg] = end
+        added = self.add(texts)
+        self.meta["since"], self.meta["segments"] = newest, offsets
+        self._save_meta()
+        return added
+
+
+def _descriptions(correction):
+    prods = correction.get("productos")
+    if not isinstance(prods, list):
+        return []
+    return [p.get("descripcion") for p in prods if isinstance(p, dict) and p.get("descripcion")]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Caché de embeddings de descripciones de producto.")
+    ap.add_argument("--root", default=EMB_DIR)
+    ap.add_argument("--embedder", default=None, help="hashing[:dim] o modulo:fabrica (por defecto $EMBEDDER)")
+    ap.add_argument("--update", action="store_true", help="añadir las descripciones de correcciones nuevas")
+    ap.add_argument("--full", action="store_true", help="con --update, vaciar y re-embeber todo (solo la caché de este embedder)")
+    ap.add_argument("--query", action="append", default=[], help="descripción a buscar (repetible)")
+    ap.add_argument("--top", type=int, default=5)
+    args = ap.parse_args(argv)
+    store = EmbeddingStore(args.root, load_embedder(args.embedder))
+    if args.update:
+        added = store.update_from_corrections(full=args.full, workers=os.cpu_count() or 1)
+        print(f"Añadidas {added} descripciones; total {len(store)}")
+    for query, hits in zip(args.query, store.search_many(args.query, args.top)):
+        print(json.dumps({"query": query, "matches": hits}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
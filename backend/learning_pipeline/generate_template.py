@@ -1,51 +1,357 @@
+import argparse
+import io
 import json
 import os
-from statistics import mean
+import random
+import shutil
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_loader import LoadStats, iter_correction_paths, iter_corrections  # noqa: E402
+from scripts.corrections_store import SEGMENTS_SUBDIR, iter_segment_records  # noqa: E402
+from backend.learning_pipeline.aggregate import COORD_KEYS, METHODS, aggregate_boxes, confidence  # noqa: E402
+from backend.learning_pipeline.room_db import (DEVICE_TEMPLATE_DIR, device_key, find_databases,  # noqa: E402
+                                               iter_samples, sample_to_correction)
+from backend.learning_pipeline.template_publish import KEEP_VERSIONS, TemplatePublisher, atomic_write  # noqa: E402
 
 CORRECTIONS_DIR = "artifacts_device/persisted_corrections"
 TEMPLATE_DIR = "backend/templates"
+# Estado incremental: offsets, parámetros y marca de agua de las correcciones ya consumidas;
+# las muestras de cada NIF van aparte en samples/{nif}.npz (píxeles, de las correcciones)
+# y device_samples/{nif}.npz (relativas 0..1, de las bases Room): no se mezclan unidades
+STATE_DIR = os.path.join(TEMPLATE_DIR, "_state")
+AGGREGATES_PATH = os.path.join(STATE_DIR, "aggregates.json")
+SAMPLES_DIR = os.path.join(STATE_DIR, "samples")
+DEVICE_SAMPLES_DIR = os.path.join(STATE_DIR, "device_samples")
+# v5: los ficheros sueltos se siguen con una marca de agua (mtime, nombres en ese
+# mtime) en aggregates.json en lugar del registro consumed.txt con todos los nombres
+# v6: las muestras de los dispositivos se agregan aparte (antes iban con las de píxeles)
+STATE_VERSION = 6
+# decimales de las coordenadas: conserva subpíxel y coordenadas relativas 0..1
+PRECISION = 4
+# muestras conservadas por campo (muestreo de reserva): más no mejoran la caja agregada
+# y acotan lo que cuesta cargar, agregar y reescribir un NIF
+SAMPLES_MAX = 500
+_RESERVOIR = random.Random(0)
+
+class SampleStore:
+    """Muestras por NIF (`{"proveedor", "fields": {campo: [[x, y, w, h], ...]}, "seen": {campo: n}}`)
+    cargadas bajo demanda.
+
+    Cada NIF es un `samples/{nif}.npz` (nombres de campo, muestras vistas por
+    campo, índice de campo por muestra y array (N, 4) con NaN donde falta la
+    coordenada). `setdefault` marca
+    el NIF como modificado; `stage(gen)` escribe los modificados como
+    `{nif}.npz.{gen}` antes de confirmar el estado global y `commit(gen)` los
+    renombra después. Al abrir, los pendientes de la generación confirmada se
+    renombran y los de una ejecución interrumpida se borran: muestras y offsets
+    avanzan juntos.
+    """
+
+    def __init__(self, root=SAMPLES_DIR, generation=0):
+        self.root = root
+        self.generation = generation
+        self.dirty = set()
+        self._loaded = {}
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                final, sep, gen = name.rpartition(".npz.")
+                if not sep:
+                    continue
+                path = os.path.join(root, name)
+                if gen == str(generation):
+                    os.replace(path, os.path.join(root, final + ".npz"))
+                else:
+                    os.remove(path)
+
+    def _path(self, nif):
+        return os.path.join(self.root, f"{nif}.npz")
+
+    def __iter__(self):
+        on_disk = set()
+        if os.path.isdir(self.root):
+            on_disk = {name[:-4] for name in os.listdir(self.root) if name.endswith(".npz")}
+        return iter(on_disk | set(self._loaded))
+
+    def __getitem__(self, nif):
+        if nif not in self._loaded:
+            self._loaded[nif] = self._read(nif)
+        return self._loaded[nif]
+
+    def setdefault(self, nif, default):
+        self.dirty.add(nif)
+        provider = self[nif]
+        if provider is None:
+            provider = self._loaded[nif] = default
+        return provider
+
+    def _read(self, nif):
+        try:
+            data = np.load(self._path(nif), allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        with data:
+            names = data["names"].tolist()
+            ids, coords = data["ids"], data["coords"]
+            # NaN -> None, como las muestras que añade accumulate
+            rows = [[None if v != v else v for v in row] for row in coords.tolist()]
+            fields = {name: [] for name in names}
+            for i, row in zip(ids.tolist(), rows):
+                fields[names[i]].append(row)
+            return {"proveedor": str(data["proveedor"]), "fields": fields,
+                    "seen": dict(zip(names, data["seen"].tolist()))}
+
+    def stage(self, generation):
+        """Escribe los NIF modificados como pendientes de la generación `generation`."""
+        os.makedirs(self.root, exist_ok=True)
+        for nif in self.dirty:
+            provider = self._loaded[nif]
+            names, _, ids, coords = pack_samples(provider)
+            buf = io.BytesIO()
+            seen = np.array([provider["seen"][n] for n in names], dtype=np.int64)
+            np.savez(buf, names=np.array(names, dtype=str), seen=seen, ids=ids, coords=coords,
+                     proveedor=np.array(provider["proveedor"], dtype=str))
+            atomic_write(self._path(nif) + f".{generation}", buf.getvalue())
+
+    def commit(self, generation):
+        for nif in self.dirty:
+            os.replace(self._path(nif) + f".{generation}", self._path(nif))
+        self.generation = generation
+        self.dirty.clear()
 
-def load_corrections():
-    files = [f for f in os.listdir(CORRECTIONS_DIR) if f.endswith(".json")]
-    data = []
-    for f in files:
-        with open(os.path.join(CORRECTIONS_DIR, f)) as fh:
-            data.append(json.load(fh))
-    return data
-
-def build_templates():
-    corrections = load_corrections()
-    grouped = {}
-
-    for c in corrections:
-        key = c.get("nif")
-        if not key:
+def load_state():
+    """Devuelve (muestras por NIF en píxeles, muestras por NIF de los dispositivos, marca de agua de los ficheros sueltos, offsets por segmento,
+    parámetros de agregación, marcas de agua [createdAt, id] por dispositivo Room).
+
+    La marca de agua de los ficheros es {"mtime", "names", "retry"}: el mayor mtime
+    consumido, los nombres consumidos con ese mismo mtime y los que fallaron (pueden
+    estar a medio escribir y se reintentan).
+    """
+    if not os.path.exists(AGGREGATES_PATH):
+        return SampleStore(), SampleStore(DEVICE_SAMPLES_DIR), {}, {}, {}, {}
+    with open(AGGREGATES_PATH) as fh:
+        state = json.load(fh)
+    if state.get("version") != STATE_VERSION:
+        # estado de una versión anterior: se reconstruye desde cero
+        reset_state()
+        return SampleStore(), SampleStore(DEVICE_SAMPLES_DIR), {}, {}, {}, {}
+    generation = state.get("generation", 0)
+    return (SampleStore(generation=generation), SampleStore(DEVICE_SAMPLES_DIR, generation), state.get("files", {}),
+            state.get("segments", {}), state.get("params", {}), state.get("devices", {}))
+
+def save_state(aggregates, device_aggregates, files, segment_offsets, params=None, devices=None):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    generation = aggregates.generation + 1
+    aggregates.stage(generation)
+    device_aggregates.stage(generation)
+    tmp = AGGREGATES_PATH + ".tmp"
+    with open(tmp, "w") as fh:
+        json.dump({"version": STATE_VERSION, "generation": generation, "files": files,
+                   "segments": segment_offsets, "params": params or {}, "devices": devices or {}},
+                  fh, separators=(",", ":"))
+    os.replace(tmp, AGGREGATES_PATH)
+    aggregates.commit(generation)
+    device_aggregates.commit(generation)
+
+def reset_state():
+    # consumed.txt: registro de nombres del estado v4
+    for path in (AGGREGATES_PATH, os.path.join(STATE_DIR, "consumed.txt")):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(SAMPLES_DIR, ignore_errors=True)
+    shutil.rmtree(DEVICE_SAMPLES_DIR, ignore_errors=True)
+
+def _coord(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+def accumulate(aggregates, correction):
+    """Añade las cajas de una corrección a las muestras de su NIF; devuelve el NIF o None.
+
+    Por campo se conservan como mucho `SAMPLES_MAX` muestras, una muestra
+    uniforme de todas las vistas (algoritmo R).
+    """
+    nif = correction.get("nif")
+    if not nif:
+        return None
+    # el NIF da nombre a los ficheros de estado y de plantilla
+    nif = str(nif)
+    provider = aggregates.setdefault(nif, {"proveedor": "", "fields": {}, "seen": {}})
+    if correction.get("proveedor"):
+        provider["proveedor"] = str(correction["proveedor"]).strip()
+    fields = provider["fields"]
+    for f in correction.get("fields", []):
+        name = f.get("field")
+        coords = f.get("coords", {})
+        # una muestra [x, y, w, h] por corrección; None si falta la coordenada
+        sample = [_coord(coords.get(k)) for k in COORD_KEYS]
+        if any(v is not None for v in sample):
+            samples = fields.setdefault(name, [])
+            seen = provider["seen"].get(name, 0)
+            if len(samples) < SAMPLES_MAX:
+                samples.append(sample)
+            else:
+                j = _RESERVOIR.randrange(seen + 1)
+                if j < SAMPLES_MAX:
+                    samples[j] = sample
+            provider["seen"][name] = seen + 1
+    return nif
+
+def pack_samples(provider):
+    """(campos, muestras por campo, índice de campo, array (N, 4)) de las muestras de un NIF; None -> NaN."""
+    fields = provider["fields"]
+    names = list(fields)
+    counts = [len(fields[n]) for n in names]
+    ids = np.repeat(np.arange(len(names)), counts)
+    coords = np.array([s for n in names for s in fields[n]], dtype=np.float64).reshape(-1, len(COORD_KEYS))
+    return names, counts, ids, coords
+
+def render_template(nif, provider, method="robust", trim=0.1, k=3.0):
+    """Plantilla con la caja agregada de cada campo y su calidad (dispersión, confianza)."""
+    # todas las muestras del NIF en un único array (N, 4)
+    names, counts, ids, coords = pack_samples(provider)
+    center, spread, samples, used = aggregate_boxes(ids, coords, len(names), method, trim, k)
+    conf = confidence(center, spread, samples, used)
+
+    template = {"nif": nif, "proveedor": provider["proveedor"], "aggregation": method,
+                "fields": {}, "quality": {}}
+    for i, name in enumerate(names):
+        # sin valores para una coordenada, 0 como hasta ahora
+        template["fields"][name] = {
+            key: round(float(center[i, c]), PRECISION) if samples[i, c] else 0
+            for c, key in enumerate(COORD_KEYS)}
+        template["quality"][name] = {
+            # todas las vistas; `used` cuenta sobre las conservadas (como mucho SAMPLES_MAX)
+            "samples": provider["seen"][name],
+            # muestras que entran en todas las coordenadas presentes
+            "used": int(used[i][samples[i] > 0].min(initial=counts[i])),
+            "spread": {key: round(float(spread[i, c]), PRECISION) if samples[i, c] else 0
+                       for c, key in enumerate(COORD_KEYS)},
+            "confidence": round(float(conf[i]), 3),
+        }
+    return template
+
+def new_correction_files(files):
+    """Rutas de los ficheros sueltos no consumidos según la marca de agua `files` y su mtime.
+
+    Solo se hace stat de lo listado; no se carga ningún registro de lo ya consumido.
+    Un fichero reescrito después de consumirse (mtime nuevo) se vuelve a contar.
+    """
+    since, seen = files.get("mtime"), set(files.get("names", ()))
+    new = {}
+    for path in iter_correction_paths(CORRECTIONS_DIR, since=since, sort=False, inclusive=True):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
             continue
-        grouped.setdefault(key, []).append(c)
+        if mtime != since or os.path.basename(path) not in seen:
+            new[path] = mtime
+    for name in files.get("retry", ()):
+        path = os.path.join(CORRECTIONS_DIR, name)
+        if path not in new:
+            try:
+                new[path] = os.stat(path).st_mtime
+            except OSError:
+                pass  # ya no existe: no hay nada que reintentar
+    return new
+
+def advance_watermark(files, read, failed):
+    """Marca de agua tras consumir `read` ({ruta: mtime}); `failed` se reintentará."""
+    mtime, names = files.get("mtime"), set(files.get("names", ()))
+    for path, t in read.items():
+        if mtime is None or t > mtime:
+            mtime, names = t, set()
+        if t == mtime:
+            names.add(os.path.basename(path))
+    return {"mtime": mtime, "names": sorted(names), "retry": sorted(os.path.basename(p) for p in failed)}
 
-    os.makedirs(TEMPLATE_DIR, exist_ok=True)
-    for nif, items in grouped.items():
-        template = {"nif": nif, "fields": {}}
+def build_templates(full=False, workers=0, method="robust", trim=0.1, k=3.0, keep=KEEP_VERSIONS, room_dbs=()):
+    if full:
+        reset_state()
+    aggregates, device_aggregates, files, segment_offsets, last_params, devices = load_state()
+    params = {"method": method, "trim": trim, "k": k}
+    new_files = new_correction_files(files)
 
-        for item in items:
-            for f in item.get("fields", []):
-                name = f.get("field")
-                coords = f.get("coords", {})
-                template["fields"].setdefault(name, {"x": [], "y": [], "w": [], "h": []})
-                for k in ["x", "y", "w", "h"]:
-                    if k in coords:
-                        template["fields"][name][k].append(coords[k])
+    changed = set()
+    device_changed = set()
+    read = {}
+    stats = LoadStats()
+    for path, correction in iter_corrections(sorted(new_files), workers=workers, stats=stats):
+        nif = accumulate(aggregates, correction)
+        if nif:
+            changed.add(nif)
+        read[path] = new_files[path]
+    # las omitidas no se marcan como consumidas: pueden estar a medio escribir
+    for path, error in stats.failed:
+        print(f"⚠️  Corrección omitida {os.path.basename(path)}: {error}")
+    files = advance_watermark(files, read, set(new_files) - set(read))
+    # segmentos append-only: basta con leer desde el último offset consumido
+    seg_dir = os.path.join(CORRECTIONS_DIR, SEGMENTS_SUBDIR)
+    n_records = 0
+    for loc, correction, seg, end in iter_segment_records(seg_dir, segment_offsets):
+        if correction is None:
+            print(f"⚠️  Registro omitido {loc}: JSON inválido")
+        else:
+            nif = accumulate(aggregates, correction)
+            if nif:
+                changed.add(nif)
+            n_records += 1
+        segment_offsets[seg] = end
+    # bases Room de los dispositivos: solo las muestras posteriores a la marca de agua de cada uno.
+    # Sus cajas son relativas (0..1) y no traen el tamaño de página: se agregan aparte y se
+    # publican en DEVICE_TEMPLATE_DIR, de donde las exporta room_db.py
+    n_samples = 0
+    for db in find_databases(room_dbs):
+        key = device_key(db)
+        try:
+            for created, sample_id, nif, mappings in iter_samples(db, devices.get(key)):
+                nif = accumulate(device_aggregates, sample_to_correction(nif, mappings))
+                if nif:
+                    device_changed.add(nif)
+                n_samples += 1
+                devices[key] = [created, sample_id]
+        except sqlite3.Error as e:
+            # lo ya leído cuenta: la marca de agua llega hasta la última muestra acumulada
+            print(f"⚠️  Base omitida {db}: {e}")
 
-        # Promediar coordenadas
-        for name, vals in template["fields"].items():
-            # If there are no values for a coordinate, default to 0
-            template["fields"][name] = {k: int(mean(v)) if v else 0 for k, v in vals.items()}
+    if params != last_params:
+        # otra agregación: hay que regenerar también las plantillas sin cambios
+        changed.update(aggregates)
+        device_changed.update(device_aggregates)
+    # publicación atómica y versionada: los lectores (workers de gunicorn) nunca ven una plantilla a medias
+    for template_dir, store, nifs in ((TEMPLATE_DIR, aggregates, changed),
+                                      (DEVICE_TEMPLATE_DIR, device_aggregates, device_changed)):
+        if not nifs:
+            continue
+        os.makedirs(template_dir, exist_ok=True)
+        with TemplatePublisher(template_dir, keep) as publisher:
+            for nif in sorted(nifs):
+                version = publisher.publish(nif, render_template(nif, store[nif], method, trim, k))
+                print(f"✅ Plantilla generada: {os.path.join(template_dir, f'{nif}.json')} (v{version})")
 
-        out = os.path.join(TEMPLATE_DIR, f"{nif}.json")
-        with open(out, "w") as fh:
-            json.dump(template, fh, indent=2)
+    save_state(aggregates, device_aggregates, files, segment_offsets, params, devices)
+    print(f"Correcciones nuevas: {len(read) + n_records + n_samples}, "
+          f"plantillas actualizadas: {len(changed) + len(device_changed)}")
 
-        print(f"✅ Plantilla generada: {out}")
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera backend/templates/{nif}.json a partir de las correcciones.")
+    ap.add_argument("--full", action="store_true", help="descartar el estado incremental y rehacer todo")
+    ap.add_argument("--method", choices=METHODS, default="robust", help="agregación de coordenadas")
+    ap.add_argument("--trim", type=float, default=0.1, help="fracción recortada por extremo (trimmed)")
+    ap.add_argument("--k", type=float, default=3.0, help="umbral en MAD para descartar atípicos (robust)")
+    ap.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="versiones anteriores a conservar por NIF")
+    ap.add_argument("--room-db", action="append", default=[], metavar="PATH",
+                    help="base Room de un dispositivo o directorio con <dispositivo>/albacontrol.db (repetible)")
+    args = ap.parse_args(argv)
+    build_templates(full=args.full, workers=os.cpu_count() or 1, method=args.method, trim=args.trim, k=args.k,
+                    keep=args.keep, room_dbs=args.room_db)
+    return 0
 
 if __name__ == "__main__":
-    build_templates()
+    raise SystemExit(main())
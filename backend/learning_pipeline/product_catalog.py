@@ -0,0 +1,229 @@
+"""
+Catálogo de productos por proveedor (NIF) a partir de las correcciones persistidas.
+
+Cada `productos[].descripcion` corregida por el usuario se agrupa por su forma
+normalizada (minúsculas, sin acentos ni signos); la forma canónica es la
+escritura más frecuente. Para normalizar descripciones leídas por OCR se usa
+un índice invertido de trigramas de caracteres (CSR en NumPy) con filtrado
+por prefijo: los candidatos salen solo de las listas de los trigramas menos
+frecuentes de la consulta (las suficientes para no perder ninguna entrada que
+pueda superar `min_score`, hasta POSTING_BUDGET entradas recorridas; pasado
+ese presupuesto se sacrifica exhaustividad por latencia). La similitud es el
+coeficiente de Dice sobre trigramas, calculado solo para los MAX_CANDIDATES
+candidatos que más trigramas raros comparten. Nada de comparar la consulta
+con cada entrada del catálogo.
+
+Usage: run from project root:
+    python3 backend/learning_pipeline/product_catalog.py --build
+    python3 backend/learning_pipeline/product_catalog.py --nif B12345678 "YOGUR NATRAL 125G" ...
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_loader import iter_corrections  # noqa: E402
+
+CORRECTIONS_DIR = "artifacts_device/persisted_corrections"
+CATALOG_DIR = "backend/catalogs"
+MIN_SCORE = 0.5
+# listas de trigramas recorridas por consulta (ver ProductCatalog._candidates)
+POSTING_BUDGET = 4096
+MIN_PROBE = 3
+MAX_CANDIDATES = 256
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_description(text):
+    """'Yogur  NATURAL-125g ' -> 'yogur natural 125g'."""
+    s = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode("ascii")
+    return _NON_ALNUM.sub(" ", s.lower()).strip()
+
+
+def trigrams(norm):
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductCatalog:
+    """Productos conocidos de un proveedor con índice de trigramas."""
+
+    def __init__(self, products):
+        self.products = products
+        self._vocab = {}
+        entry_grams, sizes = [], []
+        for p in products:
+            grams = trigrams(normalize_description(p["descripcion"]))
+            entry_grams.extend(self._vocab.setdefault(g, len(self._vocab)) for g in grams)
+            sizes.append(len(grams))
+        flat = np.asarray(entry_grams, dtype=np.int64)
+        self._sizes = np.asarray(sizes, dtype=np.int64)
+        vocab_size = len(self._vocab)
+        # por entrada: sus trigramas en una fila, rellena con `vocab_size` (nunca en la consulta)
+        width = int(self._sizes.max()) if len(products) else 0
+        self._grams = np.full((len(products), width), vocab_size, dtype=np.int32)
+        rows = np.repeat(np.arange(len(products)), self._sizes)
+        cols = np.arange(len(flat)) - np.repeat(np.cumsum(self._sizes) - self._sizes, self._sizes)
+        self._grams[rows, cols] = flat
+        # por trigrama: las entradas que lo contienen en indices[indptr[t]:indptr[t+1]]
+        order = np.argsort(flat, kind="stable")
+        self._indices = rows.astype(np.int32)[order]
+        self._df = np.bincount(flat, minlength=vocab_size)
+        self._indptr = np.zeros(vocab_size + 1, dtype=np.int64)
+        np.cumsum(self._df, out=self._indptr[1:])
+
+    def __len__(self):
+        return len(self.products)
+
+    @classmethod
+    def load(cls, nif, catalog_dir=CATALOG_DIR):
+        path = Path(catalog_dir) / f"{nif}.json"
+        if not path.exists():
+            return cls([])
+        with open(path, encoding="utf-8") as fh:
+            return cls(json.load(fh).get("products", []))
+
+    def _candidates(self, n_query, ids, min_score):
+        # Dice >= s exige |e| >= s|q|/(2-s) e intersección >= s(|q|+|e|)/2; cualquier
+        # entrada así comparte al menos un trigrama con los |q|-I_min+1 más raros
+        e_min = min_score * n_query / (2 - min_score)
+        i_min = max(1, int(np.ceil(min_score * (n_query + e_min) / 2 - 1e-9)))
+        absent = n_query - len(ids)
+        prefix = n_query - i_min + 1 - absent
+        if prefix <= 0:
+            return np.empty(0, dtype=np.int32)
+        ids = ids[np.argsort(self._df[ids], kind="stable")][:prefix]
+        # presupuesto: se añaden trigramas (del más raro al más común) mientras quepan
+        # POSTING_BUDGET entradas; siempre al menos MIN_PROBE
+        budget = np.cumsum(self._df[ids]) <= POSTING_BUDGET
+        budget[:MIN_PROBE] = True
+        ids = ids[budget]
+        # sin arrays del tamaño del catálogo: el coste depende solo de lo recorrido
+        cand, hits = np.unique(np.concatenate([self._indices[self._indptr[t]:self._indptr[t + 1]] for t in ids]),
+                               return_counts=True)
+        if len(cand) > MAX_CANDIDATES:
+            # solo las que más trigramas raros comparten pasan al cálculo exacto
+            cand = cand[np.argpartition(-hits, MAX_CANDIDATES)[:MAX_CANDIDATES]]
+        return cand
+
+    def lookup(self, text, k=1, min_score=MIN_SCORE):
+        """Las `k` entradas más parecidas a `text`: [{**producto, "score"}]."""
+        grams = trigrams(normalize_description(text))
+        ids = np.fromiter((self._vocab[g] for g in grams if g in self._vocab), dtype=np.int64)
+        if not len(ids) or not self.products:
+            return []
+        cand = self._candidates(len(grams), ids, min_score)
+        if not len(cand):
+            return []
+        # intersección exacta solo para los candidatos: sus trigramas contra la máscara de la consulta
+        qmask = np.zeros(len(self._vocab) + 1, dtype=bool)
+        qmask[ids] = True
+        inter = qmask[self._grams[cand]].sum(axis=1)
+        scores = 2.0 * inter / (len(grams) + self._sizes[cand])
+        keep = scores >= min_score
+        cand, scores = cand[keep], scores[keep]
+        if len(cand) > k:
+            top = np.argpartition(-scores, k)[:k]
+            cand, scores = cand[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [{**self.products[int(cand[i])], "score": round(float(scores[i]), 4)} for i in order]
+
+    def match(self, descriptions, k=1, min_score=MIN_SCORE):
+        """Lote: una lista de candidatos por descripción, en el mismo orden."""
+        return [self.lookup(d, k, min_score) for d in descriptions]
+
+    def normalize_lines(self, productos, min_score=MIN_SCORE):
+        """Copia de `productos` con `descripcion_canonica` y `match_score` (None si no hay match)."""
+        hits = self.match([p.get("descripcion", "") for p in productos], 1, min_score)
+        out = []
+        for p, h in zip(productos, hits):
+            best = h[0] if h else None
+            out.append({**p, "descripcion_canonica": best["descripcion"] if best else None,
+                        "match_score": best["score"] if best else None})
+        return out
+
+
+class CatalogStore:
+    """Catálogos cargados bajo demanda y cacheados por NIF."""
+
+    def __init__(self, catalog_dir=CATALOG_DIR):
+        self.catalog_dir = catalog_dir
+        self._cache = {}
+
+    def for_nif(self, nif):
+        if nif not in self._cache:
+            self._cache[nif] = ProductCatalog.load(nif, self.catalog_dir)
+        return self._cache[nif]
+
+    def normalize_lines(self, nif, productos, min_score=MIN_SCORE):
+        return self.for_nif(nif).normalize_lines(productos, min_score)
+
+
+def build_catalogs(source=CORRECTIONS_DIR, catalog_dir=CATALOG_DIR, workers=0):
+    """Reconstruye `{catalog_dir}/{nif}.json` con los productos de todas las correcciones."""
+    forms = defaultdict(lambda: defaultdict(Counter))   # nif -> norma -> {escritura: n}
+    prices = defaultdict(dict)                          # nif -> norma -> último precio
+    for _, correction in iter_corrections(source, workers=workers):
+        nif = correction.get("nif")
+        prods = correction.get("productos")
+        if not nif or not isinstance(prods, list):
+            continue
+        for p in prods:
+            desc = p.get("descripcion") if isinstance(p, dict) else None
+            norm = normalize_description(desc) if desc else ""
+            if not norm:
+                continue
+            forms[nif][norm][str(desc).strip()] += 1
+            if p.get("precio_unitario") is not None:
+                prices[nif][norm] = p["precio_unitario"]
+
+    os.makedirs(catalog_dir, exist_ok=True)
+    for nif, by_norm in forms.items():
+        products = [{"descripcion": written.most_common(1)[0][0], "count": sum(written.values()),
+                     "precio_unitario": prices[nif].get(norm)}
+                    for norm, written in by_norm.items()]
+        products.sort(key=lambda p: -p["count"])
+        tmp = os.path.join(catalog_dir, f"{nif}.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({"nif": nif, "products": products}, fh, ensure_ascii=False, indent=1)
+        os.replace(tmp, os.path.join(catalog_dir, f"{nif}.json"))
+    return {nif: len(by_norm) for nif, by_norm in forms.items()}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Catálogo de productos por NIF y normalización de descripciones OCR.")
+    ap.add_argument("--build", action="store_true", help="reconstruir los catálogos desde las correcciones")
+    ap.add_argument("--catalogs", default=CATALOG_DIR)
+    ap.add_argument("--nif", help="catálogo contra el que normalizar")
+    ap.add_argument("--top", type=int, default=1)
+    ap.add_argument("--min-score", type=float, default=MIN_SCORE)
+    ap.add_argument("descriptions", nargs="*", help="descripciones OCR (por defecto, una por línea en stdin)")
+    args = ap.parse_args(argv)
+    if args.build:
+        built = build_catalogs(catalog_dir=args.catalogs, workers=os.cpu_count() or 1)
+        for nif, n in sorted(built.items()):
+            print(f"✅ Catálogo {nif}: {n} productos")
+        return 0
+    if not args.nif:
+        ap.print_usage()
+        return 2
+    catalog = ProductCatalog.load(args.nif, args.catalogs)
+    descriptions = args.descriptions or [line.rstrip("\n") for line in sys.stdin if line.strip()]
+    for desc, hits in zip(descriptions, catalog.match(descriptions, args.top, args.min_score)):
+        print(json.dumps({"descripcion": desc, "matches": hits}, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Intercambio con las bases Room de los dispositivos (`albacontrol.db`).
+
+Importación: `iter_samples` abre una copia de la base en solo lectura y recorre
+`template_samples` en orden de (createdAt, id) a partir de la marca de agua del
+dispositivo, leyendo bloques de CHUNK filas; `sample_to_correction` convierte
+cada muestra al formato de corrección que consume `generate_template.accumulate`,
+así que las muestras entran directamente en la agregación
+(`generate_template.py --room-db`) sin escribir un JSON por muestra. Las cajas
+de los dispositivos son relativas a la página (0..1) y no traen su tamaño, así
+que se agregan aparte de las correcciones (en píxeles) y se publican en
+DEVICE_TEMPLATE_DIR.
+
+Exportación: `export_templates` escribe las plantillas de DEVICE_TEMPLATE_DIR como filas de
+`ocr_templates` (`mappings` = "campo::x,y,w,h;;…", el formato de `Converters` en
+Models.kt) en una base SQLite o en JSONL, para sincronizar los dispositivos. Solo
+se exportan plantillas con coordenadas relativas; las que no lo son se omiten.
+
+Usage: run from project root:
+    python3 backend/learning_pipeline/generate_template.py --room-db snapshots/   # cada <dispositivo>/albacontrol.db
+    python3 backend/learning_pipeline/room_db.py --export ocr_templates.db [--templates backend/templates/device]
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+DB_NAME = "albacontrol.db"
+CHUNK = 5000
+TEMPLATE_DIR = "backend/templates"
+# plantillas agregadas solo con muestras de los dispositivos (coordenadas relativas)
+DEVICE_TEMPLATE_DIR = os.path.join(TEMPLATE_DIR, "device")
+
+_SAMPLES_SQL = ("SELECT createdAt, id, providerNif, field_mappings FROM template_samples "
+                "WHERE createdAt > ? OR (createdAt = ? AND id > ?) ORDER BY createdAt, id")
+_EXPORT_SCHEMA = """
+CREATE TABLE `ocr_templates` (`id` INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, `providerNif` TEXT NOT NULL,
+    `mappings` TEXT NOT NULL, `version` INTEGER NOT NULL, `active` INTEGER NOT NULL,
+    `createdFromSampleIds` TEXT, `fieldConfidence` TEXT);
+"""
+
+
+def decode_map(value):
+    """Converters.toMap: "k::v;;k::v" -> dict."""
+    if not value:
+        return {}
+    out = {}
+    for item in value.split(";;"):
+        key, _, val = item.partition("::")
+        out[key] = val
+    return out
+
+
+def encode_map(mapping):
+    """Converters.fromMap: dict -> "k::v;;k::v"."""
+    return ";;".join(f"{k}::{v}" for k, v in mapping.items())
+
+
+def parse_bbox(value):
+    """"x,y,w,h" -> [x, y, w, h] o None si no son cuatro números."""
+    try:
+        box = [float(p) for p in value.split(",")]
+    except ValueError:
+        return None
+    return box if len(box) == 4 else None
+
+
+def provider_key(nif):
+    """normalizeProviderKey de la app: solo letras y dígitos, en minúsculas."""
+    return re.sub(r"[\W_]", "", nif or "").lower()
+
+
+def device_key(path):
+    """Identificador del dispositivo: la carpeta si la base se llama DB_NAME, si no el nombre del fichero."""
+    path = Path(path)
+    return path.parent.name if path.name == DB_NAME else path.stem
+
+
+def find_databases(paths):
+    """Bases a importar: ficheros tal cual y, dentro de los directorios, cada DB_NAME."""
+    found = []
+    for p in map(Path, paths):
+        found.extend(sorted(p.rglob(DB_NAME)) if p.is_dir() else [p])
+    return found
+
+
+def open_readonly(path):
+    # mode=ro: nunca se escribe en la copia del dispositivo (sí se leen los cambios aún en el WAL)
+    return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+
+
+def iter_samples(path, watermark=None, chunk=CHUNK):
+    """Genera (createdAt, id, providerNif, field_mappings) posteriores a la marca (createdAt, id)."""
+    created, sample_id = watermark or (0, 0)
+    conn = open_readonly(path)
+    try:
+        cur = conn.execute(_SAMPLES_SQL, (created, created, sample_id))
+        while True:
+            rows = cur.fetchmany(chunk)
+            if not rows:
+                break
+            for created, sample_id, nif, mappings in rows:
+                yield created, sample_id, nif, decode_map(mappings)
+    finally:
+        conn.close()
+
+
+def sample_to_correction(nif, mappings):
+    """Muestra del dispositivo (campo -> "x,y,w,h::texto") como corrección para `accumulate`."""
+    fields, proveedor = [], ""
+    for name, value in mappings.items():
+        bbox, _, text = value.partition("::")
+        if name == "proveedor":
+            proveedor = text
+        box = parse_bbox(bbox)
+        # las líneas de producto ("::texto") no llevan caja
+        if box is not None:
+            fields.append({"field": name, "coords": dict(zip(("x", "y", "w", "h"), box))})
+    return {"nif": provider_key(nif).upper(), "proveedor": proveedor, "fields": fields}
+
+
+def template_rows(template_dir=DEVICE_TEMPLATE_DIR):
+    """Filas de `ocr_templates` de las plantillas publicadas; devuelve (filas, omitidas)."""
+    rows, skipped = [], []
+    for path in sorted(Path(template_dir).glob("*.json")):
+        try:
+            tpl = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            skipped.append(path.name)
+            continue
+        fields = tpl.get("fields") or {} if isinstance(tpl, dict) else {}
+        boxes = {name: [f.get(k, 0) for k in ("x", "y", "w", "h")] for name, f in fields.items()}
+        if not boxes or any(not 0 <= v <= 1 for box in boxes.values() for v in box):
+            # sin campos o en píxeles: el dispositivo espera cajas relativas
+            skipped.append(path.name)
+            continue
+        mappings = {name: ",".join(f"{v:.6f}" for v in box) for name, box in boxes.items()}
+        conf = {name: str(q.get("confidence", "")) for name, q in (tpl.get("quality") or {}).items()}
+        rows.append({"providerNif": provider_key(tpl.get("nif") or path.stem), "mappings": encode_map(mappings),
+                     "version": int(tpl.get("version", 1)), "active": 1, "createdFromSampleIds": None,
+                     "fieldConfidence": encode_map(conf) or None})
+    return rows, skipped
+
+
+def export_templates(out, template_dir=DEVICE_TEMPLATE_DIR):
+    """Escribe las plantillas en `out` (.jsonl o base SQLite con `ocr_templates`) con tmp + rename."""
+    rows, skipped = template_rows(template_dir)
+    out = Path(out)
+    tmp = out.with_name(f".{out.name}.tmp")
+    if tmp.exists():
+        tmp.unlink()
+    if out.suffix == ".jsonl":
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(r, ensure_ascii=False) + "\n" for r in rows)
+    else:
+        conn = sqlite3.connect(tmp)
+        try:
+            with conn:
+                conn.executescript(_EXPORT_SCHEMA)
+                conn.executemany("INSERT INTO ocr_templates (providerNif, mappings, version, active, "
+                                 "createdFromSampleIds, fieldConfidence) VALUES (:providerNif, :mappings, "
+                                 ":version, :active, :createdFromSampleIds, :fieldConfidence)", rows)
+        finally:
+            conn.close()
+    os.replace(tmp, out)
+    return len(rows), skipped
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Exporta las plantillas del backend al formato ocr_templates de Room.")
+    ap.add_argument("--export", required=True, help="fichero de salida (.jsonl o base SQLite)")
+    ap.add_argument("--templates", default=DEVICE_TEMPLATE_DIR, help="directorio de plantillas")
+    args = ap.parse_args(argv)
+    n, skipped = export_templates(args.export, args.templates)
+    for name in skipped[:20]:
+        print(f"⚠️  Plantilla omitida {name}: sin campos o en píxeles", file=sys.stderr)
+    print(f"{n} plantillas exportadas a {args.export} ({len(skipped)} omitidas)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
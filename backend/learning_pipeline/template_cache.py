@@ -0,0 +1,263 @@
+"""
+Plantillas compiladas y caché LRU con recarga en caliente.
+
+`build_templates` escribe, junto a cada `{nif}.json`, un `{nif}.tpl` binario con
+lo que necesita el camino por documento ya precalculado: el rectángulo
+(x0, y0, x1, y1) de cada campo en float64 y los nombres de campo. Las
+coordenadas se guardan en las unidades de la plantilla (píxeles o relativas
+0..1, la plantilla no lleva el tamaño de página): solo se ordenan las
+esquinas (anchos/altos negativos) y las que faltan o no son numéricas valen 0.
+Formato (little-endian):
+
+    cabecera   MAGIC, FORMAT_VERSION (u16), nº de campos (u16), bytes de cabecera JSON (u32)
+    rects      nº de campos × 4 float64
+    JSON       {"nif", "proveedor", "names", "version"}
+
+`TemplateCache` carga las plantillas bajo demanda, guarda como mucho
+`max_size` (LRU) y, como mucho cada `check_interval` segundos por plantilla,
+compara mtime/tamaño del fichero: si se ha regenerado, la vuelve a cargar sin
+reiniciar el servicio. Sin `.tpl` (o de otra versión) se compila el JSON en memoria.
+
+Usage: run from project root:
+    python3 backend/learning_pipeline/template_cache.py --compile [--templates backend/templates]
+"""
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+TEMPLATE_DIR = "backend/templates"
+MAGIC = b"ACTP"
+FORMAT_VERSION = 1
+COMPILED_SUFFIX = ".tpl"
+CACHE_SIZE = 256
+# manifest de publicación (lo escribe template_publish.TemplatePublisher)
+VERSIONS_SUBDIR = "_versions"
+MANIFEST_NAME = "manifest.json"
+CHECK_INTERVAL = 1.0  # segundos entre comprobaciones de mtime de una misma plantilla
+
+_HEADER = struct.Struct("<4sHHI")
+_RECT = struct.Struct("<4d")
+
+
+def _num(v):
+    return float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else 0.0
+
+
+def field_rect(coords):
+    """{x, y, w, h} -> (x0, y0, x1, y1) con x0 <= x1 e y0 <= y1, en las mismas unidades (sin escalar)."""
+    x, y = _num(coords.get("x")), _num(coords.get("y"))
+    x1, y1 = x + _num(coords.get("w")), y + _num(coords.get("h"))
+    return (min(x, x1), min(y, y1), max(x, x1), max(y, y1))
+
+
+class CompiledTemplate:
+    """Campos de una plantilla como nombres + rectángulos listos para consultar."""
+
+    __slots__ = ("nif", "proveedor", "names", "rects", "version")
+
+    def __init__(self, nif, proveedor, names, rects, version=0):
+        self.nif = nif
+        self.proveedor = proveedor
+        self.names = names
+        self.rects = rects
+        self.version = version
+
+    @classmethod
+    def from_template(cls, template):
+        """Compila una plantilla JSON; los rectángulos conservan sus unidades (ver `field_rect`)."""
+        fields = template.get("fields", {})
+        return cls(template.get("nif"), template.get("proveedor", ""), list(fields),
+                   [field_rect(c if isinstance(c, dict) else {}) for c in fields.values()],
+                   template.get("version", 0))
+
+    def to_bytes(self):
+        head = json.dumps({"nif": self.nif, "proveedor": self.proveedor, "names": self.names,
+                           "version": self.version},
+                          ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return b"".join([_HEADER.pack(MAGIC, FORMAT_VERSION, len(self.names), len(head)),
+                         *(_RECT.pack(*r) for r in self.rects), head])
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, n, head_len = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"plantilla compilada no soportada ({magic!r} v{version})")
+        start = _HEADER.size + n * _RECT.size
+        rects = list(_RECT.iter_unpack(data[_HEADER.size:start]))
+        head = json.loads(data[start:start + head_len])
+        return cls(head["nif"], head["proveedor"], head["names"], rects, head.get("version", 0))
+
+
+def write_compiled(template, json_path):
+    """Escribe `{nif}.tpl` junto a `json_path` (atómico: tmp + replace)."""
+    json_path = Path(json_path)
+    out = json_path.with_name(json_path.name[:-len(".json")] + COMPILED_SUFFIX)
+    tmp = out.with_name(out.name + ".tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(CompiledTemplate.from_template(template).to_bytes())
+    os.replace(tmp, out)
+    return out
+
+
+def manifest_path(template_dir=TEMPLATE_DIR):
+    return Path(template_dir) / VERSIONS_SUBDIR / MANIFEST_NAME
+
+
+def read_manifest(template_dir=TEMPLATE_DIR):
+    try:
+        with open(manifest_path(template_dir), encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {"generation": 0, "templates": {}}
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def _paths(template_dir, nif):
+    base = os.path.join(template_dir, nif)
+    return base + COMPILED_SUFFIX, base + ".json"
+
+
+def _signature(template_dir, nif):
+    return tuple(_stat(p) for p in _paths(template_dir, nif))
+
+
+def load_compiled(template_dir, nif):
+    """CompiledTemplate de `nif` (None si no existe) y la firma de sus ficheros."""
+    compiled, source = _paths(template_dir, nif)
+    # la firma se toma antes de leer: si cambia entremedias, la siguiente comprobación recarga
+    sig = _signature(template_dir, nif)
+    if sig[0]:
+        try:
+            with open(compiled, "rb") as fh:
+                return CompiledTemplate.from_bytes(fh.read()), sig
+        except (OSError, ValueError, struct.error):
+            pass
+    if sig[1]:
+        try:
+            with open(source, encoding="utf-8") as fh:
+                return CompiledTemplate.from_template(json.load(fh)), sig
+        except (OSError, ValueError):
+            pass
+    return None, sig
+
+
+class TemplateCache:
+    """Plantillas compiladas por NIF en un LRU acotado, recargadas al cambiar en disco.
+
+    Con manifest de publicación (ver template_publish) basta un stat del manifest
+    por intervalo para saber qué NIF tienen versión nueva; sin él, se compara
+    mtime/tamaño de cada plantilla.
+    """
+
+    def __init__(self, template_dir=TEMPLATE_DIR, max_size=CACHE_SIZE, check_interval=CHECK_INTERVAL):
+        self.template_dir = template_dir
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._entries = OrderedDict()  # nif -> (plantilla, firma, última comprobación)
+        self._lock = threading.Lock()
+        self._manifest_sig = None
+        self._manifest_checked = -math.inf
+        self._versions = None
+        self.hits = self.misses = self.reloads = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _published(self, now):
+        """{nif: versión} del manifest, o None si no hay; se relee solo si cambia su mtime."""
+        if now - self._manifest_checked >= self.check_interval:
+            self._manifest_checked = now
+            sig = _stat(manifest_path(self.template_dir))
+            if sig != self._manifest_sig:
+                self._manifest_sig = sig
+                entries = read_manifest(self.template_dir)["templates"] if sig else None
+                self._versions = {n: e.get("version", 0) for n, e in entries.items()} if entries else None
+        return self._versions
+
+    def _fresh(self, nif, entry, now, versions):
+        template, sig, checked = entry
+        if now - checked < self.check_interval:
+            return True
+        listed = versions.get(nif) if versions else None
+        if listed is not None:
+            fresh = template is not None and template.version >= listed
+        else:
+            fresh = _signature(self.template_dir, nif) == sig
+        if fresh:
+            self._entries[nif] = (template, sig, now)
+        return fresh
+
+    def get(self, nif, default=None):
+        if not nif:
+            return default
+        # el NIF puede llegar como número desde el JSON del OCR
+        nif = str(nif)
+        if "/" in nif or "\\" in nif:
+            return default
+        now = time.monotonic()
+        with self._lock:
+            versions = self._published(now)
+            entry = self._entries.get(nif)
+            if entry is not None:
+                if self._fresh(nif, entry, now, versions):
+                    self._entries.move_to_end(nif)
+                    self.hits += 1
+                    return entry[0] if entry[0] is not None else default
+                self.reloads += 1
+            else:
+                self.misses += 1
+        # lectura fuera del lock; los NIF desconocidos también se cachean (None)
+        template, sig = load_compiled(self.template_dir, nif)
+        with self._lock:
+            self._entries[nif] = (template, sig, now)
+            self._entries.move_to_end(nif)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return template if template is not None else default
+
+    def invalidate(self, nif=None):
+        with self._lock:
+            if nif is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(nif, None)
+
+
+def compile_dir(template_dir=TEMPLATE_DIR):
+    """Genera los `.tpl` de todas las plantillas JSON del directorio (p. ej. tras actualizar)."""
+    n = 0
+    for path in sorted(Path(template_dir).glob("*.json")):
+        with open(path, encoding="utf-8") as fh:
+            write_compiled(json.load(fh), path)
+        n += 1
+    return n
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compila las plantillas JSON a formato binario.")
+    ap.add_argument("--compile", action="store_true", help="compilar todas las plantillas del directorio")
+    ap.add_argument("--templates", default=TEMPLATE_DIR)
+    args = ap.parse_args(argv)
+    if not args.compile:
+        ap.print_usage()
+        return 2
+    print(f"✅ Plantillas compiladas: {compile_dir(args.templates)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
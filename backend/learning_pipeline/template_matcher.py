@@ -0,0 +1,216 @@
+"""
+Identificación de la plantilla de proveedor de una página OCR sin conocer el NIF.
+
+Cada plantilla se resume en una huella de maquetación:
+ - anclas: palabras del nombre del proveedor, `anchors` explícitos de la
+   plantilla y trigramas posicionales del NIF (toleran que el OCR haya fallado
+   algún carácter);
+ - geometría: celdas de una rejilla donde caen los centros de sus cajas de campo
+   (rejilla relativa si la plantilla está en 0..1, en píxeles si no).
+
+Un índice invertido ancla -> plantillas, con pesos IDF, puntúa el documento
+contra todas las plantillas a la vez y solo los CANDIDATES mejores se
+re-puntúan con la geometría. Las anclas presentes en más de MAX_POSTING
+plantillas no distinguen nada y no se indexan, así que el coste por documento
+no crece con el número de proveedores. Solo si ninguna ancla coincide se
+recurre al índice de celdas.
+
+Las huellas se persisten en `{templates}/_index/layout_index.json` junto al
+mtime/tamaño de cada plantilla; al cargar solo se recalculan las cambiadas.
+
+Usage: run from project root:
+    python3 backend/learning_pipeline/template_matcher.py <ocr.json> [--top 5] [--templates DIR]
+"""
+import argparse
+import heapq
+import json
+import math
+import os
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+TEMPLATE_DIR = "backend/templates"
+INDEX_SUBDIR = "_index"
+INDEX_NAME = "layout_index.json"
+INDEX_VERSION = 1
+
+GRID = 24          # celdas por lado en coordenadas relativas 0..1
+CELL_PX = 96       # tamaño de celda en plantillas en píxeles
+MAX_POSTING = 512  # df máximo de una característica indexada
+CANDIDATES = 64    # candidatos por anclas que se re-puntúan con la geometría
+W_ANCHOR = 0.7
+W_LAYOUT = 0.3
+
+_TOKEN_RE = re.compile(r"[0-9a-záéíóúüñç]{3,}")
+_NIF_STRIP = re.compile(r"[^A-Za-z0-9]")
+
+
+def tokens(text):
+    return set(_TOKEN_RE.findall(str(text).lower()))
+
+
+def nif_trigrams(nif):
+    # con posición: el OCR suele sustituir caracteres, no insertarlos, y así un
+    # trigrama como "123" no aparece en medio índice
+    s = _NIF_STRIP.sub("", str(nif)).upper()
+    return {f"{i}{s[i:i + 3]}" for i in range(len(s) - 2)}
+
+
+def _looks_like_nif(s):
+    # 8-10 alfanuméricos con al menos 5 dígitos (CIF/NIF/NIE)
+    return 8 <= len(s) <= 10 and sum(c.isdigit() for c in s) >= 5
+
+
+def _is_relative(boxes):
+    return all(x + w <= 1.5 and y + h <= 1.5 for x, y, w, h in boxes)
+
+
+def fingerprint(template, name=""):
+    """Huella {nif, anchors, cells} de una plantilla."""
+    nif = template.get("nif") or Path(name).stem
+    anchors = {"t:" + t for t in tokens(template.get("proveedor", ""))}
+    for a in template.get("anchors", []):
+        anchors |= {"t:" + t for t in tokens(a)}
+    anchors |= {"n:" + g for g in nif_trigrams(nif)}
+    boxes = [(c.get("x", 0), c.get("y", 0), c.get("w", 0), c.get("h", 0))
+             for c in template.get("fields", {}).values()]
+    cells = set()
+    if boxes:
+        rel = _is_relative(boxes)
+        for x, y, w, h in boxes:
+            cx, cy = x + w / 2, y + h / 2
+            cells.add(f"r:{int(cx * GRID)}:{int(cy * GRID)}" if rel
+                      else f"p:{int(cx // CELL_PX)}:{int(cy // CELL_PX)}")
+    return {"nif": nif, "anchors": sorted(anchors), "cells": sorted(cells)}
+
+
+def document_features(ocr):
+    """(anclas, celdas ocupadas) de un documento OCR `{"words": [...], "nif"?}`."""
+    words = ocr.get("words", [])
+    anchors = set()
+    for word in words:
+        text = str(word.get("text", ""))
+        anchors |= {"t:" + t for t in tokens(text)}
+        compact = _NIF_STRIP.sub("", text)
+        if _looks_like_nif(compact):
+            anchors |= {"n:" + g for g in nif_trigrams(compact)}
+    if ocr.get("nif"):
+        anchors |= {"n:" + g for g in nif_trigrams(ocr["nif"])}
+
+    cells = set()
+    if words:
+        page_w = max(w.get("x", 0) + w.get("w", 0) for w in words) or 1
+        page_h = max(w.get("y", 0) + w.get("h", 0) for w in words) or 1
+        for word in words:
+            cx = word.get("x", 0) + word.get("w", 0) / 2
+            cy = word.get("y", 0) + word.get("h", 0) / 2
+            ri, rj = int(cx / page_w * GRID), int(cy / page_h * GRID)
+            pi, pj = int(cx // CELL_PX), int(cy // CELL_PX)
+            # vecindad 3x3: la caja aprendida y la palabra no tienen por qué coincidir de celda
+            for di in (-1, 0, 1):
+                for dj in (-1, 0, 1):
+                    cells.add(f"r:{ri + di}:{rj + dj}")
+                    cells.add(f"p:{pi + di}:{pj + dj}")
+    return anchors, cells
+
+
+class LayoutIndex:
+    """Índice invertido de huellas de plantilla."""
+
+    def __init__(self, prints, max_posting=MAX_POSTING):
+        self.nifs = [p["nif"] for p in prints]
+        postings = defaultdict(list)
+        for t, p in enumerate(prints):
+            for f in p["anchors"]:
+                postings[f].append(t)
+            for f in p["cells"]:
+                postings[f].append(t)
+        n = len(prints)
+        self.postings = {f: ts for f, ts in postings.items() if len(ts) <= max_posting}
+        self.idf = {f: math.log(1 + n / len(ts)) for f, ts in self.postings.items()}
+        # normas sobre lo que realmente está indexado
+        self.anchor_norm = [sum(self.idf.get(f, 0) for f in p["anchors"]) for p in prints]
+        self.cells = [frozenset(p["cells"]) for p in prints]
+
+    def __len__(self):
+        return len(self.nifs)
+
+    @classmethod
+    def load(cls, template_dir=TEMPLATE_DIR, max_posting=MAX_POSTING):
+        """Carga las huellas persistidas, recalcula las de plantillas nuevas o cambiadas y guarda."""
+        template_dir = Path(template_dir)
+        index_path = template_dir / INDEX_SUBDIR / INDEX_NAME
+        try:
+            with open(index_path, encoding="utf-8") as fh:
+                cached = json.load(fh)
+            if cached.get("version") != INDEX_VERSION:
+                cached = {}
+        except (OSError, ValueError):
+            cached = {}
+        old = cached.get("templates", {})
+
+        entries, dirty = {}, False
+        for path in sorted(template_dir.glob("*.json")):
+            st = path.stat()
+            sig = [st.st_mtime_ns, st.st_size]
+            hit = old.get(path.name)
+            if hit and hit["sig"] == sig:
+                entries[path.name] = hit
+                continue
+            with open(path, encoding="utf-8") as fh:
+                entries[path.name] = {"sig": sig, **fingerprint(json.load(fh), path.name)}
+            dirty = True
+        if dirty or len(entries) != len(old):
+            index_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = index_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"version": INDEX_VERSION, "templates": entries}, fh,
+                          ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, index_path)
+        return cls(list(entries.values()), max_posting)
+
+    def top_k(self, ocr, k=5, candidates=CANDIDATES):
+        """Las `k` plantillas más probables: [{"nif", "score", "anchor", "layout"}]."""
+        anchors, cells = document_features(ocr)
+        anchor_score = defaultdict(float)
+        for f in anchors:
+            for t in self.postings.get(f, ()):
+                anchor_score[t] += self.idf[f]
+        if anchor_score:
+            pool = heapq.nlargest(max(k, candidates), anchor_score,
+                                  key=lambda t: anchor_score[t] / self.anchor_norm[t])
+        else:
+            # sin ninguna ancla: plantillas con más celdas ocupadas
+            hits = defaultdict(int)
+            for f in cells:
+                for t in self.postings.get(f, ()):
+                    hits[t] += 1
+            pool = heapq.nlargest(max(k, candidates), hits, key=hits.__getitem__)
+
+        def scored(t):
+            a = anchor_score.get(t, 0.0) / self.anchor_norm[t] if self.anchor_norm[t] else 0.0
+            g = len(self.cells[t] & cells) / len(self.cells[t]) if self.cells[t] else 0.0
+            return (W_ANCHOR * a + W_LAYOUT * g, a, g, t)
+
+        best = heapq.nlargest(k, map(scored, pool))
+        return [{"nif": self.nifs[t], "score": round(s, 4), "anchor": round(a, 4), "layout": round(g, 4)}
+                for s, a, g, t in best]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Plantillas más probables para un documento OCR.")
+    ap.add_argument("ocr", help="OCR JSON")
+    ap.add_argument("--templates", default=TEMPLATE_DIR, help="directorio de plantillas {nif}.json")
+    ap.add_argument("--top", type=int, default=5)
+    args = ap.parse_args(argv)
+    index = LayoutIndex.load(args.templates)
+    with open(args.ocr, encoding="utf-8") as fh:
+        ocr = json.load(fh)
+    print(json.dumps(index.top_k(ocr, args.top), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
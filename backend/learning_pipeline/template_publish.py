@@ -0,0 +1,100 @@
+"""
+Publicación atómica y versionada de plantillas.
+
+Cada publicación de un NIF recibe el siguiente número de versión
+(monótono) y escribe, siempre con fichero temporal + fsync + rename:
+
+    _versions/{nif}/v000007.json / .tpl   copia inmutable de esa versión (se guardan las últimas `keep`)
+    {nif}.json / {nif}.tpl                versión vigente (la que leen apply_template y los workers)
+    _versions/manifest.json               {"generation", "templates": {nif: {"version", "sha256", "published_at"}}}
+
+El manifest se reescribe al final, después de las plantillas: si dice versión
+N, los ficheros vigentes son de la N o posteriores. Los lectores no toman
+ningún lock: un rename nunca deja ver un fichero a medias, y basta con
+consultar el mtime del manifest para saber si algo ha cambiado (ver
+TemplateCache). Solo los publicadores se serializan, con un `flock`.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from backend.learning_pipeline.template_cache import (TEMPLATE_DIR, VERSIONS_SUBDIR, CompiledTemplate,
+                                                      manifest_path, read_manifest)
+
+KEEP_VERSIONS = 5
+
+
+def atomic_write(path, data):
+    """Escribe `data` (bytes) en `path` vía tmp + fsync + rename."""
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+class TemplatePublisher:
+    """Publica plantillas versionadas; usar como `with TemplatePublisher(dir) as pub: pub.publish(...)`."""
+
+    def __init__(self, template_dir=TEMPLATE_DIR, keep=KEEP_VERSIONS):
+        self.template_dir = Path(template_dir)
+        self.versions_dir = self.template_dir / VERSIONS_SUBDIR
+        self.keep = max(1, keep)
+        self._lock_fh = None
+        self.manifest = None
+        self.published = []
+
+    def __enter__(self):
+        self.versions_dir.mkdir(parents=True, exist_ok=True)
+        self._lock_fh = open(self.versions_dir / ".lock", "ab")
+        fcntl.flock(self._lock_fh, fcntl.LOCK_EX)
+        # bajo el lock: otro publicador puede haber avanzado versiones entretanto
+        self.manifest = read_manifest(self.template_dir)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if self.published:
+                self.manifest["generation"] = self.manifest.get("generation", 0) + 1
+                atomic_write(manifest_path(self.template_dir),
+                             json.dumps(self.manifest, indent=1, sort_keys=True).encode("utf-8"))
+        finally:
+            fcntl.flock(self._lock_fh, fcntl.LOCK_UN)
+            self._lock_fh.close()
+            self._lock_fh = None
+
+    def publish(self, nif, template):
+        """Publica `template` como nueva versión de `nif`; devuelve el número de versión."""
+        entries = self.manifest.setdefault("templates", {})
+        version = entries.get(nif, {}).get("version", 0) + 1
+        template = {**template, "version": version}
+        body = json.dumps(template, indent=2).encode("utf-8")
+        compiled = CompiledTemplate.from_template(template).to_bytes()
+
+        nif_dir = self.versions_dir / nif
+        nif_dir.mkdir(exist_ok=True)
+        atomic_write(nif_dir / f"v{version:06d}.json", body)
+        atomic_write(nif_dir / f"v{version:06d}.tpl", compiled)
+        # la vigente: primero el compilado (lo que lee el camino por documento)
+        atomic_write(self.template_dir / f"{nif}.tpl", compiled)
+        atomic_write(self.template_dir / f"{nif}.json", body)
+        self._prune(nif_dir, version)
+
+        entries[nif] = {"version": version, "sha256": hashlib.sha256(body).hexdigest(),
+                        "published_at": int(time.time())}
+        self.published.append((nif, version))
+        return version
+
+    def _prune(self, nif_dir, version):
+        for path in nif_dir.glob("v*.*"):
+            try:
+                v = int(path.stem[1:])
+            except ValueError:
+                continue
+            if v <= version - self.keep:
+                path.unlink(missing_ok=True)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la agregación de coordenadas de `generate_template`.
+
+Compara la media anterior (`statistics.mean` por campo y coordenada sobre
+listas Python) con `aggregate_boxes` (NumPy, todas las muestras de un NIF en
+un array) para cada método. Un `--outliers` de las muestras se desplaza
+lejos de la caja real, y se mide también el error frente a ella.
+
+Con `--archive` mide además `build_templates` incremental: para cada tamaño
+de archivo, una ejecución completa y después otra con `--delta` correcciones
+nuevas (el mismo delta para todos los tamaños), con el tamaño del estado.
+
+Usage: run from project root:
+    python3 benchmarks/bench_aggregate.py [--samples 100000] [--fields 40] [--json out.json]
+    python3 benchmarks/bench_aggregate.py --archive 1000,10000,30000 [--delta 5]
+"""
+import contextlib
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+import benchlib
+from backend.learning_pipeline.aggregate import COORD_KEYS, METHODS, aggregate_boxes
+from benchmarks.synthetic import Workload
+
+
+def synthetic_samples(n, n_fields, outliers, rng):
+    truth = [[rng.uniform(0, 2000), rng.uniform(0, 3000), rng.uniform(80, 400), rng.uniform(20, 80)]
+             for _ in range(n_fields)]
+    ids, coords = [], []
+    for i in range(n):
+        f = i % n_fields
+        box = [v + rng.gauss(0, 2) for v in truth[f]]
+        if rng.random() < outliers:
+            box[0] += rng.choice([-1, 1]) * rng.uniform(300, 1500)
+        ids.append(f)
+        coords.append(box)
+    return truth, ids, coords
+
+
+def legacy_mean(ids, coords, n_fields):
+    # Agregación anterior: listas por campo y statistics.mean por coordenada
+    per_field = [[[] for _ in COORD_KEYS] for _ in range(n_fields)]
+    for f, box in zip(ids, coords):
+        for c, v in enumerate(box):
+            per_field[f][c].append(v)
+    return [[statistics.mean(vals) for vals in cols] for cols in per_field]
+
+
+def run(n, n_fields, outliers, seed=0):
+    rng = random.Random(seed)
+    truth, ids, coords = synthetic_samples(n, n_fields, outliers, rng)
+    truth = np.array(truth)
+    rows = []
+
+    t0 = time.perf_counter()
+    center = np.array(legacy_mean(ids, coords, n_fields))
+    rows.append({"method": "statistics.mean", "ms": round((time.perf_counter() - t0) * 1000, 2),
+                 "max_err_px": round(float(np.abs(center - truth).max()), 2)})
+
+    for method in METHODS:
+        t0 = time.perf_counter()
+        # incluye la conversión desde listas, como en render_template
+        center, _, _, _ = aggregate_boxes(np.array(ids), np.array(coords), n_fields, method)
+        rows.append({"method": method, "ms": round((time.perf_counter() - t0) * 1000, 2),
+                     "max_err_px": round(float(np.abs(center - truth).max()), 2)})
+    return rows
+
+
+def run_incremental(sizes, delta, seed=0):
+    """Tiempo de build_templates completo y con `delta` correcciones nuevas para cada tamaño de archivo."""
+    from backend.learning_pipeline import generate_template
+    w = Workload(seed=seed)
+    rows = []
+    old = os.getcwd()
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="albaagg-") as tmp:
+            # las rutas de generate_template son relativas a la raíz del proyecto
+            os.chdir(tmp)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    w.write_store(generate_template.CORRECTIONS_DIR, size)
+                    t0 = time.perf_counter()
+                    generate_template.build_templates(full=True)
+                    full_ms = (time.perf_counter() - t0) * 1000
+                    w.write_store(generate_template.CORRECTIONS_DIR, delta, start=size)
+                    t0 = time.perf_counter()
+                    generate_template.build_templates()
+                    incremental_ms = (time.perf_counter() - t0) * 1000
+                state = Path(generate_template.STATE_DIR)
+                state_kb = sum(f.stat().st_size for f in state.rglob("*") if f.is_file()) / 1024
+            finally:
+                os.chdir(old)
+        rows.append({"archive": size, "delta": delta, "full_ms": round(full_ms, 2),
+                     "incremental_ms": round(incremental_ms, 2), "state_kb": round(state_kb, 1)})
+    return rows
+
+
+def main():
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--samples", type=int, default=100000)
+    ap.add_argument("--fields", type=int, default=40)
+    ap.add_argument("--outliers", type=float, default=0.05, help="fracción de muestras desplazadas")
+    ap.add_argument("--archive", help="tamaños de archivo para medir build_templates incremental (p. ej. 1000,10000)")
+    ap.add_argument("--delta", type=int, default=5, help="correcciones nuevas de la ejecución incremental")
+    args = ap.parse_args()
+    if args.archive:
+        rows = run_incremental([int(n) for n in args.archive.split(",")], args.delta)
+        print(f"{'archive':>8} {'delta':>6} {'full_ms':>9} {'incr_ms':>9} {'state_kb':>9}")
+        for r in rows:
+            print(f"{r['archive']:>8} {r['delta']:>6} {r['full_ms']:>9.1f} {r['incremental_ms']:>9.1f} "
+                  f"{r['state_kb']:>9.1f}")
+        benchlib.write_json(args.json, rows)
+        return 0
+    rows = run(args.samples, args.fields, args.outliers)
+    print(f"{args.samples} muestras, {args.fields} campos, {args.outliers:.0%} atípicos")
+    print(f"{'method':>16} {'ms':>9} {'max_err_px':>11}")
+    for r in rows:
+        print(f"{r['method']:>16} {r['ms']:>9.1f} {r['max_err_px']:>11.2f}")
+    benchlib.write_json(args.json, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de la API de correcciones: gunicorn síncrono frente al modo ASGI.
+
+Con `--spawn` arranca cada servidor en un directorio temporal propio (almacén
+vacío) con la configuración de despliegue:
+
+    sync   gunicorn scripts.corrections_api:app --workers 2 --threads 4
+    asgi   uvicorn scripts.corrections_asgi:app --workers 2
+
+o mide servidores ya levantados con `--url nombre=http://host:puerto`. Antes de
+medir se siembran `--seed-items` correcciones por `:batch`. Después
+`--concurrency` conexiones keep-alive (cliente HTTP/1.1 mínimo sobre asyncio,
+sin dependencias) lanzan durante `--duration` segundos una mezcla de POST
+/corrections, GET /corrections (listado), GET /corrections/<debug_id> y
+/health (`--mix`). Se informa de peticiones por segundo, p50/p99 por operación
+y errores (5xx o conexión).
+
+Usage: run from project root:
+    python3 benchmarks/bench_api_load.py --spawn [--concurrency 64] [--duration 10] [--json out.json]
+    python3 benchmarks/bench_api_load.py --url sync=http://127.0.0.1:5001 --url asgi=http://127.0.0.1:5002
+"""
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from urllib.parse import urlsplit
+
+import benchlib
+from benchmarks.synthetic import Workload
+
+API_KEY = os.environ.get("CORRECTIONS_API_KEY", "dev-key")
+SERVERS = {
+    "sync": ["gunicorn", "--config", "python:scripts.gunicorn_conf", "--bind", "127.0.0.1:{port}",
+             "scripts.corrections_api:app", "--workers", "2", "--threads", "4", "--timeout", "120"],
+    "asgi": ["uvicorn", "scripts.corrections_asgi:app", "--host", "127.0.0.1", "--port", "{port}", "--workers", "2",
+             "--log-level", "warning"],
+}
+DEFAULT_MIX = "post=4,list=2,get=3,health=1"
+
+
+class Connection:
+    """Conexión HTTP/1.1 keep-alive; entiende Content-Length y chunked."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body=b"", headers=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", f"Content-Length: {len(body)}",
+                f"X-API-Key: {API_KEY}"]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("connection closed")
+        status = int(status_line.split()[1])
+        resp_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            resp_headers[k.strip().lower()] = v.strip()
+        if resp_headers.get("transfer-encoding", "").lower() == "chunked":
+            parts = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                parts.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            data = b"".join(parts)
+        else:
+            data = await self.reader.readexactly(int(resp_headers.get("content-length", 0)))
+        if resp_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def percentile_ms(samples, q):
+    s = sorted(samples)
+    return round(s[min(len(s) - 1, int(q * len(s)))] * 1000, 3) if s else None
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def run_load(url, workload, mix, concurrency, duration, seeded, start_index):
+    """{op: [latencias]}, errores y peticiones completadas contra `url`."""
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    ops, weights = list(mix), list(mix.values())
+    latencies = {op: [] for op in ops}
+    counter = {"next": start_index, "errors": 0}
+    deadline = time.perf_counter() + duration
+
+    async def client(n):
+        rng = random.Random(f"client:{n}")
+        conn = Connection(host, port)
+        while time.perf_counter() < deadline:
+            op = rng.choices(ops, weights)[0]
+            if op == "post":
+                i = counter["next"]
+                counter["next"] += 1
+                args = ("POST", "/api/v1/corrections", json.dumps(workload.correction(i)).encode())
+            elif op == "list":
+                args = ("GET", "/api/v1/corrections?limit=100")
+            elif op == "get":
+                args = ("GET", f"/api/v1/corrections/debug_{rng.randrange(seeded):08d}")
+            else:
+                args = ("GET", "/api/v1/health")
+            t0 = time.perf_counter()
+            try:
+                status, _ = await conn.request(*args)
+            except (OSError, ValueError, asyncio.IncompleteReadError):
+                conn.close()
+                counter["errors"] += 1
+                continue
+            latencies[op].append(time.perf_counter() - t0)
+            if status >= 500:
+                counter["errors"] += 1
+        conn.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return latencies, counter["errors"], time.perf_counter() - t0
+
+
+def seed(url, workload, n, batch=1000):
+    """Siembra `n` correcciones por :batch y espera a que el escritor en segundo plano las indexe."""
+    for s in range(0, n, batch):
+        body = "".join(json.dumps(c) + "\n" for c in workload.corrections(min(batch, n - s), s)).encode()
+        req = urllib.request.Request(f"{url}/api/v1/corrections:batch", data=body, method="POST",
+                                     headers={"X-API-Key": API_KEY})
+        urllib.request.urlopen(req, timeout=60).read()
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        with urllib.request.urlopen(f"{url}/api/v1/health", timeout=10) as resp:
+            if json.load(resp).get("corrections", 0) >= n:
+                return
+        time.sleep(0.2)
+
+
+def spawn(name, port, workdir):
+    cmd = [c.format(port=port) for c in SERVERS[name]]
+    if shutil.which(cmd[0]) is None:
+        return None
+    # como en el Dockerfile: métricas de todos los workers
+    env = dict(os.environ, PYTHONPATH=str(benchlib.PROJECT_ROOT),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, "metrics"))
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{url}/api/v1/health", timeout=1).read()
+            return proc, url
+        except OSError:
+            if proc.poll() is not None:
+                return None
+            time.sleep(0.2)
+    proc.terminate()
+    return None
+
+
+def measure(url, args, workload, mix):
+    seed(url, workload, args.seed_items)
+    latencies, errors, elapsed = asyncio.run(run_load(url, workload, mix, args.concurrency, args.duration,
+                                                      args.seed_items, args.seed_items))
+    total = sum(len(v) for v in latencies.values())
+    r = {"requests": total, "errors": errors, "rps": round(total / elapsed, 1),
+         "p50_ms": percentile_ms([x for v in latencies.values() for x in v], 0.50),
+         "p99_ms": percentile_ms([x for v in latencies.values() for x in v], 0.99)}
+    for op, samples in latencies.items():
+        r[f"{op}_p50_ms"] = percentile_ms(samples, 0.50)
+        r[f"{op}_p99_ms"] = percentile_ms(samples, 0.99)
+    return r
+
+
+def main(argv=None):
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--spawn", action="store_true", help="arranca gunicorn síncrono y uvicorn (ASGI) para medirlos")
+    ap.add_argument("--only", help=f"servidores a arrancar con --spawn ({', '.join(SERVERS)})")
+    ap.add_argument("--url", action="append", default=[], metavar="NOMBRE=URL", help="servidor ya levantado")
+    ap.add_argument("--port", type=int, default=5091, help="primer puerto para --spawn")
+    ap.add_argument("--concurrency", type=int, default=64, help="conexiones simultáneas")
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos de carga por servidor")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help="pesos por operación (post, list, get, health)")
+    ap.add_argument("--seed-items", type=int, default=2000, help="correcciones sembradas antes de medir")
+    args = ap.parse_args(argv)
+    if not args.spawn and not args.url:
+        ap.error("indica --spawn o al menos un --url")
+
+    mix = _parse_mix(args.mix)
+    workload = Workload(seed=0)
+    results = {}
+    for name, _, url in (u.partition("=") for u in args.url):
+        results[name] = measure(url.rstrip("/"), args, workload, mix)
+    if args.spawn:
+        names = args.only.split(",") if args.only else list(SERVERS)
+        for offset, name in enumerate(names):
+            with tempfile.TemporaryDirectory(prefix=f"albaload-{name}-") as tmp:
+                started = spawn(name, args.port + offset, tmp)
+                if started is None:
+                    print(f"{name}: no se pudo arrancar {SERVERS[name][0]} (¿instalado?)", file=sys.stderr)
+                    continue
+                proc, url = started
+                try:
+                    results[name] = measure(url, args, workload, mix)
+                finally:
+                    proc.terminate()
+                    proc.wait(timeout=30)
+
+    for name, r in results.items():
+        for key, value in r.items():
+            print(f"{name + '.' + key:>24} {value}")
+    benchlib.write_json(args.json, {"params": vars(args), "results": results})
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
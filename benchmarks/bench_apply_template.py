@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark de `apply_template`: latencia por documento sobre páginas sintéticas.
+
+Compara el recorrido lineal (campos × palabras) con el índice `WordIndex`
+(construcción + resolución de todos los campos) para 1k..50k palabras.
+
+Usage: run from project root:
+    python3 benchmarks/bench_apply_template.py [--fields 40] [--repeat 5] [--json out.json]
+"""
+import random
+
+import benchlib
+from backend.learning_pipeline.apply_template import WordIndex, _rank_key, resolve_fields, word_box
+from benchmarks.synthetic import PAGE_H, PAGE_W
+
+SIZES = [1000, 5000, 10000, 25000, 50000]
+
+
+def synthetic_words(n, pages, rng):
+    words = []
+    for i in range(n):
+        page = i % pages
+        words.append({
+            "x": rng.uniform(0, PAGE_W - 120),
+            "y": page * PAGE_H + rng.uniform(0, PAGE_H - 30),
+            "w": rng.uniform(20, 120),
+            "h": rng.uniform(15, 30),
+            "text": f"w{i}",
+        })
+    return words
+
+
+def synthetic_fields(n, rng):
+    return {
+        f"field_{i}": {"x": rng.uniform(0, PAGE_W - 400), "y": rng.uniform(0, PAGE_H - 80),
+                       "w": rng.uniform(100, 400), "h": rng.uniform(30, 80)}
+        for i in range(n)
+    }
+
+
+def naive_resolve(fields, words):
+    # Recorrido completo campos × palabras con el mismo ranking que resolve_fields
+    boxes = [word_box(w) for w in words]
+    result = {}
+    for field, c in fields.items():
+        rect = (c["x"], c["y"], c["x"] + c["w"], c["y"] + c["h"])
+        x0, y0, x1, y1 = rect
+        hits = [i for i, (bx0, by0, bx1, by1) in enumerate(boxes)
+                if bx0 <= x1 and bx1 >= x0 and by0 <= y1 and by1 >= y0]
+        result[field] = words[min(hits, key=lambda i: _rank_key(boxes[i], rect))].get("text", "") if hits else ""
+    return result
+
+
+def run(n_fields=40, repeat=5, seed=1234):
+    rng = random.Random(seed)
+    fields = synthetic_fields(n_fields, rng)
+    rows = []
+    for n in SIZES:
+        pages = max(1, n // 5000)
+        words = synthetic_words(n, pages, rng)
+        naive_ms = benchlib.best_ms(lambda: naive_resolve(fields, words), repeat)
+        index_ms = benchlib.best_ms(lambda: resolve_fields(fields, WordIndex(words)), repeat)
+        index = WordIndex(words)
+        resolve_ms = benchlib.best_ms(lambda: resolve_fields(fields, index), repeat)
+        rows.append({
+            "words": n, "pages": pages, "fields": n_fields,
+            "naive_ms": round(naive_ms, 3),
+            "index_total_ms": round(index_ms, 3),
+            "index_resolve_ms": round(resolve_ms, 3),
+        })
+    return rows
+
+
+def main():
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--fields", type=int, default=40)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    rows = run(args.fields, args.repeat)
+    print(f"{'words':>7} {'pages':>5} {'naive ms':>10} {'index ms':>10} {'resolve ms':>11}")
+    for r in rows:
+        print(f"{r['words']:>7} {r['pages']:>5} {r['naive_ms']:>10.2f} "
+              f"{r['index_total_ms']:>10.2f} {r['index_resolve_ms']:>11.2f}")
+    benchlib.write_json(args.json, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
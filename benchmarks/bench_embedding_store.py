@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark de `EmbeddingStore`: alta incremental, apertura por memmap y búsqueda coseno.
+
+Llena un almacén temporal con N descripciones sintéticas (reutiliza el
+generador de bench_product_catalog), vuelve a añadir las mismas (todas en
+caché: no se re-embebe nada), y mide la apertura de un almacén existente y
+la búsqueda top-k de una consulta y de un lote de `--queries`.
+
+Usage: run from project root:
+    python3 benchmarks/bench_embedding_store.py [--rows 50000] [--queries 200] [--json out.json]
+"""
+import random
+import tempfile
+import time
+
+import benchlib
+from backend.learning_pipeline.embedding_store import EmbeddingStore, HashingEmbedder
+from benchmarks.bench_product_catalog import ocr_noise, synthetic_catalog
+
+
+def _ms(t0):
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+def run(n_rows, n_queries, seed=0):
+    rng = random.Random(seed)
+    texts = [p["descripcion"] for p in synthetic_catalog(n_rows, rng)]
+    picks = [rng.randrange(n_rows) for _ in range(n_queries)]
+    queries = [ocr_noise(texts[i], rng) for i in picks]
+    r = {"rows": n_rows, "queries": n_queries}
+    with tempfile.TemporaryDirectory() as root:
+        store = EmbeddingStore(root, HashingEmbedder())
+        t0 = time.perf_counter()
+        store.add(texts)
+        r["embed_add_ms"] = _ms(t0)
+        t0 = time.perf_counter()
+        store.add(texts)
+        r["cached_add_ms"] = _ms(t0)
+
+        t0 = time.perf_counter()
+        store = EmbeddingStore(root, HashingEmbedder())
+        r["open_ms"] = _ms(t0)
+        t0 = time.perf_counter()
+        store.search(queries[0], 5)
+        r["search_one_ms"] = _ms(t0)
+        t0 = time.perf_counter()
+        results = store.search_many(queries, 5)
+        r["search_batch_ms"] = _ms(t0)
+        hits = sum(bool(h) and h[0]["descripcion"] == texts[i] for i, h in zip(picks, results))
+        r["top1"] = round(hits / n_queries, 3)
+    return r
+
+
+def main():
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--rows", type=int, default=50000)
+    ap.add_argument("--queries", type=int, default=200)
+    args = ap.parse_args()
+    r = run(args.rows, args.queries)
+    for key, value in r.items():
+        print(f"{key:>16} {value}")
+    benchlib.write_json(args.json, r)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
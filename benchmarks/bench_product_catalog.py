@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark de `ProductCatalog`: normalizar las líneas de un albarán contra un catálogo grande.
+
+Genera un catálogo sintético de N productos y un albarán de `--lines` líneas
+con errores de OCR (caracteres cambiados, borrados o en mayúsculas). Mide la
+construcción del índice de trigramas, el lote completo y el acierto, y lo
+compara con el recorrido por pares con distancia de edición (estimado a partir
+de `--pairwise` consultas contra una muestra de PAIRWISE_SAMPLE productos).
+
+Usage: run from project root:
+    python3 benchmarks/bench_product_catalog.py [--catalog 50000] [--lines 200] [--json out.json]
+"""
+import random
+import time
+
+import benchlib
+from backend.learning_pipeline.product_catalog import ProductCatalog, normalize_description
+from benchmarks.synthetic import ADJS, NOUNS, UNITS
+
+PAIRWISE_SAMPLE = 2000
+
+
+def synthetic_catalog(n, rng):
+    seen, products = set(), []
+    while len(products) < n:
+        desc = " ".join([rng.choice(NOUNS), rng.choice(ADJS), rng.choice(ADJS), rng.choice(UNITS),
+                         f"ref{rng.randrange(100000)}"])
+        if desc not in seen:
+            seen.add(desc)
+            products.append({"descripcion": desc.upper() if rng.random() < 0.5 else desc.title(), "count": 1})
+    return products
+
+
+def ocr_noise(text, rng, errors=2):
+    chars = list(text.lower())
+    for _ in range(errors):
+        i = rng.randrange(len(chars))
+        if rng.random() < 0.5:
+            chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz0123456789")
+        else:
+            del chars[i]
+    return "".join(chars).upper()
+
+
+def levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def run(n_catalog, n_lines, n_pairwise, seed=0):
+    rng = random.Random(seed)
+    products = synthetic_catalog(n_catalog, rng)
+    picks = [rng.randrange(n_catalog) for _ in range(n_lines)]
+    queries = [ocr_noise(products[i]["descripcion"], rng) for i in picks]
+
+    t0 = time.perf_counter()
+    catalog = ProductCatalog(products)
+    build_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    results = catalog.match(queries)
+    batch_ms = (time.perf_counter() - t0) * 1000
+    hits = sum(bool(r) and r[0]["descripcion"] == products[i]["descripcion"] for i, r in zip(picks, results))
+
+    # por pares: se mide contra una muestra del catálogo y se extrapola
+    norms = [normalize_description(p["descripcion"]) for p in products[:PAIRWISE_SAMPLE]]
+    t0 = time.perf_counter()
+    for q in queries[:n_pairwise]:
+        qn = normalize_description(q)
+        min(norms, key=lambda e: levenshtein(qn, e))
+    pairwise_ms = ((time.perf_counter() - t0) * 1000 / max(1, n_pairwise)
+                   * n_catalog / len(norms) * n_lines)
+    return {"catalog": n_catalog, "lines": n_lines, "build_ms": round(build_ms, 1),
+            "batch_ms": round(batch_ms, 1), "accuracy": round(hits / n_lines, 3),
+            "pairwise_ms_est": round(pairwise_ms, 1)}
+
+
+def main():
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--catalog", type=int, default=50000)
+    ap.add_argument("--lines", type=int, default=200)
+    ap.add_argument("--pairwise", type=int, default=1, help="consultas por pares a medir (se extrapola)")
+    args = ap.parse_args()
+    r = run(args.catalog, args.lines, args.pairwise)
+    for key, value in r.items():
+        print(f"{key:>16} {value}")
+    benchlib.write_json(args.json, r)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
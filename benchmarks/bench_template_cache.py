@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark de `TemplateCache`: coste de obtener la plantilla por documento.
+
+Escribe N plantillas sintéticas (JSON indentado + `.tpl`, como build_templates)
+en un directorio temporal y compara, para `--docs` consultas repartidas entre
+ellas, el parseo del JSON en cada documento frente a la caché LRU (acierto y
+carga en frío del binario). También mide la aplicación completa a un documento.
+
+Usage: run from project root:
+    python3 benchmarks/bench_template_cache.py [--templates 1000] [--docs 5000] [--json out.json]
+"""
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import benchlib
+from backend.learning_pipeline.apply_template import TemplateEngine, WordIndex, resolve_fields
+from backend.learning_pipeline.template_cache import TemplateCache, load_compiled, write_compiled
+from benchmarks.bench_template_matcher import synthetic_document, synthetic_templates
+
+
+def _us(t0, n):
+    return round((time.perf_counter() - t0) * 1e6 / n, 2)
+
+
+def run(n_templates, n_docs, seed=0):
+    rng = random.Random(seed)
+    templates = synthetic_templates(n_templates, rng)
+    nifs = [rng.choice(templates)["nif"] for _ in range(n_docs)]
+    r = {"templates": n_templates, "docs": n_docs}
+    with tempfile.TemporaryDirectory() as root:
+        for t in templates:
+            path = Path(root) / f"{t['nif']}.json"
+            path.write_text(json.dumps(t, indent=2), encoding="utf-8")
+            write_compiled(t, path)
+
+        t0 = time.perf_counter()
+        for nif in nifs:
+            with open(Path(root) / f"{nif}.json", encoding="utf-8") as fh:
+                json.load(fh)
+        r["json_parse_us"] = _us(t0, n_docs)
+        t0 = time.perf_counter()
+        for nif in nifs:
+            load_compiled(root, nif)
+        r["tpl_load_us"] = _us(t0, n_docs)
+        cache = TemplateCache(root, max_size=n_templates)
+        for nif in nifs:
+            cache.get(nif)
+        t0 = time.perf_counter()
+        for nif in nifs:
+            cache.get(nif)
+        r["cache_hit_us"] = _us(t0, n_docs)
+
+        # aplicación completa: antes (JSON por documento) y con el motor cacheado
+        doc = synthetic_document(templates[0], rng)
+        path = Path(root) / f"{templates[0]['nif']}.json"
+        t0 = time.perf_counter()
+        for _ in range(n_docs):
+            with open(path, encoding="utf-8") as fh:
+                template = json.load(fh)
+            resolve_fields(template["fields"], WordIndex(doc["words"]))
+        r["apply_json_us"] = _us(t0, n_docs)
+        engine = TemplateEngine(TemplateCache(root))
+        t0 = time.perf_counter()
+        for _ in range(n_docs):
+            engine.apply(doc, templates[0]["nif"])
+        r["apply_cached_us"] = _us(t0, n_docs)
+    return r
+
+
+def main():
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--templates", type=int, default=1000)
+    ap.add_argument("--docs", type=int, default=5000)
+    args = ap.parse_args()
+    r = run(args.templates, args.docs)
+    for key, value in r.items():
+        print(f"{key:>16} {value}")
+    benchlib.write_json(args.json, r)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
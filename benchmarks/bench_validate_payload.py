@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark de la validación del payload de corrección.
+
+Compara el validador anterior de corrections_api (try/except por fila, se
+para en el primer error) con el validador compilado de
+scripts/payload_schema.py para payloads con 1, 100 y 1000 filas de productos,
+con fecha ISO y dd/mm/YYYY. Se toma el mejor de `--repeat` pasadas.
+
+Usage: run from project root:
+    python3 benchmarks/bench_validate_payload.py [--number 200] [--repeat 5] [--json out.json]
+"""
+import copy
+import re
+import timeit
+from datetime import datetime
+
+import benchlib
+from scripts.payload_schema import validate_correction
+
+ROWS = [1, 100, 1000]
+
+
+def legacy_validate(p):
+    # Copia del validate_payload original, como referencia
+    def normalize_nif(nif):
+        if not nif:
+            return ""
+        return re.sub(r'[^A-Za-z0-9]', '', str(nif)).upper()
+
+    def valid_iso_date(s):
+        if not s:
+            return False
+        try:
+            datetime.fromisoformat(s)
+            return True
+        except Exception:
+            try:
+                datetime.strptime(s, "%d/%m/%Y")
+                return True
+            except Exception:
+                return False
+
+    if not isinstance(p, dict):
+        return False, "payload must be a JSON object"
+    if not p.get("debug_id"):
+        return False, "missing debug_id"
+    if not (p.get("template_id") or p.get("nif")):
+        return False, "missing template_id or nif"
+    if p.get("nif"):
+        p["nif"] = normalize_nif(p["nif"])
+    if p.get("proveedor"):
+        p["proveedor"] = str(p["proveedor"]).strip()
+    if p.get("fecha_albaran") and not valid_iso_date(p.get("fecha_albaran")):
+        return False, "fecha_albaran must be ISO date YYYY-MM-DD or ISO format"
+    prods = p.get("productos")
+    if prods is not None:
+        if not isinstance(prods, list):
+            return False, "productos must be a list"
+        for i, row in enumerate(prods):
+            if not isinstance(row, dict):
+                return False, f"producto at index {i} must be an object"
+            if not row.get("descripcion"):
+                return False, f"producto at index {i} missing descripcion"
+            if "unidades" in row:
+                try:
+                    float(row["unidades"])
+                except Exception:
+                    return False, f"producto at index {i} unidades must be numeric"
+            if "precio_unitario" in row:
+                try:
+                    float(row["precio_unitario"])
+                except Exception:
+                    return False, f"producto at index {i} precio_unitario must be numeric"
+    return True, p
+
+
+def make_payload(n_rows, fecha="2024-03-15"):
+    return {
+        "debug_id": "bench_debug",
+        "nif": "b-12345678",
+        "proveedor": "  Proveedor Ejemplo SL ",
+        "fecha_albaran": fecha,
+        "productos": [
+            {"descripcion": f"Producto {i}", "unidades": str(i % 7 + 1),
+             "precio_unitario": f"{i % 50}.95", "importe_linea": i}
+            for i in range(n_rows)
+        ],
+    }
+
+
+def _best_us(fn, base, number, repeat):
+    # cada llamada recibe su propia copia: ambos validadores normalizan in situ
+    best = None
+    for _ in range(repeat):
+        it = iter([copy.deepcopy(base) for _ in range(number)])
+        t = timeit.timeit(lambda: fn(next(it)), number=number)
+        best = t if best is None else min(best, t)
+    return round(best / number * 1e6, 2)
+
+
+def run(number=200, repeat=5):
+    rows = []
+    for n in ROWS:
+        for fecha in ("2024-03-15", "15/03/2024"):
+            base = make_payload(n, fecha)
+            rows.append({
+                "productos": n,
+                "fecha": fecha,
+                "legacy_us": _best_us(legacy_validate, base, number, repeat),
+                "compiled_us": _best_us(validate_correction, base, number, repeat),
+            })
+    return rows
+
+
+def main():
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--number", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+    rows = run(args.number, args.repeat)
+    print(f"{'productos':>9} {'fecha':>11} {'legacy µs':>11} {'compiled µs':>12}")
+    for r in rows:
+        print(f"{r['productos']:>9} {r['fecha']:>11} {r['legacy_us']:>11.1f} {r['compiled_us']:>12.1f}")
+    benchlib.write_json(args.json, rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
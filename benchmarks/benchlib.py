@@ -0,0 +1,40 @@
+"""
+Utilidades comunes de los benchmarks.
+
+Los `bench_*.py` se ejecutan como script desde la raíz del proyecto, así que
+`benchmarks/` está en sys.path y basta con `import benchlib` (antes que el
+resto de imports del proyecto): añade la raíz para poder importar `scripts`,
+`backend` y `benchmarks`.
+"""
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def parser(doc):
+    """ArgumentParser con la primera línea de `doc` como descripción y `--json`."""
+    ap = argparse.ArgumentParser(description=doc.strip().splitlines()[0])
+    ap.add_argument("--json", help="escribe los resultados en este fichero JSON")
+    return ap
+
+
+def write_json(path, data):
+    """Escribe `data` en `path` (el valor de `--json`); no hace nada si no se pidió."""
+    if path:
+        Path(path).write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+
+def best_ms(fn, repeat):
+    """Mejor tiempo en ms de `repeat` llamadas a `fn`."""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Suite de benchmarks del pipeline de aprendizaje y de la API de correcciones.
+
+Cada escenario corre en un directorio temporal propio (los módulos usan rutas
+relativas a la raíz, así que se hace chdir allí) con datos de
+`benchmarks/synthetic.py`, deterministas para una misma semilla:
+
+    ingest     POST /api/v1/corrections y /corrections:batch con el test client de Flask
+    build      build_templates completo e incremental (delta fijo) frente al tamaño del archivo
+    apply      latencia por documento de TemplateEngine.apply (p50/p95/p99)
+    manifest   learning_manifest.csv en frío, sin cambios y con un 1% nuevo
+    import     scripts/import_corrections.py sobre el archivo (subproceso)
+
+`--json` guarda los resultados con el commit, la versión de Python y los
+parámetros; `--compare base.json` muestra la variación métrica a métrica y
+marca las regresiones por encima de `--threshold` (las métricas `*_per_s`
+mejoran al subir; el resto son tiempos).
+
+Usage: run from project root:
+    python3 benchmarks/run_suite.py [--scale 1.0] [--only build,apply] [--json out.json] [--compare base.json]
+"""
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import benchlib
+from benchmarks.synthetic import Workload
+
+CORRECTIONS_DIR = "artifacts_device/persisted_corrections"
+BUILD_SIZES = [1000, 5000, 20000]
+# correcciones nuevas de la ejecución incremental: las mismas para todos los tamaños,
+# así su tiempo solo debe depender del delta, no del archivo
+BUILD_DELTA = 50
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def percentiles(samples):
+    """{p50, p95, p99, mean} en ms de una lista de duraciones en segundos."""
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(q * len(s)))]  # noqa: E731
+    return {"p50_ms": _ms(pick(0.50)), "p95_ms": _ms(pick(0.95)), "p99_ms": _ms(pick(0.99)),
+            "mean_ms": _ms(sum(s) / len(s))}
+
+
+@contextlib.contextmanager
+def workdir():
+    """Directorio temporal como cwd (las rutas de los módulos son relativas a la raíz)."""
+    old = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="albabench-") as tmp:
+        os.chdir(tmp)
+        try:
+            yield Path(tmp)
+        finally:
+            os.chdir(old)
+
+
+def scenario_ingest(w, scale):
+    n_single, n_batch, batch = int(500 * scale), int(20000 * scale), 500
+    r = {}
+    with workdir():
+        # se importa aquí: la app crea su almacén en ./artifacts_device al importarse
+        from scripts import corrections_api as api
+        client = api.app.test_client()
+        headers = {"X-API-Key": api.API_KEY}
+        samples = []
+        t0 = time.perf_counter()
+        for c in w.corrections(n_single):
+            t = time.perf_counter()
+            resp = client.post("/api/v1/corrections", json=c, headers=headers)
+            samples.append(time.perf_counter() - t)
+            assert resp.status_code == 201, resp.get_json()
+        r["single_per_s"] = round(n_single / (time.perf_counter() - t0), 1)
+        r.update({f"single_{k}": v for k, v in percentiles(samples).items()})
+
+        t0 = time.perf_counter()
+        for s in range(n_single, n_single + n_batch, batch):
+            body = "".join(json.dumps(c) + "\n" for c in w.corrections(min(batch, n_single + n_batch - s), s))
+            resp = client.post("/api/v1/corrections:batch", data=body, headers=headers)
+            assert resp.status_code == 202, resp.get_json()
+        api.INGEST.drain()
+        r["batch_per_s"] = round(n_batch / (time.perf_counter() - t0), 1)
+    return r
+
+
+def scenario_build(w, scale):
+    from backend.learning_pipeline import generate_template
+    r = {}
+    for size in (int(n * scale) for n in BUILD_SIZES):
+        with workdir(), contextlib.redirect_stdout(io.StringIO()):
+            w.write_store(CORRECTIONS_DIR, size)
+            t0 = time.perf_counter()
+            generate_template.build_templates(full=True)
+            r[f"full_{size}_ms"] = _ms(time.perf_counter() - t0)
+            w.write_store(CORRECTIONS_DIR, BUILD_DELTA, start=size)
+            t0 = time.perf_counter()
+            generate_template.build_templates()
+            r[f"incremental_{size}_ms"] = _ms(time.perf_counter() - t0)
+    return r
+
+
+def scenario_apply(w, scale):
+    from backend.learning_pipeline import generate_template
+    from backend.learning_pipeline.apply_template import TEMPLATE_DIR, TemplateEngine
+    n_docs = int(1000 * scale)
+    with workdir():
+        with contextlib.redirect_stdout(io.StringIO()):
+            w.write_store(CORRECTIONS_DIR, len(w.providers) * 20)
+            generate_template.build_templates(full=True)
+        docs = [w.ocr_document(i) for i in range(n_docs)]
+        engine = TemplateEngine.from_dir(TEMPLATE_DIR)
+        engine.apply(docs[0])  # carga en frío fuera de la medida
+        samples = []
+        t0 = time.perf_counter()
+        for doc in docs:
+            t = time.perf_counter()
+            result = engine.apply(doc)
+            samples.append(time.perf_counter() - t)
+            assert "error" not in result, result
+        r = {"docs_per_s": round(n_docs / (time.perf_counter() - t0), 1), **percentiles(samples)}
+        # sin NIF legible: identificación por maquetación
+        samples = []
+        for doc in docs[:max(1, n_docs // 10)]:
+            doc = {"words": doc["words"][1:]}
+            t = time.perf_counter()
+            engine.apply(doc)
+            samples.append(time.perf_counter() - t)
+        r.update({f"matched_{k}": v for k, v in percentiles(samples).items()})
+    return r
+
+
+def scenario_manifest(w, scale):
+    from scripts.learning_manifest import persisted_row, write_manifest
+    n = int(20000 * scale)
+    r = {}
+    with workdir():
+        w.write_store(CORRECTIONS_DIR, n)
+        for label in ("cold", "warm"):
+            t0 = time.perf_counter()
+            write_manifest(CORRECTIONS_DIR, persisted_row, "learning_manifest.csv")
+            r[f"{label}_ms"] = _ms(time.perf_counter() - t0)
+        w.write_store(CORRECTIONS_DIR, max(1, n // 100), start=n)
+        t0 = time.perf_counter()
+        write_manifest(CORRECTIONS_DIR, persisted_row, "learning_manifest.csv")
+        r["incremental_ms"] = _ms(time.perf_counter() - t0)
+    r["rows"] = n + max(1, n // 100)
+    return r
+
+
+def scenario_import(w, scale):
+    n = int(5000 * scale)
+    with workdir():
+        w.write_store(CORRECTIONS_DIR, n)
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, str(benchlib.PROJECT_ROOT / "scripts" / "import_corrections.py")],
+                       check=True, stdout=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - t0
+    return {"corrections": n, "total_ms": _ms(elapsed), "corrections_per_s": round(n / elapsed, 1)}
+
+
+SCENARIOS = {
+    "ingest": scenario_ingest,
+    "build": scenario_build,
+    "apply": scenario_apply,
+    "manifest": scenario_manifest,
+    "import": scenario_import,
+}
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=benchlib.PROJECT_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base, current, threshold):
+    """Filas (escenario.métrica, base, actual, variación %, regresión)."""
+    rows = []
+    for scenario, metrics in current["results"].items():
+        for key, value in metrics.items():
+            old = base.get("results", {}).get(scenario, {}).get(key)
+            if not isinstance(old, (int, float)) or not old or key in ("rows", "corrections"):
+                continue
+            change = (value - old) / old
+            worse = -change if key.endswith("_per_s") else change
+            rows.append((f"{scenario}.{key}", old, value, round(change * 100, 1), worse > threshold))
+    return rows
+
+
+def main(argv=None):
+    ap = benchlib.parser(__doc__)
+    ap.add_argument("--only", help=f"escenarios separados por comas ({', '.join(SCENARIOS)})")
+    ap.add_argument("--scale", type=float, default=1.0, help="multiplica el tamaño de todas las cargas")
+    ap.add_argument("--providers", type=int, default=50)
+    ap.add_argument("--fields", type=int, default=8)
+    ap.add_argument("--products", type=int, default=200)
+    ap.add_argument("--words", type=int, default=300, help="palabras por página de los documentos OCR")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--compare", help="resultados JSON de referencia (p. ej. del commit anterior)")
+    ap.add_argument("--threshold", type=float, default=0.10, help="variación que cuenta como regresión")
+    args = ap.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        ap.error(f"escenario desconocido: {', '.join(unknown)}")
+    params = {k: getattr(args, k) for k in ("scale", "providers", "fields", "products", "words", "seed")}
+    w = Workload(args.providers, args.fields, args.products, args.words, seed=args.seed)
+    out = {"commit": _commit(), "python": platform.python_version(), "platform": platform.platform(),
+           "timestamp": int(time.time()), "params": params, "results": {}}
+    for name in names:
+        t0 = time.perf_counter()
+        out["results"][name] = SCENARIOS[name](w, args.scale)
+        print(f"[{name}] {time.perf_counter() - t0:.1f}s", file=sys.stderr)
+        for key, value in out["results"][name].items():
+            print(f"{name + '.' + key:>32} {value}")
+    benchlib.write_json(args.json, out)
+
+    if args.compare:
+        base = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        rows = compare(base, out, args.threshold)
+        print(f"\ncomparado con {base.get('commit')}:")
+        for key, old, new, pct, bad in rows:
+            print(f"{key:>32} {old:>12} {new:>12} {pct:>+7.1f}%{'  REGRESIÓN' if bad else ''}")
+        return 1 if any(r[4] for r in rows) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
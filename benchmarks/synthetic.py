@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Generador determinista de carga sintética: correcciones y volcados de palabras OCR.
+
+`Workload` fija un conjunto de proveedores (NIF, nombre, cajas de campo y
+catálogo de productos) a partir de la semilla; la corrección o el documento
+`i` dependen solo de (semilla, i), así que dos ejecuciones (o dos commits)
+generan exactamente los mismos datos. Las correcciones cumplen
+`scripts/payload_schema.CORRECTION_SCHEMA`.
+
+Usage: run from project root:
+    python3 benchmarks/synthetic.py --corrections 1000 [--providers 20] > corrections.jsonl
+    python3 benchmarks/synthetic.py --ocr 100 [--words 300] > ocr.jsonl
+    python3 benchmarks/synthetic.py --corrections 5000 --store artifacts_device/persisted_corrections
+"""
+import argparse
+import json
+import random
+import sys
+from datetime import date, timedelta
+
+import benchlib  # noqa: F401  (añade la raíz del proyecto a sys.path)
+from scripts.corrections_store import get_store
+
+PAGE_W, PAGE_H = 2480, 3508  # A4 a 300 dpi
+FIELD_NAMES = ["numero_albaran", "fecha_albaran", "total", "base_imponible", "iva", "cliente",
+               "forma_pago", "pedido", "matricula", "ruta", "observaciones", "firma"]
+NOUNS = ["yogur", "leche", "queso", "pan", "aceite", "harina", "azucar", "tomate", "atun", "arroz",
+         "galletas", "zumo", "cafe", "chocolate", "jamon", "chorizo", "pasta", "agua", "cerveza", "vino"]
+ADJS = ["natural", "entera", "desnatada", "integral", "fresco", "curado", "oliva", "virgen", "extra",
+        "ecologico", "light", "tostado", "blanco", "tinto", "griego", "rallado", "picante", "dulce"]
+UNITS = ["125g", "250g", "500g", "1kg", "1l", "1.5l", "33cl", "75cl", "pack 4", "pack 6", "caja 12"]
+SYLLABLES = ["dis", "tri", "bu", "cio", "nes", "ali", "men", "tos", "gar", "cia", "mar", "ber", "sur",
+             "nor", "te", "ca", "fri", "go", "ri", "fi", "cos", "hor", "ta", "li", "zas", "pes"]
+FILLER = ["albaran", "cantidad", "descripcion", "precio", "importe", "total", "cliente", "fecha",
+          "unidades", "kg", "caja", "entrega", "pedido", "referencia", "observaciones"]
+BASE_TS = 1700000000
+BASE_DATE = date(2024, 1, 1)
+
+
+class Workload:
+    """Proveedores sintéticos y generadores deterministas de correcciones y documentos OCR."""
+
+    def __init__(self, providers=20, fields=8, products=200, words=300, pages=1, jitter=4.0, seed=0):
+        self.seed = seed
+        self.words = words
+        self.pages = pages
+        self.jitter = jitter
+        rng = random.Random(f"providers:{seed}")
+        names = FIELD_NAMES[:fields] + [f"campo_{i}" for i in range(len(FIELD_NAMES), fields)]
+        self.providers = []
+        for p in range(providers):
+            name = " ".join("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(2))
+            self.providers.append({
+                "nif": rng.choice("ABCDEFGH") + f"{rng.randrange(10 ** 8):08d}",
+                "proveedor": name.title() + " SL",
+                "fields": {f: {"x": round(rng.uniform(0, PAGE_W - 400), 1), "y": round(rng.uniform(0, PAGE_H - 80), 1),
+                               "w": round(rng.uniform(100, 400), 1), "h": round(rng.uniform(30, 80), 1)}
+                           for f in names},
+                "products": [" ".join([rng.choice(NOUNS), rng.choice(ADJS), rng.choice(UNITS)]).upper()
+                             for _ in range(products)],
+            })
+
+    def _rng(self, kind, i):
+        return random.Random(f"{kind}:{self.seed}:{i}")
+
+    def provider(self, i):
+        return self.providers[i % len(self.providers)]
+
+    def correction(self, i):
+        rng = self._rng("correction", i)
+        p = self.provider(i)
+        lines = rng.randint(1, 8)
+        return {
+            "debug_id": f"debug_{i:08d}",
+            "user_id": f"user_{i % 7}",
+            "timestamp": BASE_TS + i,
+            "template_id": p["nif"],
+            "nif": p["nif"],
+            "proveedor": p["proveedor"],
+            "numero_albaran": f"A{rng.randrange(10 ** 6):06d}",
+            "fecha_albaran": (BASE_DATE + timedelta(days=i % 365)).isoformat(),
+            "productos": [{"descripcion": rng.choice(p["products"]), "unidades": rng.randint(1, 24),
+                           "precio_unitario": round(rng.uniform(0.2, 40), 2)} for _ in range(lines)],
+            "fields": [{"field": name, "coords": {k: round(v + rng.uniform(-self.jitter, self.jitter), 2)
+                                                  for k, v in box.items()}}
+                       for name, box in p["fields"].items()],
+        }
+
+    def corrections(self, n, start=0):
+        for i in range(start, start + n):
+            yield self.correction(i)
+
+    def ocr_document(self, i):
+        """Documento OCR del proveedor `i % providers`: una palabra dentro de cada campo más relleno."""
+        rng = self._rng("ocr", i)
+        p = self.provider(i)
+        words = [{"x": 60, "y": 240, "w": 200, "h": 30, "text": f"NIF: {p['nif']}"}]
+        for word in p["proveedor"].split():
+            words.append({"x": rng.uniform(50, 400), "y": rng.uniform(50, 200), "w": 120, "h": 30, "text": word})
+        for name, c in p["fields"].items():
+            words.append({"x": c["x"] + rng.uniform(0, c["w"] * 0.2), "y": c["y"] + rng.uniform(0, c["h"] * 0.2),
+                          "w": c["w"] * 0.6, "h": c["h"] * 0.6, "text": f"{name}:{rng.randrange(1000)}"})
+        for n in range(self.words * self.pages - len(words)):
+            page = n % self.pages
+            words.append({"x": rng.uniform(0, PAGE_W - 100), "y": page * PAGE_H + rng.uniform(0, PAGE_H - 30),
+                          "w": 90, "h": 25, "text": rng.choice(FILLER)})
+        return {"nif": p["nif"], "words": words}
+
+    def write_store(self, root, n, start=0, mode=None, chunk=1000):
+        """Añade `n` correcciones al almacén de `root` (segmentos o ficheros, ver get_store)."""
+        store = get_store(root, mode)
+        for s in range(start, start + n, chunk):
+            store.append_many(list(self.corrections(min(chunk, start + n - s), s)), ts=BASE_TS + s)
+        store.flush()
+        return store
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--corrections", type=int, default=0, help="correcciones a generar")
+    ap.add_argument("--ocr", type=int, default=0, help="documentos OCR a generar")
+    ap.add_argument("--start", type=int, default=0, help="índice del primer elemento")
+    ap.add_argument("--providers", type=int, default=20)
+    ap.add_argument("--fields", type=int, default=8)
+    ap.add_argument("--products", type=int, default=200, help="productos por proveedor")
+    ap.add_argument("--words", type=int, default=300, help="palabras por página")
+    ap.add_argument("--pages", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--store", help="escribir las correcciones en este almacén en vez de JSONL")
+    args = ap.parse_args(argv)
+    w = Workload(args.providers, args.fields, args.products, args.words, args.pages, seed=args.seed)
+    if args.store and args.corrections:
+        w.write_store(args.store, args.corrections, args.start)
+        print(f"{args.corrections} correcciones en {args.store}", file=sys.stderr)
+    else:
+        for c in w.corrections(args.corrections, args.start):
+            sys.stdout.write(json.dumps(c, ensure_ascii=False) + "\n")
+    for i in range(args.start, args.start + args.ocr):
+        sys.stdout.write(json.dumps(w.ocr_document(i), ensure_ascii=False) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
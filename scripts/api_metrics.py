@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Métricas Prometheus y perfilador por muestreo para corrections_api.
+
+Las métricas son de `prometheus_client`. Con `PROMETHEUS_MULTIPROC_DIR` (su
+modo multiproceso) cada worker de gunicorn/uvicorn escribe sus valores en
+ficheros de ese directorio y `/metrics` los suma con `MultiProcessCollector`,
+así que los contadores son monótonos lo atienda el worker que lo atienda y
+los de un worker que ya salió siguen contando. El directorio se vacía al
+arrancar gunicorn y los gauges "live" de un worker se retiran al salir (ver
+scripts/gunicorn_conf.py). Sin la variable, cada proceso exporta lo suyo.
+
+Los valores que lleva otro objeto del worker (la cola de ingesta) los copia
+`WorkerStats` cada `METRICS_PUBLISH_INTERVAL` segundos y al exportar; lo que
+ya es común a todos los workers (el tamaño del archivo) lo lee
+`SnapshotCollector` de su fuente en cada scrape (ver CorrectionsIndex.totals).
+
+Perfilador: con `API_PROFILE=1` cada worker arranca un hilo que cada
+`API_PROFILE_INTERVAL` segundos muestrea las pilas de todos los hilos
+(`sys._current_frames`) y vuelca periódicamente las pilas agregadas en formato
+"folded" (`func;func;func N`, el de flamegraph.pl o speedscope) en
+`{API_PROFILE_DIR}/profile-{pid}.folded`.
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Counter
+from pathlib import Path
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+PUBLISH_INTERVAL = float(os.environ.get("METRICS_PUBLISH_INTERVAL", 5.0))
+PROFILE_INTERVAL = float(os.environ.get("API_PROFILE_INTERVAL", 0.01))
+PROFILE_DIR = os.environ.get("API_PROFILE_DIR", "artifacts_device/profiles")
+PROFILE_FLUSH = float(os.environ.get("API_PROFILE_FLUSH", 10.0))
+
+if MULTIPROC_DIR:
+    # prometheus_client escribe ahí desde la primera métrica, pero no lo crea
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# registro de las métricas de la API (sin las de proceso/GC del registro global)
+REGISTRY = CollectorRegistry()
+
+
+def scrape_registry(*collectors):
+    """Registro que exporta /metrics: en modo multiproceso suma los ficheros de todos los workers."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    for collector in collectors:
+        registry.register(collector)
+    return registry
+
+
+def render(registry, stats=None):
+    """(cuerpo, content type) de /metrics; antes publica los valores de este worker."""
+    if stats is not None:
+        stats.publish()
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class SnapshotCollector:
+    """Gauges leídos de su fuente en cada scrape: [(nombre, ayuda, fn)], comunes a todos los workers."""
+
+    def __init__(self, gauges):
+        self.gauges = gauges
+
+    def collect(self):
+        for name, help, fn in self.gauges:
+            try:
+                value = fn()
+            except Exception:
+                # una fuente caída (p. ej. la base SQLite bloqueada) no debe tumbar el scrape
+                continue
+            yield GaugeMetricFamily(name, help, value=value)
+
+
+class WorkerStats:
+    """Copia a métricas valores que lleva otro objeto de cada worker (p. ej. IngestQueue).
+
+    `gauge(metric, fn)` fija el gauge a `fn()`; `counter(metric, fn)` incrementa
+    el contador en lo que haya crecido `fn()`. Se publica en un hilo de cada
+    worker cada `interval` segundos (`ensure_running`, tras el fork) y al
+    exportar, no en cada petición.
+    """
+
+    def __init__(self, interval=PUBLISH_INTERVAL):
+        self.interval = interval
+        self._gauges = []
+        self._counters = []  # [metric, fn, último valor publicado]
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def gauge(self, metric, fn):
+        self._gauges.append((metric, fn))
+
+    def counter(self, metric, fn):
+        self._counters.append([metric, fn, 0])
+
+    def publish(self):
+        with self._lock:
+            for metric, fn in self._gauges:
+                try:
+                    metric.set(fn())
+                except Exception:
+                    continue
+            for entry in self._counters:
+                metric, fn, last = entry
+                try:
+                    value = fn()
+                except Exception:
+                    continue
+                if value > last:
+                    metric.inc(value - last)
+                entry[2] = value
+
+    def ensure_running(self):
+        # como IngestQueue: tras el fork de gunicorn hay que arrancar el hilo en cada worker
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = None
+                    atexit.register(self.publish)
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="metrics-publisher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.publish()
+
+
+class TimedStore:
+    """Envuelve un almacén de correcciones midiendo cada escritura en `hist` (etiqueta: operación)."""
+
+    def __init__(self, store, hist):
+        self._store = store
+        self._hist = hist
+
+    def append(self, payload, ts=None):
+        with self._hist.labels("append").time():
+            return self._store.append(payload, ts)
+
+    def append_many(self, payloads, ts=None):
+        with self._hist.labels("append_many").time():
+            return self._store.append_many(payloads, ts)
+
+    def __getattr__(self, name):
+        return getattr(self._store, name)
+
+
+class SamplingProfiler:
+    """Muestrea las pilas de todos los hilos del proceso y las agrega en formato folded."""
+
+    def __init__(self, out_dir=PROFILE_DIR, interval=PROFILE_INTERVAL, flush_every=PROFILE_FLUSH):
+        self.out_dir = Path(out_dir)
+        self.interval = interval
+        self.flush_every = flush_every
+        self.stacks = _Counter()
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def ensure_running(self):
+        # como IngestQueue: tras el fork de gunicorn hay que arrancar el hilo en cada worker
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # lo heredado del proceso padre no es de este worker
+                    self.stacks.clear()
+                    self.samples = 0
+                    self._pid = os.getpid()
+                    self._thread = None
+                    atexit.register(self.flush)
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="api-profiler", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        me = threading.get_ident()
+        last_flush = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                        frame = frame.f_back
+                    self.stacks[";".join(reversed(stack))] += 1
+                self.samples += 1
+            if time.monotonic() - last_flush >= self.flush_every:
+                self.flush()
+                last_flush = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if not self.stacks:
+                return None
+            lines = [f"{stack} {n}\n" for stack, n in self.stacks.most_common()]
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        out = self.out_dir / f"profile-{os.getpid()}.folded"
+        tmp = out.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.writelines(lines)
+        os.replace(tmp, out)
+        return out
+
+
+def profiler_from_env():
+    """SamplingProfiler si `API_PROFILE` está activo (1/true/yes), si no None."""
+    if os.environ.get("API_PROFILE", "").lower() in ("1", "true", "yes", "on"):
+        return SamplingProfiler()
+    return None
@@ -1,17 +1,34 @@
 #!/usr/bin/env python3
-from flask import Flask, request, jsonify, send_file, abort
+from flask import Flask, Response, g, request, jsonify, send_file, abort
 from pathlib import Path
-import json, os, csv, time
-from datetime import datetime
-import re
+import os, time, sys, io
 
-OUT_DIR = Path("artifacts_device/persisted_corrections")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_index import DEFAULT_LIMIT, persist
+from scripts.learning_manifest import MANIFEST_PATH, default_source, write_manifest
+from scripts.payload_schema import normalize_nif, validate_correction
+from scripts.api_metrics import render
+# almacén, índice, cola de ingesta y métricas: compartidos con scripts/corrections_asgi.py
+from scripts.corrections_service import (API_KEY, BATCH_MAX_ITEMS, INDEX, INGEST, METRICS, OUT_DIR, STORE,
+                                         WORKER_STATS, _count_rejection, list_item, parse_batch, record_request,
+                                         start_request, validate_batch)
 
 app = Flask(__name__)
 
-# API key (can be overridden by env var CORRECTIONS_API_KEY)
-API_KEY = os.environ.get("CORRECTIONS_API_KEY", "dev-key")
+@app.before_request
+def _start_timer():
+    g.t0 = time.perf_counter()
+    start_request()
+
+@app.after_request
+def _record_request(resp):
+    route = request.url_rule.rule if request.url_rule else "<unmatched>"
+    record_request(route, request.method, resp.status_code, time.perf_counter() - g.get("t0", time.perf_counter()),
+                   request.content_length or 0, resp.content_length or 0)
+    return resp
 
 def require_api_key(func):
     from functools import wraps
@@ -23,132 +40,105 @@ def require_api_key(func):
         return func(*args, **kwargs)
     return wrapper
 
-def normalize_nif(nif):
-    if not nif:
-        return ""
-    return re.sub(r'[^A-Za-z0-9]', '', str(nif)).upper()
-
-def valid_iso_date(s):
-    if not s:
-        return False
-    try:
-        datetime.fromisoformat(s)
-        return True
-    except Exception:
-        try:
-            datetime.strptime(s, "%d/%m/%Y")
-            return True
-        except Exception:
-            return False
-
-def validate_payload(p):
-    if not isinstance(p, dict):
-        return False, "payload must be a JSON object"
-    if not p.get("debug_id"):
-        return False, "missing debug_id"
-    if not (p.get("template_id") or p.get("nif")):
-        return False, "missing template_id or nif"
-    if p.get("nif"):
-        p["nif"] = normalize_nif(p["nif"])
-    if p.get("proveedor"):
-        p["proveedor"] = str(p["proveedor"]).strip()
-    if p.get("fecha_albaran") and not valid_iso_date(p.get("fecha_albaran")):
-        return False, "fecha_albaran must be ISO date YYYY-MM-DD or ISO format"
-    prods = p.get("productos")
-    if prods is not None:
-        if not isinstance(prods, list):
-            return False, "productos must be a list"
-        for i, row in enumerate(prods):
-            if not isinstance(row, dict):
-                return False, f"producto at index {i} must be an object"
-            if not row.get("descripcion"):
-                return False, f"producto at index {i} missing descripcion"
-            if "unidades" in row:
-                try:
-                    float(row["unidades"])
-                except Exception:
-                    return False, f"producto at index {i} unidades must be numeric"
-            if "precio_unitario" in row:
-                try:
-                    float(row["precio_unitario"])
-                except Exception:
-                    return False, f"producto at index {i} precio_unitario must be numeric"
-    return True, p
-
 @app.route("/api/v1/corrections", methods=["POST"])
 @require_api_key
 def receive_correction():
     try:
         payload = request.get_json(force=True)
     except Exception as e:
+        _count_rejection("invalid json")
         return jsonify({"ok": False, "error": "invalid json", "detail": str(e)}), 400
-    ok, info = validate_payload(payload)
-    if not ok:
-        return jsonify({"ok": False, "error": info}), 400
-    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    debug = info.get("debug_id", "debug_unknown")
-    fname = OUT_DIR / f"{debug}_corr_{ts}.json"
-    fname.write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
-    return jsonify({"ok": True, "path": str(fname)}), 201
+    info, errors = validate_correction(payload)
+    if errors:
+        _count_rejection(errors[0]["message"])
+        return jsonify({"ok": False, "error": errors[0]["message"], "errors": errors}), 400
+    path, _ = persist(STORE, INDEX, info)
+    return jsonify({"ok": True, "path": path}), 201
+
+@app.route("/api/v1/corrections:batch", methods=["POST"])
+@require_api_key
+def receive_corrections_batch():
+    try:
+        items = parse_batch(request.get_data())
+    except Exception as e:
+        _count_rejection("invalid json")
+        return jsonify({"ok": False, "error": "invalid json", "detail": str(e)}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({"ok": False, "error": f"too many items (max {BATCH_MAX_ITEMS})"}), 413
+    results, accepted = validate_batch(items)
+    if not accepted:
+        # nada que escribir: el cliente no debe dar el lote por sincronizado
+        return jsonify({"ok": False, "error": "no valid items", "accepted": 0, "rejected": len(items),
+                        "results": results}), 422
+    backpressure = {"queue_depth": INGEST.depth(), "queue_capacity": INGEST.maxsize}
+    if not INGEST.submit(accepted):
+        resp = jsonify({"ok": False, "error": "ingest queue full, retry later", **backpressure})
+        resp.headers["Retry-After"] = "1"
+        return resp, 503
+    backpressure["queue_depth"] = INGEST.depth()
+    resp = jsonify({"ok": True, "accepted": len(accepted), "rejected": len(items) - len(accepted),
+                    "results": results, **backpressure})
+    resp.headers["X-Queue-Depth"] = str(backpressure["queue_depth"])
+    return resp, 202
 
 @app.route("/api/v1/health", methods=["GET"])
 def health():
-    return jsonify({"ok": True, "persisted_dir": str(OUT_DIR)})
+    n, size = INDEX.totals()
+    return jsonify({"ok": True, "persisted_dir": str(OUT_DIR), "storage": STORE.mode,
+                    "corrections": n, "bytes": size, "queue_depth": INGEST.depth(), "ingest": INGEST.stats()})
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    body, content_type = render(METRICS, WORKER_STATS)
+    return Response(body, content_type=content_type)
 
 @app.route("/api/v1/corrections", methods=["GET"])
 @require_api_key
 def list_corrections():
-    files = sorted(OUT_DIR.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-    items = []
-    for f in files:
-        st = f.stat()
-        items.append({
-            "filename": f.name,
-            "path": str(f),
-            "size": st.st_size,
-            "mtime": int(st.st_mtime)
-        })
-    return jsonify({"ok": True, "count": len(items), "items": items})
+    # ?limit=&cursor=&nif=&since=&until= (epoch); la respuesta trae next_cursor y ETag
+    args = request.args
+    try:
+        since = int(args["since"]) if args.get("since") else None
+        until = int(args["until"]) if args.get("until") else None
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+        rows, next_cursor = INDEX.query(limit=limit, cursor=args.get("cursor"),
+                                        nif=normalize_nif(args.get("nif")), since=since, until=until)
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid limit, cursor, since or until"}), 400
+    items = [list_item(r) for r in rows]
+    resp = jsonify({"ok": True, "count": len(items), "items": items, "next_cursor": next_cursor})
+    resp.set_etag(f"{INDEX.version()}-{request.query_string.decode('latin-1')}")
+    return resp.make_conditional(request)
 
 @app.route("/api/v1/corrections/<debug_id>", methods=["GET"])
 @require_api_key
 def get_correction(debug_id):
+    row = INDEX.latest(debug_id)
+    if row:
+        name = os.path.basename(row["location"]) if row["location"].endswith(".json") else f"{debug_id}.json"
+        try:
+            data = STORE.read_location(row["location"], row["size"])
+            return send_file(io.BytesIO(data), mimetype="application/json", as_attachment=True, download_name=name)
+        except OSError:
+            pass  # movida o borrada desde que se indexó: se busca en el almacén
     # allow either exact filename or debug_id prefix
-    files = sorted(OUT_DIR.glob(f"{debug_id}*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-    if not files:
+    found = STORE.get(debug_id)
+    if not found:
         return jsonify({"ok": False, "error": "not found"}), 404
-    return send_file(str(files[0]), mimetype="application/json", as_attachment=True, download_name=files[0].name)
+    name, data = found
+    return send_file(io.BytesIO(data), mimetype="application/json", as_attachment=True, download_name=name)
 
 @app.route("/api/v1/export_manifest", methods=["POST"])
 @require_api_key
 def export_manifest():
     # regenerate manifest from persisted corrections or from learning_queue if present
     source = request.json.get("source","persisted") if request.is_json else "persisted"
-    out_manifest = Path("artifacts_device/learning_manifest.csv")
-    rows = []
+    out_manifest = MANIFEST_PATH
     # prefer learning_queue_from_corrections if exists
-    lq_dir = Path("artifacts_device/learning_queue_from_corrections")
-    if lq_dir.exists() and any(lq_dir.glob("*.json")):
-        files = sorted(lq_dir.glob("*.json"))
-        for f in files:
-            j = json.load(open(f, 'r', encoding='utf-8'))
-            debug = j.get("debug_file")
-            tpl = j.get("template_id")
-            prod_count = len(j.get("form",{}).get("productos",[]))
-            rows.append([debug, tpl, prod_count, str(f)])
-    else:
-        files = sorted(OUT_DIR.glob("*.json"))
-        for f in files:
-            j = json.load(open(f, 'r', encoding='utf-8'))
-            debug = j.get("debug_id", f.stem)
-            tpl = j.get("template_id") or j.get("nif") or ""
-            prod_count = len(j.get("productos", []))
-            rows.append([debug, tpl, prod_count, str(f)])
-    with open(out_manifest, 'w', encoding='utf-8', newline='') as fh:
-        w = csv.writer(fh)
-        w.writerow(["debug_file","template_id","n_productos","path"])
-        w.writerows(rows)
-    return jsonify({"ok": True, "manifest": str(out_manifest), "count": len(rows)}), 200
+    src, to_row = default_source()
+    # solo se parsean los ficheros nuevos o modificados (caché por mtime/tamaño)
+    count = write_manifest(src, to_row, out_manifest)
+    return jsonify({"ok": True, "manifest": str(out_manifest), "count": count}), 200
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5001, debug=False)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Modo asíncrono (ASGI) de corrections_api: mismas rutas, validación, almacén,
+índice, cola de ingesta y métricas (se importan de `scripts.corrections_service`,
+que no depende de Flask).
+
+Con gunicorn síncrono cada petición ocupa un hilo mientras escribe en disco o
+lee del índice (`--workers 2 --threads 4` = 8 peticiones en vuelo). Aquí el
+bucle de eventos solo parsea y valida; el trabajo de disco (almacén, índice
+SQLite, manifest) va a un ejecutor acotado: `ASGI_IO_THREADS` hilos y como
+mucho `ASGI_IO_PENDING` tareas en cola (el resto espera sin ocupar hilo), así
+que miles de conexiones abiertas no se traducen en miles de hilos.
+
+`GET /api/v1/corrections` se envía como JSON troceado (chunked): se recorre el
+índice por páginas de MAX_LIMIT filas y cada página sale en cuanto se lee, así
+que se admiten listados de hasta `ASGI_LIST_MAX_LIMIT` elementos sin montarlos
+en memoria. Con `limit` <= MAX_LIMIT la respuesta coincide con la de Flask.
+
+Usage: run from project root (requiere uvicorn):
+    uvicorn scripts.corrections_asgi:app --host 0.0.0.0 --port 5001 --workers 2
+    gunicorn scripts.corrections_asgi:app -k uvicorn.workers.UvicornWorker --workers 2 --bind 0.0.0.0:5001
+"""
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qsl
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.api_metrics import render  # noqa: E402
+from scripts.corrections_service import (API_KEY, BATCH_MAX_ITEMS, INDEX, INGEST, METRICS, OUT_DIR,  # noqa: E402
+                                         STORE, WORKER_STATS, _count_rejection, list_item, parse_batch,
+                                         record_request, start_request, validate_batch)
+from scripts.corrections_index import DEFAULT_LIMIT, MAX_LIMIT, persist  # noqa: E402
+from scripts.learning_manifest import MANIFEST_PATH, default_source, write_manifest  # noqa: E402
+from scripts.payload_schema import normalize_nif, validate_correction  # noqa: E402
+
+IO_THREADS = int(os.environ.get("ASGI_IO_THREADS", 32))
+IO_PENDING = int(os.environ.get("ASGI_IO_PENDING", 1024))
+LIST_MAX_LIMIT = int(os.environ.get("ASGI_LIST_MAX_LIMIT", 100000))
+BODY_MAX_BYTES = int(os.environ.get("ASGI_BODY_MAX_BYTES", 64 << 20))
+
+
+class DiskPool:
+    """Ejecutor de trabajo de disco con `threads` hilos y como mucho `pending` tareas en vuelo."""
+
+    def __init__(self, threads=IO_THREADS, pending=IO_PENDING):
+        self._executor = ThreadPoolExecutor(threads, thread_name_prefix="asgi-io")
+        self._slots = asyncio.Semaphore(pending)
+
+    async def run(self, fn, *args):
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+DISK = DiskPool()
+
+
+class HTTPError(Exception):
+    def __init__(self, status, body):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+
+
+class Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"")
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        # como request.args de Flask: el primer valor de cada parámetro
+        self.args = {}
+        for k, v in parse_qsl(self.query_string.decode("latin-1"), keep_blank_values=True):
+            self.args.setdefault(k, v)
+        self._receive = receive
+        self.received = 0
+
+    async def body(self):
+        chunks = []
+        while True:
+            message = await self._receive()
+            chunk = message.get("body", b"")
+            self.received += len(chunk)
+            if self.received > BODY_MAX_BYTES:
+                raise HTTPError(413, {"ok": False, "error": f"body too large (max {BODY_MAX_BYTES} bytes)"})
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+
+class Response:
+    """Cuerpo en bytes o, con `stream`, un generador asíncrono de trozos (Transfer-Encoding: chunked)."""
+
+    def __init__(self, body=b"", status=200, headers=None, content_type="application/json", stream=None):
+        self.status = status
+        self.body = body
+        self.stream = stream
+        self.headers = [(b"content-type", content_type.encode())]
+        self.headers += [(k.lower().encode(), str(v).encode("latin-1")) for k, v in (headers or {}).items()]
+        if stream is None:
+            self.headers.append((b"content-length", str(len(body)).encode()))
+
+    async def send(self, send):
+        await send({"type": "http.response.start", "status": self.status, "headers": self.headers})
+        if self.stream is None:
+            await send({"type": "http.response.body", "body": self.body})
+            return len(self.body)
+        sent = 0
+        async for chunk in self.stream:
+            sent += len(chunk)
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+        return sent
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(obj, status=200, headers=None):
+    return Response(_dumps(obj), status, headers)
+
+
+def require_api_key(req):
+    key = req.headers.get("x-api-key") or req.args.get("api_key")
+    if not key or key != API_KEY:
+        raise HTTPError(401, {"ok": False, "error": "unauthorized"})
+
+
+def _persist(info):
+    return persist(STORE, INDEX, info)[0]
+
+
+async def receive_correction(req):
+    require_api_key(req)
+    try:
+        payload = json.loads(await req.body())
+    except ValueError as e:
+        _count_rejection("invalid json")
+        return json_response({"ok": False, "error": "invalid json", "detail": str(e)}, 400)
+    info, errors = validate_correction(payload)
+    if errors:
+        _count_rejection(errors[0]["message"])
+        return json_response({"ok": False, "error": errors[0]["message"], "errors": errors}, 400)
+    path = await DISK.run(_persist, info)
+    return json_response({"ok": True, "path": path}, 201)
+
+
+def _prepare_batch(raw):
+    try:
+        items = parse_batch(raw)
+    except Exception as e:
+        _count_rejection("invalid json")
+        return None, {"ok": False, "error": "invalid json", "detail": str(e)}
+    if len(items) > BATCH_MAX_ITEMS:
+        return None, {"ok": False, "error": f"too many items (max {BATCH_MAX_ITEMS})"}
+    return validate_batch(items), None
+
+
+async def receive_corrections_batch(req):
+    require_api_key(req)
+    raw = await req.body()
+    # lotes de miles de elementos: el parseo y la validación no bloquean el bucle
+    validated, error = await DISK.run(_prepare_batch, raw)
+    if error:
+        return json_response(error, 400 if error["error"] == "invalid json" else 413)
+    results, accepted = validated
+    if not accepted:
+        return json_response({"ok": False, "error": "no valid items", "accepted": 0, "rejected": len(results),
+                              "results": results}, 422)
+    backpressure = {"queue_depth": INGEST.depth(), "queue_capacity": INGEST.maxsize}
+    if not INGEST.submit(accepted):
+        return json_response({"ok": False, "error": "ingest queue full, retry later", **backpressure}, 503,
+                             {"Retry-After": "1"})
+    backpressure["queue_depth"] = INGEST.depth()
+    return json_response({"ok": True, "accepted": len(accepted), "rejected": len(results) - len(accepted),
+                          "results": results, **backpressure}, 202,
+                         {"X-Queue-Depth": backpressure["queue_depth"]})
+
+
+async def health(req):
+    n, size = await DISK.run(INDEX.totals)
+    return json_response({"ok": True, "persisted_dir": str(OUT_DIR), "storage": STORE.mode,
+                          "corrections": n, "bytes": size, "queue_depth": INGEST.depth(),
+                          "ingest": INGEST.stats()})
+
+
+async def metrics(req):
+    # los gauges del archivo consultan el índice SQLite y el modo multiproceso lee ficheros
+    body, content_type = await DISK.run(render, METRICS, WORKER_STATS)
+    return Response(body, content_type=content_type)
+
+
+async def list_corrections(req):
+    require_api_key(req)
+    args = req.args
+    try:
+        since = int(args["since"]) if args.get("since") else None
+        until = int(args["until"]) if args.get("until") else None
+        limit = max(1, min(int(args.get("limit", DEFAULT_LIMIT)), LIST_MAX_LIMIT))
+        nif = normalize_nif(args.get("nif"))
+        rows, next_cursor = await DISK.run(INDEX.query, min(limit, MAX_LIMIT), args.get("cursor"), nif, since, until)
+    except ValueError:
+        return json_response({"ok": False, "error": "invalid limit, cursor, since or until"}, 400)
+    etag = f'"{await DISK.run(INDEX.version)}-{req.query_string.decode("latin-1")}"'
+    if etag in [t.strip() for t in req.headers.get("if-none-match", "").split(",")]:
+        return Response(b"", 304, {"ETag": etag})
+
+    async def stream(rows, next_cursor):
+        count = 0
+        yield b'{"ok":true,"items":['
+        while True:
+            if rows:
+                yield (b"," if count else b"") + b",".join(_dumps(list_item(r)) for r in rows)
+                count += len(rows)
+            if not next_cursor or count >= limit:
+                break
+            # siguiente página del índice solo cuando la anterior ya ha salido
+            rows, next_cursor = await DISK.run(INDEX.query, min(limit - count, MAX_LIMIT), next_cursor, nif,
+                                               since, until)
+        yield b'],"count":' + str(count).encode() + b',"next_cursor":' + _dumps(next_cursor) + b"}"
+
+    return Response(status=200, headers={"ETag": etag}, stream=stream(rows, next_cursor))
+
+
+def _attachment(name, data):
+    return Response(data, headers={"Content-Disposition": f'attachment; filename="{name}"'})
+
+
+async def get_correction(req, debug_id):
+    require_api_key(req)
+    row = await DISK.run(INDEX.latest, debug_id)
+    if row:
+        name = os.path.basename(row["location"]) if row["location"].endswith(".json") else f"{debug_id}.json"
+        try:
+            return _attachment(name, await DISK.run(STORE.read_location, row["location"], row["size"]))
+        except OSError:
+            pass  # movida o borrada desde que se indexó: se busca en el almacén
+    # allow either exact filename or debug_id prefix
+    found = await DISK.run(STORE.get, debug_id)
+    if not found:
+        return json_response({"ok": False, "error": "not found"}, 404)
+    name, data = found
+    return _attachment(name, data)
+
+
+def _export_manifest():
+    src, to_row = default_source()
+    return write_manifest(src, to_row, MANIFEST_PATH)
+
+
+async def export_manifest(req):
+    require_api_key(req)
+    await req.body()
+    count = await DISK.run(_export_manifest)
+    return json_response({"ok": True, "manifest": str(MANIFEST_PATH), "count": count})
+
+
+# (método, patrón, manejador, regla de Flask: la etiqueta `route` de las métricas)
+ROUTES = [
+    ("POST", r"/api/v1/corrections", receive_correction, "/api/v1/corrections"),
+    ("GET", r"/api/v1/corrections", list_corrections, "/api/v1/corrections"),
+    ("POST", r"/api/v1/corrections:batch", receive_corrections_batch, "/api/v1/corrections:batch"),
+    ("GET", r"/api/v1/health", health, "/api/v1/health"),
+    ("GET", r"/metrics", metrics, "/metrics"),
+    ("GET", r"/api/v1/corrections/(?P<debug_id>[^/]+)", get_correction, "/api/v1/corrections/<debug_id>"),
+    ("POST", r"/api/v1/export_manifest", export_manifest, "/api/v1/export_manifest"),
+]
+_COMPILED = [(method, re.compile(pattern + r"\Z"), handler, rule) for method, pattern, handler, rule in ROUTES]
+
+
+def match_route(method, path):
+    """(manejador, parámetros, regla); sin manejador si la ruta existe con otro método (405) o no existe (404)."""
+    rule = None
+    for m, pattern, handler, r in _COMPILED:
+        found = pattern.match(path)
+        if found:
+            if m == method or (method == "HEAD" and m == "GET"):
+                return handler, found.groupdict(), r
+            rule = r
+    return None, {}, rule
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            # lo que quede en la cola de ingesta se escribe antes de salir
+            await asyncio.get_running_loop().run_in_executor(None, INGEST.drain)
+            DISK.shutdown()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+    t0 = time.perf_counter()
+    start_request()
+    req = Request(scope, receive)
+    handler, params, rule = match_route(req.method, req.path)
+    # cualquier otra excepción la convierte en 500 el servidor: se cuenta como tal
+    status, sent = 500, 0
+    try:
+        try:
+            if handler is None:
+                raise HTTPError(405 if rule else 404,
+                                {"ok": False, "error": "method not allowed" if rule else "not found"})
+            resp = await handler(req, **params)
+        except HTTPError as e:
+            resp = json_response(e.body, e.status)
+        if req.method == "HEAD":
+            resp.stream, resp.body = None, b""
+        status = resp.status
+        sent = await resp.send(send)
+    finally:
+        record_request(rule or "<unmatched>", req.method, status, time.perf_counter() - t0,
+                       int(req.headers.get("content-length") or 0), sent)
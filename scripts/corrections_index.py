@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Índice SQLite (modo WAL) de metadatos de correcciones persistidas.
+
+Guarda una fila por corrección escrita (debug_id, nif, template_id, mtime,
+size, n_productos, location) para que los GET de la API no tengan que listar
+ni hacer `stat()` del directorio. Toda escritura de correcciones (API,
+`save_correction.py`, `migrate_corrections.py`) pasa por `persist`, que escribe
+en el almacén y añade la fila; para reconstruirlo a partir del almacén:
+
+    python3 scripts/corrections_index.py --rebuild
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_loader import chunked, iter_correction_paths, iter_corrections
+from scripts.corrections_store import INDEX_NAME as SIDECAR_INDEX_NAME
+from scripts.corrections_store import OUT_DIR, SEGMENTS_SUBDIR, iter_segment_records, location
+
+DB_NAME = "corrections_index.db"
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+SCHEMA = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS corrections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    debug_id TEXT NOT NULL,
+    nif TEXT,
+    template_id TEXT,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    n_productos INTEGER NOT NULL DEFAULT 0,
+    location TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_corrections_mtime ON corrections (mtime DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_corrections_nif ON corrections (nif, mtime DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_corrections_debug ON corrections (debug_id, mtime DESC, id DESC);
+-- totales mantenidos por triggers: tamaño del archivo sin COUNT(*) ni recorrer el directorio
+CREATE TABLE IF NOT EXISTS corrections_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    n INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO corrections_totals SELECT 1, count(*), coalesce(sum(size), 0) FROM corrections;
+CREATE TRIGGER IF NOT EXISTS corrections_totals_ins AFTER INSERT ON corrections BEGIN
+    UPDATE corrections_totals SET n = n + 1, bytes = bytes + NEW.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS corrections_totals_del AFTER DELETE ON corrections BEGIN
+    UPDATE corrections_totals SET n = n - 1, bytes = bytes - OLD.size WHERE id = 1;
+END;
+COMMIT;
+"""
+
+COLUMNS = ["id", "debug_id", "nif", "template_id", "mtime", "size", "n_productos", "location"]
+
+
+def row_for(payload, loc, size, mtime):
+    """Tupla lista para `CorrectionsIndex.add` a partir de un payload ya validado."""
+    prods = payload.get("productos")
+    return (
+        payload.get("debug_id", "debug_unknown"),
+        payload.get("nif") or None,
+        payload.get("template_id") or None,
+        int(mtime),
+        int(size),
+        len(prods) if isinstance(prods, list) else 0,
+        loc,
+    )
+
+
+def open_index(root=OUT_DIR):
+    """Índice de `root`; si la base no existía se rellena desde el almacén."""
+    index = CorrectionsIndex(Path(root) / DB_NAME)
+    if index.created:
+        index.rebuild(root)
+    return index
+
+
+def persist(store, index, payload, ts=None):
+    """Escribe `payload` en el almacén y lo añade al índice; devuelve (location, tamaño)."""
+    ts = time.time() if ts is None else ts
+    loc, size = store.append(payload, ts)
+    index.add([row_for(payload, loc, size, ts)])
+    return loc, size
+
+
+class CorrectionsIndex:
+    """Conexión por hilo a la base SQLite del índice."""
+
+    def __init__(self, path=None):
+        self.path = str(path or OUT_DIR / DB_NAME)
+        self.created = not os.path.exists(self.path)
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # INSERT OR REPLACE borra la fila anterior: así también dispara el trigger de DELETE
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+        return conn
+
+    def add(self, rows):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO corrections "
+                "(debug_id, nif, template_id, mtime, size, n_productos, location) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def remove(self, locations):
+        """Quita las filas de esas locations (ficheros movidos o borrados)."""
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM corrections WHERE location = ?", ((loc,) for loc in locations))
+
+    def version(self):
+        """Cambia con cada inserción y cada borrado: base barata para ETags.
+
+        Con solo max(id) un `remove()` no la cambiaría; los totales sí cambian.
+        """
+        row = self._conn().execute(
+            "SELECT (SELECT max(id) FROM corrections), n, bytes FROM corrections_totals WHERE id = 1").fetchone()
+        max_id, n, size = row if row else (None, 0, 0)
+        return f"{max_id or 0}-{n}-{size}"
+
+    def totals(self):
+        """(correcciones, bytes) del archivo, mantenidos por triggers en cada escritura."""
+        row = self._conn().execute("SELECT n, bytes FROM corrections_totals WHERE id = 1").fetchone()
+        return row if row else (0, 0)
+
+    def query(self, limit=DEFAULT_LIMIT, cursor=None, nif=None, since=None, until=None):
+        """Página de filas, de la más reciente a la más antigua, y cursor de la siguiente.
+
+        El cursor es `"{mtime}:{id}"` de la última fila devuelta.
+        """
+        limit = max(1, min(int(limit), MAX_LIMIT))
+        where, args = [], []
+        if nif:
+            where.append("nif = ?")
+            args.append(nif)
+        if since is not None:
+            where.append("mtime >= ?")
+            args.append(int(since))
+        if until is not None:
+            where.append("mtime <= ?")
+            args.append(int(until))
+        if cursor:
+            c_mtime, c_id = (int(v) for v in cursor.split(":", 1))
+            where.append("(mtime < ? OR (mtime = ? AND id < ?))")
+            args.extend([c_mtime, c_mtime, c_id])
+        sql = "SELECT " + ", ".join(COLUMNS) + " FROM corrections"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY mtime DESC, id DESC LIMIT ?"
+        rows = [dict(zip(COLUMNS, r)) for r in self._conn().execute(sql, args + [limit + 1])]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['mtime']}:{rows[-1]['id']}"
+        return rows, next_cursor
+
+    def latest(self, debug_id):
+        row = self._conn().execute(
+            "SELECT " + ", ".join(COLUMNS) + " FROM corrections WHERE debug_id = ? "
+            "ORDER BY mtime DESC, id DESC LIMIT 1", (debug_id,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def rebuild(self, root=OUT_DIR, batch=1000):
+        """Vacía el índice y lo rellena recorriendo ficheros sueltos y segmentos."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM corrections")
+        n = 0
+        for rows in chunked(_iter_store_rows(root), batch):
+            self.add(rows)
+            n += len(rows)
+        return n
+
+
+def _iter_store_rows(root):
+    for path, payload in iter_corrections(iter_correction_paths(root), workers=4):
+        st = os.stat(path)
+        yield row_for(payload, path, st.st_size, st.st_mtime)
+    seg_dir = os.path.join(str(root), SEGMENTS_SUBDIR)
+    # la marca de tiempo de escritura está en el índice lateral del almacén
+    written = {}
+    sidecar = os.path.join(seg_dir, SIDECAR_INDEX_NAME)
+    if os.path.exists(sidecar):
+        with open(sidecar, "rb") as fh:
+            for line in fh:
+                if line.endswith(b"\n"):
+                    e = json.loads(line)
+                    written[location(e["s"], e["o"])] = e["t"]
+    for loc, payload, seg, end in iter_segment_records(seg_dir):
+        if payload is None:
+            continue
+        off = int(loc.rsplit("@", 1)[1])
+        mtime = written.get(loc) or os.stat(os.path.join(seg_dir, seg)).st_mtime
+        yield row_for(payload, loc, end - off, mtime)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Mantenimiento del índice SQLite de correcciones.")
+    ap.add_argument("--root", default=str(OUT_DIR))
+    ap.add_argument("--rebuild", action="store_true", help="reconstruir el índice desde el almacén")
+    args = ap.parse_args()
+    index = CorrectionsIndex(Path(args.root) / DB_NAME)
+    if args.rebuild:
+        print("Indexadas", index.rebuild(args.root), "correcciones")
+    else:
+        print("Versión del índice:", index.version())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Lector en streaming de correcciones (o de cualquier directorio de JSON).
+
+Además de los `*.json` sueltos, si el directorio tiene segmentos de
+`corrections_store.SegmentStore` (`segments/`), también se recorren sus registros.
+
+`iter_corrections` es un generador: nunca hay en memoria más de una ventana
+acotada de ficheros parseados, así que el consumo no depende del tamaño del
+archivo. El parseo puede repartirse en un pool de hilos o de procesos, con
+salida ordenada o en orden de llegada; los ficheros corruptos se saltan y se
+cuentan en `LoadStats`.
+
+Usage (inventario rápido):
+    python3 scripts/corrections_loader.py [dir] [--workers N] [--processes] [--since EPOCH]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+from itertools import islice
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_store import SEGMENTS_SUBDIR, iter_segment_records, list_segments, segment_record_times  # noqa: E402
+
+CORRECTIONS_DIR = Path("artifacts_device/persisted_corrections")
+MAX_REPORTED_ERRORS = 100
+
+
+class LoadStats:
+    """Contadores de una pasada del lector."""
+
+    def __init__(self):
+        self.loaded = 0
+        self.errors = 0
+        self.failed = []  # (path, error), como mucho MAX_REPORTED_ERRORS
+
+    def _error(self, path, error):
+        self.errors += 1
+        if len(self.failed) < MAX_REPORTED_ERRORS:
+            self.failed.append((path, error))
+
+
+def iter_correction_paths(directory=CORRECTIONS_DIR, since=None, sort=True, inclusive=False):
+    """Rutas `*.json` del directorio; con `since` solo las de mtime posterior (epoch).
+
+    Con `inclusive` entran también las de mtime igual a `since`: un fichero
+    escrito en el mismo tick que el último visto no se pierde, a cambio de
+    releer los de ese tick (quien lo use debe tolerar duplicados).
+
+    Con `sort` hay que listar el directorio entero antes de devolver la primera
+    ruta (solo los nombres, no el contenido); con `sort=False` se generan según
+    se recorre, en el orden del sistema de ficheros.
+    """
+    directory = str(directory)
+    if not os.path.isdir(directory):
+        return iter(())
+    paths = (os.path.join(directory, e.name) for e in os.scandir(directory)
+             if e.name.endswith(".json") and e.is_file() and (since is None or _newer(e, since, inclusive)))
+    return iter(sorted(paths)) if sort else paths
+
+
+def _newer(entry, since, inclusive=False):
+    # borrado entre el listado y el stat: simplemente no se lista
+    try:
+        mtime = entry.stat().st_mtime
+    except OSError:
+        return False
+    return mtime >= since if inclusive else mtime > since
+
+
+def _filter_since(paths, since, stats):
+    for path in map(str, paths):
+        if since is not None:
+            try:
+                if os.stat(path).st_mtime <= since:
+                    continue
+            except OSError as e:
+                stats._error(path, str(e))
+                continue
+        yield path
+
+
+def _parse_chunk(paths, raw=False):
+    out = []
+    for path in paths:
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+            out.append((path, json.loads(data), None, data if raw else None))
+        except (OSError, ValueError) as e:
+            out.append((path, None, str(e), None))
+    return out
+
+
+def chunked(iterable, size):
+    """Listas de hasta `size` elementos de `iterable`, sin materializarlo."""
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _parallel(chunks, workers, processes, ordered, parse=_parse_chunk):
+    pool_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    window = workers * 4
+    with pool_cls(workers) as pool:
+        pending = deque() if ordered else set()
+        for chunk in chunks:
+            fut = pool.submit(parse, chunk)
+            if ordered:
+                pending.append(fut)
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            else:
+                pending.add(fut)
+                if len(pending) >= window:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for f in done:
+                        yield f.result()
+        if ordered:
+            while pending:
+                yield pending.popleft().result()
+        else:
+            for f in pending:
+                yield f.result()
+
+
+def iter_corrections(source=CORRECTIONS_DIR, workers=0, processes=False, ordered=True,
+                     since=None, stats=None, chunk_size=32, raw=False):
+    """Genera (ruta, payload) de cada JSON válido de `source`.
+
+    `source` es un directorio o un iterable de rutas. Con `workers` > 0 el
+    parseo va a un pool (hilos, o procesos con `processes=True`); `ordered`
+    conserva el orden de entrada. Los errores de lectura/JSON se cuentan en
+    `stats` y el fichero se omite. Con `raw` genera (ruta, payload, bytes
+    del fichero); los registros de segmento llevan None.
+    """
+    stats = stats if stats is not None else LoadStats()
+    seg_dir = None
+    if isinstance(source, (str, os.PathLike)):
+        # sin `ordered` tampoco hace falta ordenar el listado: se recorre en streaming
+        paths = iter_correction_paths(source, since=since, sort=ordered)
+        seg_dir = os.path.join(str(source), SEGMENTS_SUBDIR)
+    else:
+        paths = _filter_since(source, since, stats)
+    chunks = chunked(paths, chunk_size)
+    parse = partial(_parse_chunk, raw=raw) if raw else _parse_chunk
+    if workers and workers > 0:
+        results = _parallel(chunks, workers, processes, ordered, parse)
+    else:
+        results = map(parse, chunks)
+    for chunk in results:
+        for path, payload, error, data in chunk:
+            if error is not None:
+                stats._error(path, error)
+                continue
+            stats.loaded += 1
+            yield (path, payload, data) if raw else (path, payload)
+    if seg_dir and os.path.isdir(seg_dir):
+        for path, payload in _iter_segments(seg_dir, since, stats):
+            yield (path, payload, None) if raw else (path, payload)
+
+
+def _iter_segments(seg_dir, since, stats):
+    # con `since` se saltan los segmentos sin escrituras posteriores y, en el resto,
+    # los registros con ts del índice anterior: el ts va en segundos enteros, así que
+    # los del mismo segundo que `since` pueden repetirse (quien lo use debe tolerarlo)
+    segments = list_segments(seg_dir)
+    times = None
+    if since is not None:
+        segments = [n for n in segments if os.stat(os.path.join(seg_dir, n)).st_mtime > since]
+        times = segment_record_times(seg_dir, segments)
+    for loc, payload, seg, _ in iter_segment_records(seg_dir, segments=segments):
+        if times is not None and times.get((seg, int(loc.rsplit("@", 1)[1])), since) + 1 <= since:
+            continue
+        if payload is None:
+            stats._error(os.path.join(seg_dir, loc), "invalid JSON record")
+            continue
+        stats.loaded += 1
+        yield os.path.join(seg_dir, loc), payload
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Recorre un directorio de correcciones y cuenta válidas/corruptas.")
+    ap.add_argument("directory", nargs="?", default=str(CORRECTIONS_DIR))
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--processes", action="store_true", help="parsear en procesos en lugar de hilos")
+    ap.add_argument("--since", type=float, default=None, help="solo ficheros con mtime posterior (epoch)")
+    args = ap.parse_args()
+
+    stats = LoadStats()
+    t0 = time.perf_counter()
+    for _ in iter_corrections(args.directory, args.workers, args.processes, ordered=False,
+                              since=args.since, stats=stats):
+        pass
+    elapsed = time.perf_counter() - t0
+    print(f"loaded={stats.loaded} errors={stats.errors} seconds={elapsed:.2f}")
+    for path, error in stats.failed[:10]:
+        print(" - skip", path, error)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
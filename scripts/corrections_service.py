@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Estado compartido de la API de correcciones, sin dependencias de framework.
+
+Almacén, índice, cola de ingesta, métricas, perfilador, API key y las partes
+de los endpoints que no dependen de Flask (parseo y validación de lotes,
+elementos del listado). Lo importan `scripts/corrections_api.py` (Flask) y
+`scripts/corrections_asgi.py` (ASGI), así que el modo ASGI no necesita Flask.
+Al importarse crea `artifacts_device/persisted_corrections/` y abre el índice.
+"""
+import json
+import os
+import re
+from pathlib import Path
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from scripts.api_metrics import (LATENCY_BUCKETS, REGISTRY, SnapshotCollector, TimedStore, WorkerStats,
+                                 profiler_from_env, scrape_registry)
+from scripts.corrections_index import open_index, row_for
+from scripts.corrections_store import get_store
+from scripts.ingest_queue import IngestQueue
+from scripts.payload_schema import validate_correction
+
+OUT_DIR = Path("artifacts_device/persisted_corrections")
+OUT_DIR.mkdir(parents=True, exist_ok=True)
+# Métricas Prometheus (GET /metrics), sumadas entre workers con PROMETHEUS_MULTIPROC_DIR (ver scripts/api_metrics.py)
+REQUESTS = Counter("albacontrol_http_requests_total", "Peticiones HTTP", ("route", "method", "status"),
+                   registry=REGISTRY)
+LATENCY = Histogram("albacontrol_http_request_duration_seconds", "Latencia por ruta", ("route", "method"),
+                    buckets=LATENCY_BUCKETS, registry=REGISTRY)
+REQUEST_BYTES = Counter("albacontrol_http_request_bytes_total", "Bytes recibidos", ("route",), registry=REGISTRY)
+RESPONSE_BYTES = Counter("albacontrol_http_response_bytes_total", "Bytes enviados", ("route",), registry=REGISTRY)
+VALIDATION_FAILURES = Counter("albacontrol_validation_failures_total", "Correcciones rechazadas por motivo",
+                              ("reason",), registry=REGISTRY)
+STORE_WRITE = Histogram("albacontrol_store_write_seconds", "Latencia de escritura en disco", ("op",),
+                        buckets=LATENCY_BUCKETS, registry=REGISTRY)
+# CORRECTIONS_STORAGE=segments (por defecto) o files (un JSON por corrección)
+STORE = TimedStore(get_store(OUT_DIR), STORE_WRITE)
+# Índice SQLite de metadatos para los GET; la primera vez se rellena desde el almacén
+INDEX = open_index(OUT_DIR)
+# Escritor en segundo plano para /api/v1/corrections:batch
+INGEST = IngestQueue(STORE, INDEX, row_for, spill_dir=OUT_DIR / "_ingest_spill")
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 10000))
+# la cola de ingesta es de cada worker: se suman las de los workers vivos
+WORKER_STATS = WorkerStats()
+WORKER_STATS.gauge(Gauge("albacontrol_ingest_queue_depth", "Correcciones pendientes en la cola de ingesta",
+                         multiprocess_mode="livesum", registry=REGISTRY), INGEST.depth)
+WORKER_STATS.gauge(Gauge("albacontrol_ingest_queue_capacity", "Capacidad de la cola de ingesta",
+                         multiprocess_mode="livesum", registry=REGISTRY), lambda: INGEST.maxsize)
+WORKER_STATS.gauge(Gauge("albacontrol_ingest_unindexed", "Correcciones escritas pendientes de entrar en el índice",
+                         multiprocess_mode="livesum", registry=REGISTRY), INGEST.unindexed)
+INGEST_WRITTEN = Counter("albacontrol_ingest_written_total", "Correcciones escritas por el escritor en segundo plano",
+                         ("result",), registry=REGISTRY)
+WORKER_STATS.counter(INGEST_WRITTEN.labels("ok"), lambda: INGEST.written)
+WORKER_STATS.counter(INGEST_WRITTEN.labels("spilled"), lambda: INGEST.spilled)
+INGEST_ERRORS = Counter("albacontrol_ingest_errors_total", "Intentos fallidos del escritor en segundo plano",
+                        ("stage",), registry=REGISTRY)
+WORKER_STATS.counter(INGEST_ERRORS.labels("store"), lambda: INGEST.store_errors)
+WORKER_STATS.counter(INGEST_ERRORS.labels("index"), lambda: INGEST.index_errors)
+# totales del índice (triggers SQLite): compartidos por todos los workers, se leen en cada scrape
+METRICS = scrape_registry(SnapshotCollector([
+    ("albacontrol_archive_corrections", "Correcciones en el archivo", lambda: INDEX.totals()[0]),
+    ("albacontrol_archive_bytes", "Bytes de correcciones en el archivo", lambda: INDEX.totals()[1]),
+]))
+# API_PROFILE=1: perfilador por muestreo (pilas en formato folded, ver scripts/api_metrics.py)
+PROFILER = profiler_from_env()
+
+# API key (can be overridden by env var CORRECTIONS_API_KEY)
+API_KEY = os.environ.get("CORRECTIONS_API_KEY", "dev-key")
+
+
+def start_request():
+    """Arranca (tras el fork de cada worker) los hilos de métricas y del perfilador."""
+    WORKER_STATS.ensure_running()
+    if PROFILER:
+        PROFILER.ensure_running()
+
+
+def record_request(route, method, status, duration, received, sent):
+    """Métricas HTTP de una petición atendida; `route` es la regla de Flask o "<unmatched>"."""
+    LATENCY.labels(route, method).observe(duration)
+    REQUESTS.labels(route, method, str(status)).inc()
+    REQUEST_BYTES.labels(route).inc(received)
+    RESPONSE_BYTES.labels(route).inc(sent)
+
+
+def _count_rejection(message):
+    # los índices de producto se quitan para que el motivo tenga cardinalidad acotada
+    VALIDATION_FAILURES.labels(re.sub(r"\d+", "N", message)).inc()
+
+
+def parse_batch(raw):
+    """Lista de (payload, error) a partir de un array JSON o de NDJSON."""
+    if raw.lstrip()[:1] == b"[":
+        items = json.loads(raw)
+        return [(item, None) for item in items]
+    out = []
+    for line in raw.splitlines():
+        if not line.strip():
+            continue
+        try:
+            out.append((json.loads(line), None))
+        except ValueError as e:
+            out.append((None, f"invalid json: {e}"))
+    return out
+
+
+def validate_batch(items):
+    """(resultado por elemento, payloads normalizados aceptados) de un lote ya parseado."""
+    results, accepted = [], []
+    for i, (payload, error) in enumerate(items):
+        if error is None:
+            info, errors = validate_correction(payload)
+            if not errors:
+                accepted.append(info)
+                results.append({"index": i, "ok": True, "debug_id": info.get("debug_id")})
+                continue
+            results.append({"index": i, "ok": False, "error": errors[0]["message"], "errors": errors})
+            _count_rejection(errors[0]["message"])
+            continue
+        results.append({"index": i, "ok": False, "error": error})
+        _count_rejection("invalid json")
+    return results, accepted
+
+
+def list_item(r):
+    """Elemento de GET /api/v1/corrections a partir de una fila del índice."""
+    return {
+        "filename": os.path.basename(r["location"]),
+        "path": r["location"],
+        "debug_id": r["debug_id"],
+        "nif": r["nif"],
+        "template_id": r["template_id"],
+        "n_productos": r["n_productos"],
+        "size": r["size"],
+        "mtime": r["mtime"],
+    }
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Almacenamiento de correcciones persistidas.
+
+Dos modos, elegidos con la variable de entorno CORRECTIONS_STORAGE:
+ - `segments` (por defecto): cada corrección se añade como una línea JSON compacta
+   a ficheros de segmento rotativos (`segments/seg-000001.jsonl`, ...). Un índice
+   lateral `segments/index.jsonl` (debug_id -> segmento, offset, longitud) permite
+   leer un único registro sin recorrer nada. Los fsync se agrupan cada
+   CORRECTIONS_FSYNC_EVERY registros o CORRECTIONS_FSYNC_INTERVAL segundos (un
+   temporizador sincroniza lo pendiente aunque no lleguen más escrituras).
+ - `files`: modo de compatibilidad, un JSON indentado por corrección
+   (`{debug_id}_corr_{ts}.json`), ahora sin colisiones de nombre.
+
+Las escrituras se serializan con un `flock` sobre el segmento, así que varios
+workers de gunicorn pueden compartir el mismo directorio. `rebuild_index` toma
+el mismo lock y sustituye el índice; los demás procesos detectan el inodo
+nuevo y reabren el fichero.
+"""
+import atexit
+import contextlib
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+OUT_DIR = Path("artifacts_device/persisted_corrections")
+SEGMENTS_SUBDIR = "segments"
+INDEX_NAME = "index.jsonl"
+SEGMENT_MAX_BYTES = int(os.environ.get("CORRECTIONS_SEGMENT_MAX_BYTES", 64 * 1024 * 1024))
+FSYNC_EVERY = int(os.environ.get("CORRECTIONS_FSYNC_EVERY", 32))
+FSYNC_INTERVAL = float(os.environ.get("CORRECTIONS_FSYNC_INTERVAL", 1.0))
+
+_SEGMENT_RE = re.compile(r"^seg-(\d{6})\.jsonl$")
+_LOCATION_RE = re.compile(r"^(seg-\d{6}\.jsonl)@(\d+)$")
+
+
+def segment_name(n):
+    return f"seg-{n:06d}.jsonl"
+
+
+def location(segment, offset):
+    """Identificador estable de un registro: `seg-000001.jsonl@1234`."""
+    return f"{segment}@{offset}"
+
+
+def parse_location(loc):
+    """(segmento, offset) de una location de `location()`; None si es un fichero suelto."""
+    m = _LOCATION_RE.match(loc)
+    return (m.group(1), int(m.group(2))) if m else None
+
+
+def list_segments(seg_dir):
+    if not os.path.isdir(seg_dir):
+        return []
+    return sorted(n for n in os.listdir(seg_dir) if _SEGMENT_RE.match(n))
+
+
+def iter_segment_records(seg_dir, offsets=None, segments=None):
+    """Genera (location, payload, segmento, offset_final) de los segmentos de `seg_dir`.
+
+    Con `offsets` ({segmento: bytes ya leídos}) solo se lee la cola de cada
+    segmento; `segments` limita la lectura a esos nombres. Una última línea sin
+    `\\n` (escritura en curso) no se devuelve.
+    """
+    offsets = offsets or {}
+    for name in (segments if segments is not None else list_segments(seg_dir)):
+        start = offsets.get(name, 0)
+        with open(os.path.join(seg_dir, name), "rb") as fh:
+            fh.seek(start)
+            pos = start
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                end = pos + len(line)
+                try:
+                    payload = json.loads(line)
+                except ValueError:
+                    payload = None
+                yield location(name, pos), payload, name, end
+                pos = end
+
+
+def segment_record_times(seg_dir, segments):
+    """{(segmento, offset): ts} del índice lateral, solo para los segmentos de `segments`."""
+    segments = set(segments)
+    times = {}
+    path = os.path.join(seg_dir, INDEX_NAME)
+    if not segments or not os.path.exists(path):
+        return times
+    with open(path, "rb") as fh:
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break
+            e = json.loads(line)
+            if e["s"] in segments:
+                times[(e["s"], e["o"])] = e["t"]
+    return times
+
+
+class FileStore:
+    """Modo de compatibilidad: un fichero JSON indentado por corrección."""
+
+    mode = "files"
+
+    def __init__(self, root=OUT_DIR):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def append(self, payload, ts=None):
+        """Escribe un JSON nuevo; devuelve (ruta, tamaño). `ts` es epoch (por defecto, ahora)."""
+        ts = (datetime.utcfromtimestamp(ts) if ts is not None else datetime.utcnow()).strftime("%Y%m%dT%H%M%SZ")
+        debug = payload.get("debug_id", "debug_unknown")
+        data = json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+        n = 0
+        while True:
+            suffix = f"_{n}" if n else ""
+            fname = self.root / f"{debug}_corr_{ts}{suffix}.json"
+            try:
+                # 'x' falla si ya existe: dos correcciones del mismo debug_id en el mismo segundo
+                with open(fname, "xb") as fh:
+                    fh.write(data)
+                return str(fname), len(data)
+            except FileExistsError:
+                n += 1
+
+    def append_many(self, payloads, ts=None):
+        return [self.append(p, ts) for p in payloads]
+
+    def flush(self):
+        pass
+
+    def read_location(self, loc, size=None):
+        return Path(loc).read_bytes()
+
+    def get(self, debug_id):
+        """(nombre, bytes) de la corrección más reciente de `debug_id`, o None."""
+        files = sorted(self.root.glob(f"{debug_id}*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        if not files:
+            return None
+        return files[0].name, files[0].read_bytes()
+
+    def list(self):
+        for f in self.root.glob("*.json"):
+            st = f.stat()
+            yield {"filename": f.name, "path": str(f), "size": st.st_size, "mtime": int(st.st_mtime)}
+
+
+class SegmentStore:
+    """Registros JSON compactos añadidos a segmentos rotativos con índice lateral."""
+
+    mode = "segments"
+
+    def __init__(self, root=OUT_DIR, max_bytes=SEGMENT_MAX_BYTES,
+                 fsync_every=FSYNC_EVERY, fsync_interval=FSYNC_INTERVAL):
+        self.root = Path(root)
+        self.seg_dir = self.root / SEGMENTS_SUBDIR
+        self.seg_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.seg_dir / INDEX_NAME
+        self.max_bytes = max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        # los ficheros sueltos anteriores siguen siendo legibles hasta migrarlos
+        self.legacy = FileStore(self.root)
+        self._lock = threading.Lock()
+        self._segment = None
+        self._seg_fh = None
+        self._index_fh = open(self.index_path, "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._timer = None
+        self._index = {}
+        self._index_pos = 0
+        self._index_ino = None
+        atexit.register(self.flush)
+
+    @contextlib.contextmanager
+    def _flock(self):
+        # serializa con los demás procesos que comparten el directorio
+        with open(self.seg_dir / ".lock", "ab") as lock_fh:
+            fcntl.flock(lock_fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_fh, fcntl.LOCK_UN)
+
+    # -- escritura -----------------------------------------------------------------
+
+    def _current_segment(self):
+        segs = list_segments(self.seg_dir)
+        n = int(_SEGMENT_RE.match(segs[-1]).group(1)) if segs else 1
+        name = segment_name(n)
+        path = self.seg_dir / name
+        if path.exists() and path.stat().st_size >= self.max_bytes:
+            name = segment_name(n + 1)
+        return name
+
+    def _open_segment(self):
+        # otro proceso puede haber rotado: se recalcula bajo el lock en cada escritura
+        name = self._current_segment()
+        if name != self._segment:
+            if self._seg_fh:
+                self._sync()
+                self._seg_fh.close()
+            self._segment = name
+            self._seg_fh = open(self.seg_dir / name, "ab")
+        return self._seg_fh
+
+    def append_many(self, payloads, ts=None):
+        """Añade varios registros con un único lock/escritura; devuelve [(location, tamaño)]."""
+        ts = int(ts if ts is not None else time.time())
+        lines = [json.dumps(p, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+                 for p in payloads]
+        locations = []
+        with self._lock, self._flock():
+            fh = self._open_segment()
+            offset = fh.seek(0, os.SEEK_END)
+            fh.write(b"".join(lines))
+            fh.flush()
+            entries = []
+            for p, line in zip(payloads, lines):
+                entries.append(json.dumps({
+                    "d": p.get("debug_id", "debug_unknown"), "s": self._segment,
+                    "o": offset, "l": len(line), "t": ts,
+                }, ensure_ascii=False).encode("utf-8") + b"\n")
+                locations.append((location(self._segment, offset), len(line)))
+                offset += len(line)
+            self._reopen_index_if_replaced()
+            self._index_fh.write(b"".join(entries))
+            self._index_fh.flush()
+            self._unsynced += len(lines)
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            elif self._timer is None or not self._timer.is_alive():
+                self._arm_timer()
+        return locations
+
+    def append(self, payload, ts=None):
+        return self.append_many([payload], ts)[0]
+
+    def _reopen_index_if_replaced(self):
+        # otro proceso ha hecho rebuild_index: el descriptor apunta al inodo antiguo
+        try:
+            replaced = os.stat(self.index_path).st_ino != os.fstat(self._index_fh.fileno()).st_ino
+        except FileNotFoundError:
+            replaced = True
+        if replaced:
+            self._sync()
+            self._index_fh.close()
+            self._index_fh = open(self.index_path, "ab")
+
+    def _arm_timer(self):
+        delay = max(0.0, self.fsync_interval - (time.monotonic() - self._last_sync))
+        self._timer = threading.Timer(delay, self._timed_flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            if self._unsynced:
+                self._sync()
+
+    def _sync(self):
+        if self._seg_fh:
+            os.fsync(self._seg_fh.fileno())
+        os.fsync(self._index_fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    # -- lectura -------------------------------------------------------------------
+
+    def _refresh_index(self):
+        # solo se lee lo añadido al índice desde la última vez (también por otros procesos)
+        with open(self.index_path, "rb") as fh:
+            ino = os.fstat(fh.fileno()).st_ino
+            if ino != self._index_ino:
+                # índice reconstruido (por este u otro proceso): se relee entero
+                self._index, self._index_pos, self._index_ino = {}, 0, ino
+            fh.seek(self._index_pos)
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    break
+                self._index_pos += len(line)
+                e = json.loads(line)
+                self._index[e["d"]] = (e["s"], e["o"], e["l"], e["t"])
+
+    def read(self, segment, offset, length):
+        with open(self.seg_dir / segment, "rb") as fh:
+            return os.pread(fh.fileno(), length, offset)
+
+    def read_location(self, loc, size):
+        """Bytes de un registro por su location (o de un fichero suelto por su ruta)."""
+        parsed = parse_location(loc)
+        if parsed is None:
+            return self.legacy.read_location(loc)
+        return self.read(*parsed, size)
+
+    def get(self, debug_id):
+        with self._lock:
+            self._refresh_index()
+            entry = self._index.get(debug_id)
+        if entry is None:
+            return self.legacy.get(debug_id)
+        seg, off, length, _ = entry
+        return f"{debug_id}.json", self.read(seg, off, length)
+
+    def list(self):
+        with self._lock:
+            self._refresh_index()
+            entries = list(self._index.items())
+        for debug_id, (seg, off, length, ts) in entries:
+            yield {"filename": location(seg, off), "path": str(self.seg_dir / seg),
+                   "debug_id": debug_id, "size": length, "mtime": ts}
+        yield from self.legacy.list()
+
+    def rebuild_index(self):
+        """Reconstruye `index.jsonl` recorriendo los segmentos (tras un corte a medias)."""
+        with self._lock, self._flock():
+            tmp = self.index_path.with_suffix(".tmp")
+            with open(tmp, "wb") as out:
+                for loc, payload, seg, end in iter_segment_records(self.seg_dir):
+                    if payload is None:
+                        continue
+                    off = int(loc.rsplit("@", 1)[1])
+                    mtime = int(os.stat(self.seg_dir / seg).st_mtime)
+                    out.write(json.dumps({"d": payload.get("debug_id", "debug_unknown"), "s": seg,
+                                          "o": off, "l": end - off, "t": mtime},
+                                         ensure_ascii=False).encode("utf-8") + b"\n")
+            os.replace(tmp, self.index_path)
+            self._reopen_index_if_replaced()
+
+
+def get_store(root=OUT_DIR, mode=None):
+    mode = mode or os.environ.get("CORRECTIONS_STORAGE", "segments")
+    if mode == "files":
+        return FileStore(root)
+    if mode == "segments":
+        return SegmentStore(root)
+    raise ValueError(f"unknown CORRECTIONS_STORAGE mode: {mode}")
@@ -1,24 +1,240 @@
 #!/usr/bin/env python3
-import json,csv,tarfile,time
+"""
+Paquetes de aprendizaje incrementales a partir de `learning_queue_from_corrections`.
+
+Un registro (`ledger.jsonl`) guarda el sha256 de cada ejemplo ya empaquetado;
+cada ejecución empaqueta solo los ejemplos nuevos o cuyo contenido cambió
+(un mtime distinto con el mismo hash no cuenta). Un ejemplo sin cambios de
+tamaño ni mtime ni siquiera se vuelve a leer, y el resto se lee una sola vez:
+el hash del ledger y lo que va al paquete son los mismos bytes. Cada paquete lleva
+`learning_queue/…`, un `manifest.csv` con las filas de esos ejemplos y un
+`package.json` (secuencia, paquete anterior, hash por fichero).
+
+Compresión en paralelo: gzip por bloques de BLOCK_SIZE comprimidos en
+varios hilos y concatenados como miembros gzip (un `.tgz` normal para tar y
+tarfile), o zstd multihilo con `--compression zstd` si está instalado
+`zstandard`.
+
+Reanudable: el paquete se escribe como `.part` y se registra en el ledger
+solo al terminar; los deltas grandes se parten en paquetes de `--max-files`
+ejemplos, así que un corte pierde como mucho el paquete en curso y la
+siguiente ejecución continúa por ahí.
+
+Usage: run from project root:
+    python3 scripts/generate_learning_package.py [--full] [--workers N] [--compression gzip|zstd]
+"""
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-LQ = Path("artifacts_device/learning_queue_from_corrections")
-manifest = Path("artifacts_device/learning_manifest.csv")
-rows=[]
-for f in sorted(LQ.glob("*.json")):
-    j=json.load(open(f,'r',encoding='utf-8'))
-    debug=j.get("debug_file")
-    tpl=j.get("template_id")
-    prod_count=len(j.get("form",{}).get("productos",[]))
-    rows.append([debug,tpl,prod_count,str(f)])
-with open(manifest,'w',encoding='utf-8',newline='') as fh:
-    w=csv.writer(fh)
-    w.writerow(["debug_file","template_id","n_productos","path"])
-    w.writerows(rows)
-ts=time.strftime("%Y%m%d_%H%M%S")
-tar_path = Path(f"artifacts_device/learning_package_{ts}.tgz")
-with tarfile.open(tar_path,'w:gz') as t:
-    if LQ.exists():
-        t.add(LQ, arcname="learning_queue")
-    t.add(manifest, arcname="manifest.csv")
-print("Created", tar_path)
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.learning_manifest import HEADER, LQ_DIR as LQ, MANIFEST_PATH as manifest, learning_queue_row, \
+    manifest_rows, write_manifest
+
+PACKAGES_DIR = Path("artifacts_device")
+LEDGER_PATH = Path("artifacts_device/.learning_packages/ledger.jsonl")
+BLOCK_SIZE = 1 << 20
+MAX_FILES = 5000
+GZIP_LEVEL = 6
+
+
+class ParallelGzipWriter:
+    """Flujo de escritura que comprime bloques en varios hilos y los escribe en orden como miembros gzip."""
+
+    def __init__(self, fh, workers, level=GZIP_LEVEL, block_size=BLOCK_SIZE):
+        self.fh = fh
+        self.level = level
+        self.block_size = block_size
+        self.window = workers * 2
+        self._pool = ThreadPoolExecutor(workers)
+        self._pending = deque()
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        while len(self._buf) >= self.block_size:
+            self._submit(bytes(self._buf[:self.block_size]))
+            del self._buf[:self.block_size]
+        return len(data)
+
+    def _submit(self, block):
+        # zlib libera el GIL: los bloques se comprimen de verdad en paralelo
+        self._pending.append(self._pool.submit(gzip.compress, block, self.level, mtime=0))
+        while len(self._pending) > self.window:
+            self.fh.write(self._pending.popleft().result())
+
+    def close(self):
+        if self._buf:
+            self._submit(bytes(self._buf))
+            self._buf.clear()
+        while self._pending:
+            self.fh.write(self._pending.popleft().result())
+        self._pool.shutdown()
+
+    def abort(self):
+        """Descarta lo pendiente y para los hilos (tras un error: el `.part` no sirve)."""
+        self._buf.clear()
+        self._pending.clear()
+        self._pool.shutdown(cancel_futures=True)
+
+
+def open_compressor(fh, compression, workers, level=GZIP_LEVEL):
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            sys.exit("--compression zstd requiere el paquete zstandard (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3, threads=workers).stream_writer(fh, closefd=False)
+    return ParallelGzipWriter(fh, workers, level)
+
+
+def load_ledger(path=LEDGER_PATH):
+    """{nombre: [sha256, mtime_ns, tamaño]} y lista de paquetes registrados; ignora una línea final a medias."""
+    files, packages = {}, []
+    if not path.exists():
+        return files, packages
+    with open(path, "rb") as fh:
+        for line in fh:
+            if not line.endswith(b"\n"):
+                break
+            entry = json.loads(line)
+            files.update(entry["files"])
+            packages.append(entry["package"])
+    return files, packages
+
+
+def append_ledger(entry, path=LEDGER_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as fh:
+        fh.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def _read_example(path):
+    # (bytes, sha256, mtime_ns, tamaño) de una sola lectura; None si se borró entretanto
+    try:
+        with open(path, "rb") as fh:
+            mtime = os.fstat(fh.fileno()).st_mtime_ns
+            data = fh.read()
+    except FileNotFoundError:
+        return None
+    return data, hashlib.sha256(data).hexdigest(), mtime, len(data)
+
+
+def pending_examples(src_dir, ledger, workers, full=False, max_files=MAX_FILES):
+    """Genera lotes de hasta `max_files` ejemplos por empaquetar: [(nombre, sha256, mtime_ns, tamaño, bytes)].
+
+    Se leen de `max_files` en `max_files`, así que en memoria hay como mucho dos lotes.
+    """
+    if not src_dir.exists():
+        return
+    stats = {}
+    for e in os.scandir(src_dir):
+        if e.name.endswith(".json") and e.is_file():
+            st = e.stat()
+            stats[e.name] = (st.st_mtime_ns, st.st_size)
+    # con el mismo mtime y tamaño se da por bueno el hash del ledger sin leer el fichero
+    to_read = sorted(n for n, (mt, size) in stats.items()
+                     if full or n not in ledger or ledger[n][1:] != [mt, size])
+    batch = []
+    with ThreadPoolExecutor(workers) as pool:
+        for start in range(0, len(to_read), max_files):
+            names = to_read[start:start + max_files]
+            for name, example in zip(names, pool.map(lambda n: _read_example(src_dir / n), names)):
+                if example is None:
+                    continue
+                data, sha, mtime, size = example
+                if full or name not in ledger or ledger[name][0] != sha:
+                    batch.append((name, sha, mtime, size, data))
+                if len(batch) == max_files:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def build_package(batch, rows, seq, previous, compression, workers, level=GZIP_LEVEL):
+    ext = ".tar.zst" if compression == "zstd" else ".tgz"
+    ts = time.strftime("%Y%m%d_%H%M%S")
+    out = PACKAGES_DIR / f"learning_package_{ts}_{seq:05d}{ext}"
+    part = out.with_name(out.name + ".part")
+    meta = {"sequence": seq, "previous": previous, "created": ts,
+            "files": {name: sha for name, sha, *_ in batch}}
+    csv_buf = io.StringIO()
+    w = csv.writer(csv_buf)
+    w.writerow(HEADER)
+    w.writerows(rows[name] for name, *_ in batch if name in rows)
+    now = int(time.time())
+    entries = [(f"learning_queue/{name}", data, mtime // 10**9) for name, _, mtime, _, data in batch]
+    entries += [("manifest.csv", csv_buf.getvalue().encode("utf-8"), now),
+                ("package.json", json.dumps(meta, indent=1).encode("utf-8"), now)]
+    try:
+        with open(part, "wb") as fh:
+            stream = open_compressor(fh, compression, workers, level)
+            try:
+                with tarfile.open(fileobj=stream, mode="w|") as tar:
+                    for arcname, data, mtime in entries:
+                        info = tarfile.TarInfo(arcname)
+                        info.size, info.mtime, info.mode = len(data), mtime, 0o644
+                        tar.addfile(info, io.BytesIO(data))
+                stream.close()
+            except BaseException:
+                getattr(stream, "abort", stream.close)()
+                raise
+            fh.flush()
+            os.fsync(fh.fileno())
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    os.replace(part, out)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera paquetes de aprendizaje incrementales.")
+    ap.add_argument("--full", action="store_true", help="empaquetar todos los ejemplos, ya enviados o no")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="hilos de hash y compresión")
+    ap.add_argument("--compression", choices=["gzip", "zstd"], default="gzip")
+    ap.add_argument("--level", type=int, default=GZIP_LEVEL, help="nivel de gzip (1-9)")
+    ap.add_argument("--max-files", type=int, default=MAX_FILES, help="ejemplos por paquete")
+    args = ap.parse_args(argv)
+
+    # solo se parsean los ejemplos nuevos o modificados desde la última vez
+    write_manifest(LQ, learning_queue_row, manifest)
+    rows = {os.path.basename(r[3]): r for r in manifest_rows(LQ, learning_queue_row)[0]}
+    for stale in PACKAGES_DIR.glob("learning_package_*.part"):
+        stale.unlink()  # paquete de una ejecución interrumpida: nunca llegó al ledger
+
+    ledger, packages = load_ledger()
+    previous = packages[-1] if packages else None
+    created = 0
+    for batch in pending_examples(LQ, ledger, args.workers, args.full, args.max_files):
+        t0 = time.perf_counter()
+        out = build_package(batch, rows, len(packages) + 1, previous, args.compression, args.workers, args.level)
+        append_ledger({"package": out.name, "files": {n: [h, mt, size] for n, h, mt, size, _ in batch}})
+        packages.append(out.name)
+        previous = out.name
+        created += 1
+        print(f"Created {out} ({len(batch)} ejemplos, {out.stat().st_size} bytes, "
+              f"{time.perf_counter() - t0:.2f}s)")
+    if not created:
+        print("Nada nuevo que empaquetar")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,28 @@
+"""
+Configuración de gunicorn para scripts.corrections_api (ver Dockerfile):
+
+    gunicorn --config python:scripts.gunicorn_conf scripts.corrections_api:app ...
+
+Con PROMETHEUS_MULTIPROC_DIR las métricas de cada worker van a ficheros de ese
+directorio (ver scripts/api_metrics.py): se vacía al arrancar el master y,
+cuando sale un worker, se retiran sus gauges "live" (la cola de ingesta) para
+que /metrics deje de sumarlos. Sus contadores siguen contando.
+"""
+import glob
+import os
+
+from prometheus_client import multiprocess
+
+
+def on_starting(server):
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        os.makedirs(path, exist_ok=True)
+        # solo los ficheros de prometheus_client: el directorio lo elige quien despliega
+        for db in glob.glob(os.path.join(path, "*.db")):
+            os.remove(db)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(worker.pid)
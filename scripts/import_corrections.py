@@ -1,27 +1,54 @@
 #!/usr/bin/env python3
+"""
+Convierte las correcciones persistidas en ejemplos de `learning_queue_from_corrections/{debug_id}.json`.
+
+Incremental e idempotente. `STATE_PATH` guarda, por fichero de entrada,
+(tamaño, mtime, hash, debug_id), el offset consumido de cada segmento, los
+candidatos de cada debug_id y el hash del ejemplo escrito:
+
+- un fichero con el mismo tamaño y mtime no se vuelve a leer; si cambian pero
+  el hash es el mismo, tampoco se vuelve a convertir;
+- de los segmentos solo se lee la cola nueva;
+- si varias correcciones comparten debug_id gana la de `timestamp` más
+  reciente (desempate determinista: segmentos después de ficheros, y por
+  nombre/offset), independientemente del orden de lectura;
+- un ejemplo solo se escribe (tmp + rename) si su contenido cambia.
+
+Usage: run from project root:
+    python3 scripts/import_corrections.py [--full] [--workers N] [--verbose]
+"""
+import argparse
+import hashlib
 import json
+import os
+import sys
+from datetime import datetime
 from pathlib import Path
 
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_loader import LoadStats, iter_corrections  # noqa: E402
+from scripts.corrections_store import SEGMENTS_SUBDIR, iter_segment_records, parse_location  # noqa: E402
+
 IN_DIR = Path("artifacts_device/persisted_corrections")
 OUT_DIR = Path("artifacts_device/learning_queue_from_corrections")
-OUT_DIR.mkdir(parents=True, exist_ok=True)
+STATE_PATH = Path("artifacts_device/.import_state.json")
+STATE_VERSION = 1
+# payloads leídos en la pasada que se guardan para escribir su ejemplo sin releerlos
+FRESH_MAX = 20000
+
 
 def safe_get(d,k,default=""):
     return d.get(k,default)
 
-files = sorted(IN_DIR.glob("*.json"))
-count = 0
-for f in files:
-    try:
-        j = json.load(open(f,'r',encoding='utf-8'))
-    except Exception as e:
-        print("skip", f, e)
-        continue
+
+def to_example(j):
     # minimal validation: must have template_id or nif
     tpl = j.get("template_id") or j.get("nif") or "unknown_template"
     debug = j.get("debug_id","debug_unknown")
-    outf = OUT_DIR / f"{debug}.json"
-    example = {
+    return {
       "debug_file": debug,
       "template_id": tpl,
       "form": {
@@ -33,8 +60,211 @@ for f in files:
       },
       "corrections": j
     }
-    json.dump(example, open(outf,'w',encoding='utf-8'), ensure_ascii=False, indent=2)
-    print("WROTE", outf)
-    count += 1
 
-print("Imported", count, "examples")
+
+def payload_timestamp(j):
+    """`timestamp` del payload como epoch (número, texto numérico o ISO); 0 si no hay."""
+    ts = j.get("timestamp")
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        return float(ts)
+    if isinstance(ts, str) and ts.strip():
+        try:
+            return float(ts)
+        except ValueError:
+            pass
+        try:
+            return datetime.fromisoformat(ts.strip().replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return 0.0
+
+
+def source_order(source):
+    """Orden de desempate: ficheros sueltos por nombre, después registros de segmento por posición."""
+    parsed = parse_location(source)
+    return (1, *parsed) if parsed else (0, source, 0)
+
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def load_state(path=STATE_PATH):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            state = json.load(fh)
+        if state.get("version") == STATE_VERSION:
+            return state
+    except (OSError, ValueError):
+        pass
+    return {"version": STATE_VERSION, "files": {}, "segments": {}, "candidates": {}, "outputs": {}}
+
+
+def save_state(state, path=STATE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(state, fh, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def read_source(in_dir, source):
+    """Payload de un candidato: fichero suelto o registro `seg-NNNNNN.jsonl@offset`."""
+    parsed = parse_location(source)
+    if parsed is None:
+        for _, payload in iter_corrections([in_dir / source]):
+            return payload
+        return None
+    segment, offset = parsed
+    with open(in_dir / SEGMENTS_SUBDIR / segment, "rb") as fh:
+        fh.seek(offset)
+        try:
+            return json.loads(fh.readline())
+        except ValueError:
+            return None
+
+
+class Importer:
+    def __init__(self, in_dir=IN_DIR, out_dir=OUT_DIR, state=None, workers=1, verbose=False):
+        self.in_dir = Path(in_dir)
+        self.out_dir = Path(out_dir)
+        self.state = state or load_state()
+        self.workers = max(1, workers)
+        self.verbose = verbose
+        self.touched = set()  # debug_ids cuyo ganador hay que recalcular
+        self.fresh = {}       # fuente -> payload ya leído en esta pasada (como mucho FRESH_MAX)
+        self.changed = False
+        self.written = self.unchanged = 0
+        self.failed = []      # (entrada, error), como mucho los que informa LoadStats
+        self.skipped = 0
+
+    def _candidate(self, debug, source, ts, payload):
+        self.state["candidates"].setdefault(debug, {})[source] = ts
+        self.touched.add(debug)
+        # memoria acotada: por encima de FRESH_MAX el ganador se relee al escribir
+        if len(self.fresh) < FRESH_MAX:
+            self.fresh[source] = payload
+
+    def _drop_candidate(self, debug, source):
+        cands = self.state["candidates"].get(debug, {})
+        if cands.pop(source, None) is not None:
+            self.touched.add(debug)
+        if not cands:
+            self.state["candidates"].pop(debug, None)
+
+    def scan_files(self):
+        files = self.state["files"]
+        seen, stale = set(), []
+        if self.in_dir.is_dir():
+            for e in os.scandir(self.in_dir):
+                if not (e.name.endswith(".json") and e.is_file()):
+                    continue
+                seen.add(e.name)
+                st = e.stat()
+                known = files.get(e.name)
+                if not known or known[0] != st.st_size or known[1] != st.st_mtime_ns:
+                    stale.append((e.name, st.st_size, st.st_mtime_ns))
+        for name in [n for n in files if n not in seen]:
+            # la entrada ya no existe: deja de ser candidata (el ejemplo escrito se conserva)
+            self._drop_candidate(files.pop(name)[3], name)
+            self.changed = True
+        stale.sort()
+        sig = {name: (size, mtime_ns) for name, size, mtime_ns in stale}
+        stats = LoadStats()
+        paths = (self.in_dir / name for name, _, _ in stale)
+        for path, payload, data in iter_corrections(paths, workers=self.workers, stats=stats, raw=True):
+            name = os.path.basename(path)
+            if not isinstance(payload, dict):
+                self._skip(name, "not a JSON object")
+                continue
+            size, mtime_ns = sig[name]
+            digest = _digest(data)
+            known = files.get(name)
+            self.changed = True
+            if known and known[2] == digest:
+                known[0], known[1] = size, mtime_ns  # solo ha cambiado el mtime
+                continue
+            debug = payload.get("debug_id", "debug_unknown")
+            if known and known[3] != debug:
+                self._drop_candidate(known[3], name)
+            files[name] = [size, mtime_ns, digest, debug]
+            self._candidate(debug, name, payload_timestamp(payload), payload)
+        # ilegibles o JSON inválido: pueden estar a medio escribir; no se registran y se reintentan
+        self.failed.extend((os.path.basename(path), error) for path, error in stats.failed)
+        self.skipped += stats.errors
+
+    def _skip(self, source, error):
+        self.failed.append((source, error))
+        self.skipped += 1
+
+    def scan_segments(self):
+        offsets = self.state["segments"]
+        seg_dir = self.in_dir / SEGMENTS_SUBDIR
+        for loc, payload, seg, end in iter_segment_records(str(seg_dir), offsets):
+            offsets[seg] = end
+            self.changed = True
+            if not isinstance(payload, dict):
+                self._skip(loc, "invalid JSON")
+                continue
+            self._candidate(payload.get("debug_id", "debug_unknown"), loc, payload_timestamp(payload), payload)
+
+    def write_outputs(self):
+        outputs = self.state["outputs"]
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        for debug in sorted(self.touched):
+            cands = self.state["candidates"].get(debug)
+            if not cands:
+                continue
+            source = max(cands, key=lambda s: (cands[s], source_order(s)))
+            payload = self.fresh.get(source)
+            if payload is None:
+                payload = read_source(self.in_dir, source)
+                if payload is None:
+                    self._skip(source, "winner could not be read")
+                    continue
+            data = json.dumps(to_example(payload), ensure_ascii=False, indent=2).encode("utf-8")
+            digest = _digest(data)
+            outf = self.out_dir / f"{debug}.json"
+            if outputs.get(debug, [None, None])[1] == digest and outf.exists():
+                outputs[debug][0] = source
+                self.unchanged += 1
+                continue
+            tmp = outf.with_name(f".{outf.name}.tmp")
+            with open(tmp, "wb") as fh:
+                fh.write(data)
+            os.replace(tmp, outf)
+            outputs[debug] = [source, digest]
+            self.changed = True
+            self.written += 1
+            if self.verbose:
+                print("WROTE", outf)
+
+    def run(self):
+        self.scan_files()
+        self.scan_segments()
+        self.write_outputs()
+        if self.changed:
+            save_state(self.state)
+        return self.written
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Importa correcciones persistidas a learning_queue_from_corrections.")
+    ap.add_argument("--full", action="store_true", help="ignorar el estado y revisar todas las entradas")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="hilos de lectura")
+    ap.add_argument("--verbose", action="store_true", help="listar cada ejemplo escrito")
+    args = ap.parse_args(argv)
+
+    state = None if not args.full else {"version": STATE_VERSION, "files": {}, "segments": {},
+                                        "candidates": {}, "outputs": load_state()["outputs"]}
+    importer = Importer(state=state, workers=args.workers, verbose=args.verbose)
+    importer.run()
+    for f, e in importer.failed[:100]:
+        print("skip", f, e)
+    print("Imported", importer.written, "examples",
+          f"({importer.unchanged} unchanged, {importer.skipped} skipped)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
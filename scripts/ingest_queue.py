@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Cola de ingesta asíncrona para correcciones recibidas en bloque.
+
+Los endpoints validan y encolan; un hilo escritor agrupa lo que haya en la
+cola (hasta `batch_max` registros o `linger` segundos), lo escribe con un
+único `append_many` + fsync en el almacén y actualiza el índice SQLite. La
+cola es acotada: si no cabe un lote entero se rechaza para que el cliente
+reintente (backpressure).
+
+El cliente ya ha recibido 202 cuando se escribe, así que un fallo no puede
+perder el lote:
+ - almacén: se reintenta `INGEST_RETRIES` veces con espera exponencial; si
+   sigue fallando el lote se vuelca a `spill_dir/spill-*.jsonl` (NDJSON) y se
+   reinyecta al arrancar el escritor y tras la siguiente escritura correcta;
+ - índice: los registros ya están en el almacén, así que solo se guardan sus
+   filas pendientes y se reintentan con el lote siguiente (como mucho
+   `maxsize`; por encima, `corrections_index.py --rebuild`).
+Los contadores (`written`, `spilled`, `store_errors`, `index_errors`,
+`unindexed()`) se exportan como métricas y en /health.
+"""
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+INGEST_QUEUE_MAX = int(os.environ.get("INGEST_QUEUE_MAX", 50000))
+INGEST_BATCH_MAX = int(os.environ.get("INGEST_BATCH_MAX", 1000))
+INGEST_LINGER = float(os.environ.get("INGEST_LINGER", 0.05))
+INGEST_RETRIES = int(os.environ.get("INGEST_RETRIES", 4))
+INGEST_BACKOFF = float(os.environ.get("INGEST_BACKOFF", 0.1))
+
+
+class IngestQueue:
+    """Cola acotada con un hilo escritor por proceso."""
+
+    def __init__(self, store, index, row_for, spill_dir=None, maxsize=INGEST_QUEUE_MAX,
+                 batch_max=INGEST_BATCH_MAX, linger=INGEST_LINGER, retries=INGEST_RETRIES, backoff=INGEST_BACKOFF):
+        self.store = store
+        self.index = index
+        self.row_for = row_for
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.maxsize = maxsize
+        self.batch_max = batch_max
+        self.linger = linger
+        self.retries = retries
+        self.backoff = backoff
+        self.written = 0
+        self.spilled = 0
+        self.store_errors = 0
+        self.index_errors = 0
+        self._unindexed = []  # filas de registros ya escritos que el índice no aceptó
+        self._has_spills = True  # al arrancar se mira si hay volcados de otra ejecución
+        self._q = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        atexit.register(self.drain)
+
+    def _ensure_writer(self):
+        # gunicorn hace fork después de importar la app: el hilo se arranca en cada worker
+        if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+            self._thread.start()
+
+    def depth(self):
+        return self._q.qsize()
+
+    def unindexed(self):
+        return len(self._unindexed)
+
+    def stats(self):
+        return {"written": self.written, "spilled": self.spilled, "store_errors": self.store_errors,
+                "index_errors": self.index_errors, "unindexed": self.unindexed()}
+
+    def submit(self, payloads):
+        """Encola todos los payloads o ninguno; devuelve False si la cola no tiene sitio."""
+        with self._lock:
+            self._ensure_writer()
+            if self.maxsize - self._q.qsize() < len(payloads):
+                return False
+            for p in payloads:
+                self._q.put_nowait(p)
+        return True
+
+    def _take_batch(self):
+        batch = [self._q.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_max:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._q.get(timeout=timeout) if timeout > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _retry(self, fn, counter):
+        """Llama a `fn` hasta `retries` veces con espera exponencial; propaga el último error."""
+        for attempt in range(self.retries):
+            try:
+                return fn()
+            except Exception:
+                setattr(self, counter, getattr(self, counter) + 1)
+                traceback.print_exc(file=sys.stderr)
+                if attempt == self.retries - 1:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _store(self, batch):
+        written = self.store.append_many(batch)
+        self.store.flush()
+        return written
+
+    def _index_rows(self, rows):
+        pending = self._unindexed + rows
+        try:
+            self._retry(lambda: self.index.add(pending), "index_errors")
+            self._unindexed = []
+        except Exception:
+            self._unindexed = pending[-self.maxsize:]
+
+    def _write(self, batch):
+        """Escribe un lote; devuelve False si el almacén no lo aceptó y se ha volcado."""
+        try:
+            written = self._retry(lambda: self._store(batch), "store_errors")
+        except Exception:
+            self._spill(batch)
+            return False
+        self.written += len(batch)
+        now = time.time()
+        self._index_rows([self.row_for(p, loc, size, now) for p, (loc, size) in zip(batch, written)])
+        return True
+
+    def _spill(self, batch):
+        if self.spill_dir is None:
+            print(f"ingest: {len(batch)} correcciones perdidas (sin spill_dir)", file=sys.stderr)
+            return
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        path = self.spill_dir / f"spill-{os.getpid()}-{time.time_ns()}.jsonl"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.writelines(json.dumps(p, ensure_ascii=False) + "\n" for p in batch)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        self.spilled += len(batch)
+        self._has_spills = True
+        print(f"ingest: lote de {len(batch)} volcado a {path}", file=sys.stderr)
+
+    def _replay_spills(self):
+        """Reinyecta los volcados; se llama al arrancar y cuando el almacén vuelve a escribir."""
+        self._has_spills = False
+        if self.spill_dir is None or not self.spill_dir.is_dir():
+            return
+        for path in sorted(self.spill_dir.glob("spill-*.jsonl")):
+            claimed = path.with_suffix(".replay")
+            try:
+                # rename atómico: un solo worker reinyecta cada volcado
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, encoding="utf-8") as fh:
+                batch = [json.loads(line) for line in fh if line.strip()]
+            ok = self._write(batch)
+            # si ha fallado, _write ya lo ha vuelto a volcar con otro nombre
+            os.remove(claimed)
+            if not ok:
+                return
+
+    def _run(self):
+        replay = True
+        while True:
+            if replay and self._has_spills:
+                try:
+                    self._replay_spills()
+                except Exception:
+                    traceback.print_exc(file=sys.stderr)
+            batch = self._take_batch()
+            try:
+                replay = self._write(batch)
+            except Exception:
+                # ni siquiera se pudo volcar: queda en el log, sin parar el escritor
+                replay = False
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._q.task_done()
+
+    def drain(self, timeout=30.0):
+        """Espera a que el escritor vacíe la cola (al salir del proceso)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._q.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
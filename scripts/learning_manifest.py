@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Manifest de aprendizaje (`learning_manifest.csv`) mantenido de forma incremental.
+
+Cada fila se cachea por fichero con su (mtime, tamaño); solo se vuelven a
+parsear los JSON nuevos o modificados. Los segmentos del almacén de
+correcciones se cachean por segmento y se lee únicamente su cola nueva. Si
+nada ha cambiado y el CSV ya existe, no se reescribe.
+
+Usage: run from project root:
+    python3 scripts/learning_manifest.py [--source learning_queue|persisted]
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_loader import iter_corrections
+from scripts.corrections_store import OUT_DIR, SEGMENTS_SUBDIR, iter_segment_records, list_segments
+
+LQ_DIR = Path("artifacts_device/learning_queue_from_corrections")
+MANIFEST_PATH = Path("artifacts_device/learning_manifest.csv")
+CACHE_DIR = Path("artifacts_device/.manifest_cache")
+HEADER = ["debug_file", "template_id", "n_productos", "path"]
+
+
+def learning_queue_row(f, j):
+    debug = j.get("debug_file")
+    tpl = j.get("template_id")
+    prod_count = len(j.get("form", {}).get("productos", []))
+    return [debug, tpl, prod_count, f]
+
+
+def persisted_row(f, j):
+    debug = j.get("debug_id", Path(f).stem)
+    tpl = j.get("template_id") or j.get("nif") or ""
+    prod_count = len(j.get("productos", []))
+    return [debug, tpl, prod_count, f]
+
+
+def _cache_path(src_dir):
+    return CACHE_DIR / (str(src_dir).strip("/").replace("/", "__") + ".json")
+
+
+def _load_cache(path):
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {"files": {}, "segments": {}}
+
+
+def _save_cache(path, cache):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(cache, fh, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def manifest_rows(src_dir, to_row, cache_path=None):
+    """Devuelve (filas, cambiado) usando la caché de `cache_path`."""
+    src_dir = str(src_dir)
+    cache_path = Path(cache_path or _cache_path(src_dir))
+    cache = _load_cache(cache_path)
+    old_files, old_segs = cache.get("files", {}), cache.get("segments", {})
+
+    files, stale = {}, {}
+    if os.path.isdir(src_dir):
+        for e in os.scandir(src_dir):
+            if not (e.name.endswith(".json") and e.is_file()):
+                continue
+            st = e.stat()
+            hit = old_files.get(e.name)
+            if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+                files[e.name] = hit
+            else:
+                stale[os.path.join(src_dir, e.name)] = (st.st_mtime_ns, st.st_size)
+    for path, j in iter_corrections(sorted(stale), workers=4):
+        mtime_ns, size = stale[path]
+        files[os.path.basename(path)] = [mtime_ns, size, to_row(path, j)]
+    changed = bool(stale) or len(files) != len(old_files)
+
+    # segmentos append-only: [bytes consumidos, filas]; solo se lee lo añadido
+    seg_dir = os.path.join(src_dir, SEGMENTS_SUBDIR)
+    segs = {}
+    for name in list_segments(seg_dir):
+        end, rows = old_segs.get(name, [0, []])
+        if os.path.getsize(os.path.join(seg_dir, name)) != end:
+            rows = list(rows)
+            for loc, payload, _, rec_end in iter_segment_records(seg_dir, {name: end}, [name]):
+                if payload is not None:
+                    rows.append(to_row(os.path.join(seg_dir, loc), payload))
+                end = rec_end
+            changed = True
+        segs[name] = [end, rows]
+    changed = changed or len(segs) != len(old_segs)
+
+    if changed:
+        _save_cache(cache_path, {"files": files, "segments": segs})
+    rows = [files[n][2] for n in sorted(files)]
+    for name in sorted(segs):
+        rows.extend(segs[name][1])
+    return rows, changed
+
+
+def write_manifest(src_dir, to_row, out_manifest=MANIFEST_PATH, cache_path=None):
+    """Regenera el CSV solo si cambió algo; devuelve el número de filas."""
+    cache_path = Path(cache_path or _cache_path(src_dir))
+    rows, changed = manifest_rows(src_dir, to_row, cache_path)
+    out_manifest = Path(out_manifest)
+    # el sello evita dar por bueno un CSV que otro origen ha sobrescrito después
+    stamp = cache_path.with_suffix(".stamp")
+    current = f"{out_manifest}|{out_manifest.stat().st_mtime_ns}" if out_manifest.exists() else ""
+    if changed or not current or not stamp.exists() or stamp.read_text() != current:
+        tmp = out_manifest.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8', newline='') as fh:
+            w = csv.writer(fh)
+            w.writerow(HEADER)
+            w.writerows(rows)
+        os.replace(tmp, out_manifest)
+        stamp.parent.mkdir(parents=True, exist_ok=True)
+        stamp.write_text(f"{out_manifest}|{out_manifest.stat().st_mtime_ns}")
+    return len(rows)
+
+
+def default_source():
+    """learning_queue_from_corrections si existe y tiene ejemplos; si no, las correcciones persistidas."""
+    if LQ_DIR.exists() and any(LQ_DIR.glob("*.json")):
+        return LQ_DIR, learning_queue_row
+    return OUT_DIR, persisted_row
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Regenera learning_manifest.csv de forma incremental.")
+    ap.add_argument("--source", choices=["learning_queue", "persisted"], default=None)
+    args = ap.parse_args()
+    if args.source == "learning_queue":
+        src, to_row = LQ_DIR, learning_queue_row
+    elif args.source == "persisted":
+        src, to_row = OUT_DIR, persisted_row
+    else:
+        src, to_row = default_source()
+    n = write_manifest(src, to_row)
+    print(MANIFEST_PATH, n)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Analizador de volcados de logcat (p. ej. `live_app_log.txt`, `logs_nuevo.txt`) para tiempos de OCR/pipeline.
+
+El fichero se abre con mmap y nunca se carga entero:
+
+ 1. una pasada rápida (búsqueda de literales) localiza los pids de la app
+    (`Start proc N:com.albacontrol`, etiqueta `com.albacontrol`);
+ 2. el fichero se parte en rangos alineados a línea que se analizan en
+    paralelo con patrones precompilados (formatos `time`, `brief` y
+    `threadtime`). De cada línea de la app (pid de la app o que menciona el
+    paquete) se guarda una fila en columnas `array` (timestamp, pid, etiqueta,
+    nivel, offset del mensaje en el fichero) y las duraciones que contenga:
+    `took 199ms`, `spent 680 ms`, `time=244ms`, `idle(3003ms)`, `0.285 seconds`
+    y los campos numéricos de `InstallationTiming`;
+ 3. con esa tabla se calculan percentiles de latencia por (etiqueta, medida) y
+    una serie temporal por intervalo (líneas, avisos/errores, duraciones).
+
+Usage: run from project root:
+    python3 scripts/logcat_analyzer.py live_app_log.txt [logs_nuevo.txt ...] [--workers N] [--bucket 60]
+        [--json report.json] [--csv tabla.csv]
+"""
+import argparse
+import calendar
+import csv
+import json
+import mmap
+import os
+import re
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+PACKAGE = "com.albacontrol"
+BUCKET = 60
+CHUNK_MIN = 8 << 20  # por debajo no compensa repartir el fichero entre procesos
+
+# MM-DD HH:MM:SS.mmm  pid  tid L Tag: mensaje
+_THREADTIME_RE = re.compile(rb"(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)\.(\d{3})\s+(\d+)\s+\d+ ([VDIWEFA]) (.*?)\s*: ")
+# [MM-DD HH:MM:SS.mmm ]L/Tag( pid): mensaje  (la etiqueta puede llevar paréntesis: SmartPower.x/10217(23381))
+_TIME_RE = re.compile(rb"(?:(\d\d)-(\d\d) (\d\d):(\d\d):(\d\d)\.(\d{3}) )?([VDIWEFA])/(.*?)\(\s*(\d+)\): ")
+# primero el número con unidad y después, solo en los bytes previos, la medida: `time=`, `idle(`,
+# `onStart took `, `spent `... (una medida opcional delante del número haría el patrón cuadrático)
+_DURATION_RE = re.compile(rb"(?<![\w.])(\d+(?:\.\d+)?) ?(ms|seconds|s)\b")
+_LABEL_RE = re.compile(rb"(?:([A-Za-z_][\w>-]*)[=(]|([A-Za-z_]\w*) took |\b(took|spent|[Ww]aited|latency) )\+?$")
+_LABEL_WINDOW = 48
+_INSTALLATION_TAG = b"InstallationTiming"
+
+
+class LogTable:
+    """Filas de logcat en columnas; las etiquetas y las medidas van codificadas como índices."""
+
+    def __init__(self):
+        self.file = array("H")
+        self.ts = array("d")       # epoch (año de --year); NaN si la línea no lleva hora
+        self.pid = array("i")
+        self.tag = array("I")
+        self.level = array("B")
+        self.offset = array("q")   # inicio del mensaje en el fichero
+        self.tags, self._tag_ids = [], {}
+        # duraciones: fila, medida y milisegundos
+        self.d_row = array("I")
+        self.d_label = array("I")
+        self.d_ms = array("d")
+        self.labels, self._label_ids = [], {}
+
+    def __len__(self):
+        return len(self.ts)
+
+    def _code(self, value, values, ids):
+        code = ids.get(value)
+        if code is None:
+            code = ids[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, file, ts, pid, tag, level, offset):
+        self.file.append(file)
+        self.ts.append(ts)
+        self.pid.append(pid)
+        self.tag.append(self._code(tag, self.tags, self._tag_ids))
+        self.level.append(level)
+        self.offset.append(offset)
+        return len(self.ts) - 1
+
+    def add_duration(self, row, label, ms):
+        self.d_row.append(row)
+        self.d_label.append(self._code(label, self.labels, self._label_ids))
+        self.d_ms.append(ms)
+
+    def extend(self, other):
+        """Añade las filas de otra tabla (p. ej. la de otro rango) recodificando etiquetas y medidas."""
+        base = len(self)
+        tag_map = array("I", (self._code(t, self.tags, self._tag_ids) for t in other.tags))
+        label_map = array("I", (self._code(lb, self.labels, self._label_ids) for lb in other.labels))
+        for name in ("file", "ts", "pid", "level", "offset", "d_ms"):
+            getattr(self, name).extend(getattr(other, name))
+        self.tag.extend(tag_map[t] for t in other.tag)
+        self.d_row.extend(r + base for r in other.d_row)
+        self.d_label.extend(label_map[lb] for lb in other.d_label)
+
+
+def find_app_pids(mm, package=PACKAGE):
+    """Pids de la app: `Start proc N:paquete` y líneas con la etiqueta `paquete`."""
+    pkg = re.escape(package.encode())
+    pids = {int(m.group(1)) for m in re.finditer(rb"Start proc (\d+):" + pkg + rb"[/ ]", mm)}
+    pids.update(int(m.group(1)) for m in re.finditer(rb"/" + pkg + rb"\s*\(\s*(\d+)\): ", mm))
+    return pids
+
+
+def chunk_ranges(mm, parts):
+    """Rangos [inicio, fin) que empiezan y acaban en un salto de línea."""
+    size = len(mm)
+    step = max(CHUNK_MIN, size // max(1, parts) + 1)
+    ranges, start = [], 0
+    while start < size:
+        end = mm.find(b"\n", min(size, start + step))
+        end = size if end == -1 else end + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+def _durations(message, tag):
+    if tag == _INSTALLATION_TAG:
+        # paquete|null|n1|n2|...: cada posición numérica es una medida
+        for i, part in enumerate(message.split(b"|")[2:], start=1):
+            if part.strip().isdigit():
+                yield f"#{i}", float(part)
+        return
+    for m in _DURATION_RE.finditer(message):
+        start = m.start()
+        lm = _LABEL_RE.search(message, max(0, start - _LABEL_WINDOW), start)
+        label = (lm.group(1) or lm.group(2) or lm.group(3)).decode("ascii", "replace") if lm else "duration"
+        value = float(m.group(1))
+        yield label, value if m.group(2) == b"ms" else value * 1000
+
+
+def parse_range(path, start, end, file_index=0, package=PACKAGE, pids=(), year=None):
+    """Tabla con las líneas de la app en [start, end) de `path`."""
+    table = LogTable()
+    pkg = package.encode()
+    pids = set(pids)
+    days = {}
+    year = year or time.localtime().tm_year
+    nan = float("nan")
+    with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mm.seek(start)
+        pos = start
+        readline, threadtime, brief = mm.readline, _THREADTIME_RE.match, _TIME_RE.match
+        while pos < end:
+            line = readline()
+            if not line:
+                break
+            line_start, pos = pos, pos + len(line)
+            m = brief(line)
+            if m:
+                mon, day, hh, mi, ss, msec, level, tag, pid = m.groups()
+            else:
+                m = threadtime(line)
+                if not m:
+                    continue  # continuaciones y líneas que no son de logcat
+                mon, day, hh, mi, ss, msec, pid, level, tag = m.groups()
+            pid = int(pid)
+            if pid not in pids and pkg not in line:
+                continue
+            message = line[m.end():].rstrip(b"\r\n")
+            if mon is None:
+                ts = nan
+            else:
+                midnight = days.get((mon, day))
+                if midnight is None:
+                    midnight = days[(mon, day)] = calendar.timegm((year, int(mon), int(day), 0, 0, 0))
+                ts = midnight + int(hh) * 3600 + int(mi) * 60 + int(ss) + int(msec) / 1000
+            tag = tag.strip()
+            row = table.add(file_index, ts, pid, tag.decode("utf-8", "replace"), level[0], line_start + m.end())
+            for label, ms in _durations(message, tag):
+                table.add_duration(row, label, ms)
+    return table
+
+
+def analyze(paths, package=PACKAGE, workers=1, year=None):
+    """Tabla de todas las líneas de la app en `paths`, analizando cada fichero por rangos en paralelo."""
+    table = LogTable()
+    jobs = []
+    for i, path in enumerate(paths):
+        with open(path, "rb") as fh:
+            if os.fstat(fh.fileno()).st_size == 0:
+                continue
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pids = find_app_pids(mm, package)
+                jobs.extend((path, s, e, i, package, pids, year) for s, e in chunk_ranges(mm, workers))
+    if workers <= 1 or len(jobs) == 1:
+        parts = (parse_range(*job) for job in jobs)
+        for part in parts:
+            table.extend(part)
+        return table
+    with ProcessPoolExecutor(workers) as pool:
+        # en orden: las filas quedan como en el fichero
+        for part in pool.map(parse_range, *zip(*jobs)):
+            table.extend(part)
+    return table
+
+
+def _pick(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_stats(table):
+    """{(etiqueta, medida): {n, p50, p95, p99, max, mean}} en ms."""
+    groups = {}
+    for row, label, ms in zip(table.d_row, table.d_label, table.d_ms):
+        groups.setdefault((table.tag[row], label), []).append(ms)
+    stats = {}
+    for (tag, label), values in groups.items():
+        values.sort()
+        stats[(table.tags[tag], table.labels[label])] = {
+            "n": len(values), "p50": _pick(values, 0.50), "p95": _pick(values, 0.95),
+            "p99": _pick(values, 0.99), "max": values[-1], "mean": round(sum(values) / len(values), 3)}
+    return stats
+
+
+def time_series(table, bucket=BUCKET):
+    """{inicio del intervalo: {lines, warnings, errors, durations, total_ms}} (solo filas con hora)."""
+    series = {}
+    for ts, level in zip(table.ts, table.level):
+        if ts != ts:  # NaN
+            continue
+        b = series.setdefault(int(ts // bucket * bucket), {"lines": 0, "warnings": 0, "errors": 0,
+                                                           "durations": 0, "total_ms": 0.0})
+        b["lines"] += 1
+        if level == ord("W"):
+            b["warnings"] += 1
+        elif level in (ord("E"), ord("F"), ord("A")):
+            b["errors"] += 1
+    for row, ms in zip(table.d_row, table.d_ms):
+        ts = table.ts[row]
+        if ts == ts:
+            b = series[int(ts // bucket * bucket)]
+            b["durations"] += 1
+            b["total_ms"] += ms
+    return dict(sorted(series.items()))
+
+
+def _fmt_ts(ts):
+    return time.strftime("%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+def write_csv(table, paths, out):
+    """Tabla completa: una fila por duración (o por línea si no tiene), con el mensaje leído del fichero."""
+    durations = {}
+    for row, label, ms in zip(table.d_row, table.d_label, table.d_ms):
+        durations.setdefault(row, []).append((table.labels[label], ms))
+    maps = []
+    try:
+        for path in paths:
+            fh = open(path, "rb")
+            maps.append((fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(fh.fileno()).st_size
+                         else b""))
+        with open(out, "w", newline="", encoding="utf-8") as fh:
+            w = csv.writer(fh)
+            w.writerow(["file", "timestamp", "pid", "tag", "level", "measure", "ms", "message"])
+            for i in range(len(table)):
+                mm = maps[table.file[i]][1]
+                off = table.offset[i]
+                end = mm.find(b"\n", off)
+                message = mm[off:end if end != -1 else len(mm)].rstrip(b"\r").decode("utf-8", "replace")
+                ts = table.ts[i]
+                base = [paths[table.file[i]], _fmt_ts(ts) if ts == ts else "", table.pid[i],
+                        table.tags[table.tag[i]], chr(table.level[i])]
+                for label, ms in durations.get(i, [("", "")]):
+                    w.writerow(base + [label, ms, message])
+    finally:
+        for fh, mm in maps:
+            if isinstance(mm, mmap.mmap):
+                mm.close()
+            fh.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("paths", nargs="+", help="volcados de logcat")
+    ap.add_argument("--package", default=PACKAGE)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="procesos de análisis")
+    ap.add_argument("--bucket", type=int, default=BUCKET, help="segundos por intervalo de la serie temporal")
+    ap.add_argument("--year", type=int, help="año de los timestamps (logcat no lo incluye; por defecto el actual)")
+    ap.add_argument("--top", type=int, default=30, help="medidas a listar en el informe")
+    ap.add_argument("--json", help="escribe el informe completo en este fichero JSON")
+    ap.add_argument("--csv", help="exporta la tabla de filas de la app a CSV")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    size = sum(os.path.getsize(p) for p in args.paths)
+    table = analyze(args.paths, args.package, args.workers, args.year)
+    stats = latency_stats(table)
+    series = time_series(table, args.bucket)
+    elapsed = time.perf_counter() - t0
+
+    print(f"{len(table)} líneas de {args.package}, {len(table.d_ms)} duraciones "
+          f"({size / 1e6:.1f} MB en {elapsed:.2f}s)")
+    print(f"\n{'etiqueta':<40} {'medida':<20} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    top = sorted(stats.items(), key=lambda kv: (-kv[1]["n"], kv[0]))[:args.top]
+    for (tag, label), s in top:
+        print(f"{tag[:40]:<40} {label[:20]:<20} {s['n']:>6} {s['p50']:>9.1f} {s['p95']:>9.1f} "
+              f"{s['p99']:>9.1f} {s['max']:>9.1f}")
+    if series:
+        print(f"\n{'intervalo':<15} {'líneas':>7} {'avisos':>7} {'errores':>7} {'duraciones':>10} {'ms medios':>10}")
+        for start, b in series.items():
+            mean = b["total_ms"] / b["durations"] if b["durations"] else 0
+            print(f"{_fmt_ts(start):<15} {b['lines']:>7} {b['warnings']:>7} {b['errors']:>7} "
+                  f"{b['durations']:>10} {mean:>10.1f}")
+
+    if args.json:
+        report = {"files": args.paths, "package": args.package, "lines": len(table),
+                  "durations": len(table.d_ms), "seconds": round(elapsed, 3),
+                  "latency": [{"tag": t, "measure": lb, **s} for (t, lb), s in sorted(stats.items())],
+                  "series": [{"start": _fmt_ts(k), "epoch": k, **b} for k, b in series.items()]}
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, ensure_ascii=False, indent=1)
+    if args.csv:
+        write_csv(table, args.paths, args.csv)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Migra las correcciones sueltas (`{debug_id}_corr_{ts}.json`) al almacén por segmentos.
+
+Los ficheros se añaden en orden de mtime (conservándolo como marca de tiempo del
+índice) y después se mueven a `persisted_corrections/_migrated/`, o se borran con
+`--delete`. El índice SQLite de la API se actualiza en el mismo paso (la fila
+del fichero suelto se sustituye por la del segmento). Tras migrar, regenerar
+plantillas con `generate_template.py --full` para que no se cuenten dos veces.
+
+Usage: run from project root:
+    python3 scripts/migrate_corrections.py [--batch 500] [--delete] [--dry-run]
+    python3 scripts/migrate_corrections.py --reindex   # reconstruye segments/index.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_index import open_index, persist
+from scripts.corrections_store import OUT_DIR, SegmentStore
+
+MIGRATED_SUBDIR = "_migrated"
+
+
+def migrate(root=OUT_DIR, batch=500, delete=False, dry_run=False):
+    root = Path(root)
+    files = sorted((e for e in os.scandir(root) if e.name.endswith(".json") and e.is_file()),
+                   key=lambda e: (e.stat().st_mtime, e.name))
+    print(f"{len(files)} ficheros a migrar")
+    if dry_run or not files:
+        return 0
+    store = SegmentStore(root)
+    index = open_index(root)
+    done_dir = root / MIGRATED_SUBDIR
+    if not delete:
+        done_dir.mkdir(exist_ok=True)
+    migrated = skipped = 0
+    for i in range(0, len(files), batch):
+        done = []
+        for entry in files[i:i + batch]:
+            try:
+                with open(entry.path, encoding="utf-8") as fh:
+                    payload = json.load(fh)
+            except (OSError, ValueError) as e:
+                # los ilegibles se quedan donde están para revisarlos a mano
+                print("skip", entry.path, e)
+                skipped += 1
+                continue
+            persist(store, index, payload, ts=entry.stat().st_mtime)
+            done.append(entry)
+            migrated += 1
+        store.flush()
+        # solo se retiran los originales cuando el lote ya está en disco
+        for entry in done:
+            if delete:
+                os.remove(entry.path)
+            else:
+                os.replace(entry.path, done_dir / entry.name)
+        # las filas apuntaban al fichero suelto (con la ruta tal como se listó)
+        index.remove({p for entry in done for p in (entry.path, str(root / entry.name))})
+        print(f" - {migrated} migradas")
+    print(f"Migradas {migrated}, omitidas {skipped}")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Migra correcciones sueltas al almacén por segmentos.")
+    ap.add_argument("--root", default=str(OUT_DIR))
+    ap.add_argument("--batch", type=int, default=500)
+    ap.add_argument("--delete", action="store_true", help="borrar los originales en lugar de moverlos")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--reindex", action="store_true", help="solo reconstruir el índice de segmentos")
+    args = ap.parse_args()
+    if args.reindex:
+        SegmentStore(args.root).rebuild_index()
+        print("Índice reconstruido")
+        return 0
+    return migrate(args.root, args.batch, args.delete, args.dry_run)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Esquema declarativo del payload de corrección y su validador compilado.
+
+`CORRECTION_SCHEMA` describe las reglas de README_persistencia.md como datos;
+`compile_schema` lo convierte una sola vez en closures anidados que recorren
+el payload en una pasada, aplican las normalizaciones (nif, proveedor) y
+acumulan todos los errores con su ruta JSON (`$.productos[3].unidades`).
+`is_number` acepta lo mismo que `float()` para valores JSON, con expresiones
+precompiladas y sin excepciones. `is_date` acepta lo mismo que
+`datetime.fromisoformat` (Python 3.11) o `strptime("%d/%m/%Y")`: las formas
+habituales se resuelven con una regex y el resto se delega en ellas.
+"""
+import re
+from datetime import datetime
+
+_NIF_STRIP = re.compile(r'[^A-Za-z0-9]')
+_NUMBER = re.compile(
+    r'\s*[+-]?(?:'
+    r'(?:\d+(?:_\d+)*(?:\.(?:\d+(?:_\d+)*)?)?|\.\d+(?:_\d+)*)(?:[eE][+-]?\d+(?:_\d+)*)?'
+    r'|(?i:inf|infinity|nan))\s*\Z')
+# formas habituales que fromisoformat siempre acepta si los campos están en rango:
+# YYYY-MM-DD y, opcionalmente, hora con segundos, fracción (3 o 6 cifras) y zona ±HH:MM
+_ISO_COMMON = re.compile(
+    r"([0-9]{4})-([0-9]{2})-([0-9]{2})"
+    r"(?:[T ]([0-9]{2}):([0-9]{2})(?::([0-9]{2})(?:\.[0-9]{3}(?:[0-9]{3})?)?)?"
+    r"(?:Z|[+-]([0-9]{2}):([0-9]{2}))?)?\Z")
+_DMY_DATE = re.compile(r"([0-9]{1,2})/([0-9]{1,2})/([0-9]{4})\Z")
+_MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def normalize_nif(nif):
+    if not nif:
+        return ""
+    return _NIF_STRIP.sub('', str(nif)).upper()
+
+
+def _valid_day(y, m, d):
+    if not (1 <= m <= 12 and d >= 1):
+        return False
+    if m == 2 and y % 4 == 0 and (y % 100 != 0 or y % 400 == 0):
+        return d <= 29
+    return d <= _MONTH_DAYS[m]
+
+
+def _fast_date(s):
+    # True solo si seguro que la fecha es válida; si no, decide el parser de datetime
+    m = _ISO_COMMON.match(s)
+    if m:
+        y, mo, d, hh, mi, ss, tzh, tzm = m.groups()
+        return (y != "0000" and _valid_day(int(y), int(mo), int(d))
+                and (hh is None or (hh < "24" and mi < "60" and (ss is None or ss < "60")))
+                and (tzh is None or (tzh < "24" and tzm < "60")))
+    m = _DMY_DATE.match(s)
+    if m:
+        d, mo, y = (int(g) for g in m.groups())
+        return y > 0 and _valid_day(y, mo, d)
+    return False
+
+
+def is_date(s):
+    """ISO (YYYY-MM-DD o ISO completo) o dd/mm/YYYY, como `valid_iso_date`."""
+    if not isinstance(s, str):
+        return False
+    if _fast_date(s):
+        return True
+    try:
+        datetime.fromisoformat(s)
+        return True
+    except ValueError:
+        pass
+    try:
+        datetime.strptime(s, "%d/%m/%Y")
+        return True
+    except ValueError:
+        return False
+
+
+def is_number(v):
+    """Lo mismo que acepta `float(v)` para valores JSON; las cadenas, sin excepciones."""
+    t = type(v)
+    if t is str:
+        # caso habitual ("12", "3.95") sin regex; el resto (signo, exponente...) con _NUMBER
+        return v.replace(".", "", 1).isdecimal() or _NUMBER.match(v) is not None
+    if t is float or t is bool:
+        return True
+    if t is int:
+        # solo un entero enorme desborda float(); los habituales no llegan a llamarlo
+        if -(1 << 1023) < v < (1 << 1023):
+            return True
+        try:
+            float(v)
+            return True
+        except OverflowError:
+            return False
+    return False
+
+
+FORMATS = {"date": is_date, "number": is_number}
+TRANSFORMS = {"nif": normalize_nif, "strip": lambda v: str(v).strip()}
+
+# `when`: la propiedad se evalúa si es verdadera (truthy), si la clave existe
+# (present, por defecto) o si no es None (not_none)
+CORRECTION_SCHEMA = {
+    "type": "object",
+    "message": "payload must be a JSON object",
+    "required": {"debug_id": "missing debug_id"},
+    "required_any": [(("template_id", "nif"), "missing template_id or nif")],
+    "properties": {
+        "nif": {"when": "truthy", "transform": "nif"},
+        "proveedor": {"when": "truthy", "transform": "strip"},
+        "fecha_albaran": {"when": "truthy", "format": "date",
+                          "message": "fecha_albaran must be ISO date YYYY-MM-DD or ISO format"},
+        "productos": {
+            "when": "not_none", "type": "array", "message": "productos must be a list",
+            "items": {
+                "type": "object", "message": "producto at index {i} must be an object",
+                "required": {"descripcion": "producto at index {i} missing descripcion"},
+                "properties": {
+                    "unidades": {"when": "present", "format": "number",
+                                 "message": "producto at index {i} unidades must be numeric"},
+                    "precio_unitario": {"when": "present", "format": "number",
+                                        "message": "producto at index {i} precio_unitario must be numeric"},
+                },
+            },
+        },
+    },
+}
+
+
+def _root_path(rel, i):
+    return "$" + rel
+
+
+def _node(schema, rel):
+    """`check(value, at, i, errors)` de un nodo, o None si no hay nada que comprobar.
+
+    `rel` es la ruta del nodo desde el elemento de lista más cercano, `i` el
+    índice de ese elemento y `at(rel, i)` la ruta completa: la ruta y el
+    mensaje (que puede usar `{i}`) solo se construyen en la rama de error.
+    """
+    kind = schema.get("type")
+    message = schema.get("message", "invalid value")
+
+    def fail(errors, at, i):
+        errors.append({"path": at(rel, i), "message": message.format(i=i)})
+
+    if kind == "object":
+        required = [(key, msg, f"{rel}.{key}") for key, msg in schema.get("required", {}).items()]
+        required_any = [(keys, msg) for keys, msg in schema.get("required_any", [])]
+        numbers, props = [], []
+        for key, sub in schema.get("properties", {}).items():
+            path, msg = f"{rel}.{key}", sub.get("message", "invalid value")
+            if (sub.get("format") == "number" and sub.get("when", "present") == "present"
+                    and "type" not in sub and "transform" not in sub):
+                numbers.append((key, path, msg))
+            else:
+                props.append((key, sub.get("when", "present"), _node(sub, path),
+                              TRANSFORMS.get(sub.get("transform"))))
+        match = _NUMBER.match
+
+        def check(value, at, i, errors):
+            if not isinstance(value, dict):
+                fail(errors, at, i)
+                return
+            for key, msg, path in required:
+                if not value.get(key):
+                    errors.append({"path": at(path, i), "message": msg.format(i=i)})
+            if required_any:
+                for keys, msg in required_any:
+                    if not any(value.get(k) for k in keys):
+                        errors.append({"path": at(rel, i), "message": msg.format(i=i)})
+            # números (unidades, precio_unitario) en línea: el caso habitual sin llamadas ni excepciones
+            for key, path, msg in numbers:
+                if key in value:
+                    v = value[key]
+                    if type(v) is str:
+                        if v.replace(".", "", 1).isdecimal() or match(v):
+                            continue
+                    elif type(v) is float or is_number(v):
+                        continue
+                    errors.append({"path": at(path, i), "message": msg.format(i=i)})
+            # `when`: truthy, present (por defecto) o not_none; la transformación va después
+            if not props:
+                return
+            for key, when, sub, transform in props:
+                if when == "present":
+                    if key not in value:
+                        continue
+                    child = value[key]
+                else:
+                    child = value.get(key)
+                    if (not child) if when == "truthy" else child is None:
+                        continue
+                if sub:
+                    sub(child, at, i, errors)
+                if transform:
+                    value[key] = transform(child)
+        return check
+    if kind == "array":
+        item = _node(schema["items"], "") if "items" in schema else None
+
+        def check(value, at, i, errors):
+            if not isinstance(value, list):
+                fail(errors, at, i)
+            elif item:
+                def item_at(p, n):
+                    return at(f"{rel}[{n}]{p}", i)
+                for n, v in enumerate(value):
+                    item(v, item_at, n, errors)
+        return check
+    if schema.get("format") == "number":
+        match = _NUMBER.match
+
+        def check(value, at, i, errors):
+            # caso habitual ("12", "3.95", floats) sin más llamadas ni excepciones
+            if type(value) is str:
+                if not (value.replace(".", "", 1).isdecimal() or match(value)):
+                    fail(errors, at, i)
+            elif type(value) is not float and not is_number(value):
+                fail(errors, at, i)
+        return check
+    if "format" in schema:
+        valid = FORMATS[schema["format"]]
+
+        def check(value, at, i, errors):
+            if not valid(value):
+                fail(errors, at, i)
+        return check
+    return None
+
+
+def compile_schema(schema):
+    """Compila `schema` una sola vez en `check(value) -> (value, errors)`.
+
+    Cada nodo del esquema se resuelve al compilar en un closure con sus
+    reglas ya preparadas; validar es solo llamarlos. Las transformaciones se
+    aplican in situ sobre el payload.
+    """
+    root = _node(schema, "")
+
+    def check(value):
+        errors = []
+        if root:
+            root(value, _root_path, None, errors)
+        return value, errors
+    return check
+
+
+_CHECK_CORRECTION = compile_schema(CORRECTION_SCHEMA)
+
+
+# (payload normalizado, [errores]) en una sola pasada; lista vacía si es válido
+validate_correction = _CHECK_CORRECTION
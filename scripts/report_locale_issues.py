@@ -1,87 +1,257 @@
 #!/usr/bin/env python3
+"""
+Informe de problemas de los locales desactivados en `app/src/main/res_disabled_locales/`.
+
+Para cada `values*/strings.xml` se hace una sola pasada con una expresión
+regular combinada (`_ISSUE_RE`) sobre el fichero entero; el número de línea se
+calcula a partir de la posición de cada coincidencia, con los mismos saltos de
+línea que `str.splitlines` (`_LINE_BREAK_RE`). Los logs de
+`failed_sanitized/` (`*.gradle.log` de Gradle y `*.precheck.log` de
+`sanitize_locales.py`) se leen línea a línea, sin cargarlos enteros.
+
+Los ficheros se reparten entre procesos y los resultados se guardan en
+`failed_sanitized/.report_cache.json` por (tamaño, mtime, hash): un locale o
+un log que no ha cambiado no se vuelve a analizar. Se escriben `report.txt` y
+`report.json` (todos los problemas, sin recortar) en `failed_sanitized/`.
+
+Usage: run from project root:
+    python3 scripts/report_locale_issues.py [--workers N] [--full]
+"""
+import argparse
+import hashlib
+import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import List, Tuple
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DISABLED = PROJECT_ROOT / 'app' / 'src' / 'main' / 'res_disabled_locales'
 FAILED = DISABLED / 'failed_sanitized'
+CACHE_PATH = FAILED / '.report_cache.json'
+# v2: números de línea con los saltos de str.splitlines
+CACHE_VERSION = 2
 
 Issue = Tuple[int, str, str]
 
+# Una alternativa por tipo; cada una consume solo `\` + letra, `&` o `<?xml`, así que
+# ninguna tapa a otra y se encuentran las mismas coincidencias que con pasadas separadas.
+_ISSUE_RE = re.compile(
+    r'\\(?:(?P<bad_u>u)(?![0-9A-Fa-f]{4})|(?P<newline>n)|(?P<apostrophe>\')|(?P<stray>)(?![nu"\'\\]))'
+    r'|(?P<amp>&)(?!#\d+;|#x[0-9A-Fa-f]+;|[A-Za-z0-9]+;)'
+    r'|(?P<prolog><\?xml)'
+)
+# grupo -> (tipo, orden dentro de la línea, se informa una sola vez por línea)
+_KINDS = {
+    'bad_u': ('invalid-\\u', 0, False),
+    'newline': ('literal-\\n', 1, True),
+    'apostrophe': ('escaped-apostrophe', 2, True),
+    'stray': ('stray-backslash', 3, False),
+    'amp': ('unescaped-&', 4, True),
+}
+# saltos de línea de str.splitlines (\r\n cuenta como uno): mismos números de línea que `text.splitlines()`
+_LINE_BREAK_RE = re.compile('\r\n|[\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+_KEY_RE = re.compile(r'string/([A-Za-z0-9_]+)')
+LOG_SUFFIXES = ('.gradle.log', '.precheck.log')
+SUMMARY_MAX = 10
 
-def parse_gradle_logs():
-    results = {}
-    if not FAILED.exists():
-        return results
-    for log in FAILED.glob('*.gradle.log'):
-        locale = log.stem.replace('.gradle', '')
-        text = log.read_text(encoding='utf-8', errors='ignore')
-        keys = set(re.findall(r'string/([A-Za-z0-9_]+)', text))
-        summary_lines = [l.strip() for l in text.splitlines() if 'Failed to flatten XML' in l or 'Invalid' in l]
-        results[locale] = {
-            'keys': sorted(keys),
-            'summary': summary_lines[:10],
-        }
-    return results
 
+def _line_issues(matches, line):
+    snippet = line.strip()
+    out, once = [], set()
+    for group in sorted(matches, key=lambda g: _KINDS[g][1]):
+        kind, _, single = _KINDS[group]
+        if single:
+            if kind in once:
+                continue
+            once.add(kind)
+        out.append((kind, snippet))
+    return out
 
-def find_issues_in_file(file_path: Path) -> List[Issue]:
+
+def scan_text(text: str) -> List[Issue]:
+    """Problemas de un strings.xml en una sola pasada de `_ISSUE_RE`."""
     issues: List[Issue] = []
-    if not file_path.exists():
-        return issues
-    text = file_path.read_text(encoding='utf-8', errors='ignore')
-    # duplicate prolog
-    if text.count('<?xml') > 1:
-        issues.append((1, 'duplicate-prolog', 'Más de una cabecera XML detectada'))
-    lines = text.splitlines()
-    for idx, line in enumerate(lines, start=1):
-        # invalid unicode escape: \u not followed by 4 hex digits
-        for m in re.finditer(r'\\u([0-9A-Fa-f]{0,3})(?![0-9A-Fa-f])', line):
-            issues.append((idx, 'invalid-\\u', line.strip()))
-        # literal newline escape
-        if re.search(r'\\n', line):
-            issues.append((idx, 'literal-\\n', line.strip()))
-        # backslash-escaped apostrophe
-        if re.search(r"\\'", line):
-            issues.append((idx, "escaped-apostrophe", line.strip()))
-        # stray backslash (not part of \\n, \\u, \\" or \\')
-        for m in re.finditer(r'\\(?![nu"\'\\])', line):
-            issues.append((idx, 'stray-backslash', line.strip()))
-        # unescaped ampersand
-        if re.search(r'&(?!#\d+;|#x[0-9A-Fa-f]+;|[A-Za-z0-9]+;)', line):
-            issues.append((idx, 'unescaped-&', line.strip()))
-    return issues
+    prologs = 0
+    line_no, line_start = 1, 0
+    cur_line, cur_matches = None, []
 
+    def flush():
+        if cur_matches:
+            end = _LINE_BREAK_RE.search(text, cur_line[1])
+            line = text[cur_line[1]:end.start() if end else len(text)]
+            issues.extend((cur_line[0], kind, snippet) for kind, snippet in _line_issues(cur_matches, line))
 
-def main():
-    logs = parse_gradle_logs()
-    report_lines = []
-    for locale_dir in sorted(DISABLED.glob('values*')):
-        if not locale_dir.is_dir():
+    for m in _ISSUE_RE.finditer(text):
+        if m.lastgroup == 'prolog':
+            prologs += 1
             continue
-        src = locale_dir / 'strings.xml'
-        issues = find_issues_in_file(src)
-        loc_name = locale_dir.name
+        pos = m.start()
+        for br in _LINE_BREAK_RE.finditer(text, line_start, pos):
+            line_no += 1
+            line_start = br.end()
+        if cur_line is None or cur_line[0] != line_no:
+            flush()
+            cur_line, cur_matches = (line_no, line_start), []
+        cur_matches.append(m.lastgroup)
+    flush()
+    if prologs > 1:
+        issues.insert(0, (1, 'duplicate-prolog', 'Más de una cabecera XML detectada'))
+    return issues
+
+
+def find_issues_in_file(file_path: Path) -> List[Issue]:
+    if not file_path.exists():
+        return []
+    return scan_text(file_path.read_text(encoding='utf-8', errors='ignore'))
+
+
+def parse_log(log_path: Path) -> dict:
+    """Claves `string/...` y primeras líneas relevantes de un log, leído línea a línea."""
+    precheck = log_path.name.endswith('.precheck.log')
+    keys, summary = set(), []
+    with open(log_path, encoding='utf-8', errors='ignore') as fh:
+        for line in fh:
+            if 'string/' in line:
+                keys.update(_KEY_RE.findall(line))
+            if len(summary) >= SUMMARY_MAX:
+                continue
+            line = line.strip()
+            # el pre-check escribe un error por línea; de Gradle solo interesan los de aapt2
+            if line and (precheck or 'Failed to flatten XML' in line or 'Invalid' in line):
+                summary.append(line)
+    return {'keys': sorted(keys), 'summary': summary}
+
+
+def _digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def analyze(task):
+    """(ruta, tipo, hash conocido) -> (hash, resultado o None si el hash no ha cambiado). Corre en el pool."""
+    path, kind, known_digest = task
+    digest = _digest(path)
+    if digest == known_digest:
+        return digest, None
+    if kind == 'log':
+        return digest, parse_log(path)
+    return digest, [list(i) for i in find_issues_in_file(path)]
+
+
+def load_cache(path=CACHE_PATH):
+    try:
+        with open(path, encoding='utf-8') as fh:
+            cache = json.load(fh)
+        if cache.get('version') == CACHE_VERSION:
+            return cache
+    except (OSError, ValueError):
+        pass
+    return {'version': CACHE_VERSION, 'files': {}}
+
+
+def save_cache(cache, path=CACHE_PATH):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(cache, fh, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def collect(targets, cache, workers=1):
+    """Resultado de cada (ruta, tipo), reutilizando la caché; devuelve ({ruta: resultado}, analizados)."""
+    files = cache['files']
+    results, stale = {}, []
+    for path, kind in targets:
+        key = path.relative_to(DISABLED).as_posix()
+        st = path.stat()
+        known = files.get(key)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            results[path] = known[3]
+        else:
+            stale.append((path, kind, key, st, known))
+    tasks = [(path, kind, known[2] if known else None) for path, kind, _, _, known in stale]
+    if len(tasks) > 1 and workers > 1:
+        with ProcessPoolExecutor(min(workers, len(tasks))) as pool:
+            analyzed = list(pool.map(analyze, tasks))
+    else:
+        analyzed = [analyze(t) for t in tasks]
+    scanned = 0
+    for (path, _, key, st, known), (digest, result) in zip(stale, analyzed):
+        if result is None:
+            result = known[3]  # solo ha cambiado el mtime
+        else:
+            scanned += 1
+        files[key] = [st.st_size, st.st_mtime_ns, digest, result]
+        results[path] = result
+    # olvida los ficheros que ya no existen
+    live = {p.relative_to(DISABLED).as_posix() for p, _ in targets}
+    for key in [k for k in files if k not in live]:
+        del files[key]
+    return results, scanned
+
+
+def log_locale(log_path: Path) -> str:
+    for suffix in LOG_SUFFIXES:
+        if log_path.name.endswith(suffix):
+            return log_path.name[:-len(suffix)]
+    return log_path.stem
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Informe de problemas de los locales desactivados.')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='procesos de análisis')
+    ap.add_argument('--full', action='store_true', help='ignorar la caché y analizar todos los ficheros')
+    args = ap.parse_args(argv)
+
+    locale_dirs = sorted(d for d in DISABLED.glob('values*') if d.is_dir())
+    sources = {d.name: d / 'strings.xml' for d in locale_dirs}
+    logs = sorted(p for suffix in LOG_SUFFIXES for p in FAILED.glob('*' + suffix)) if FAILED.exists() else []
+    targets = [(p, 'strings') for p in sources.values() if p.exists()] + [(p, 'log') for p in logs]
+
+    cache = {'version': CACHE_VERSION, 'files': {}} if args.full else load_cache()
+    results, scanned = collect(targets, cache, max(1, args.workers))
+
+    report_lines, report = [], {}
+    for loc_name, src in sources.items():
+        issues = results.get(src, [])
+        entry = {'strings': src.relative_to(PROJECT_ROOT).as_posix(),
+                 'issues': [{'line': ln, 'kind': kind, 'snippet': snippet} for ln, kind, snippet in issues],
+                 'logs': {}}
         report_lines.append(f'Locale: {loc_name}')
-        if loc_name in logs:
-            log_info = logs[loc_name]
+        for log in logs:
+            if log_locale(log) != loc_name:
+                continue
+            log_info = results[log]
+            entry['logs'][log.name] = log_info
+            label = 'Pre-check' if log.name.endswith('.precheck.log') else 'Gradle'
             if log_info['keys']:
-                report_lines.append(f" - Keys reportadas en Gradle: {', '.join(log_info['keys'])}")
+                report_lines.append(f" - Keys reportadas en {label}: {', '.join(log_info['keys'])}")
             for s in log_info['summary']:
-                report_lines.append(f" - Gradle: {s}")
+                report_lines.append(f' - {label}: {s}')
         if not issues:
             report_lines.append(' - Sin problemas obvios detectados por patrón')
         else:
             for (ln, kind, snippet) in issues[:20]:
                 report_lines.append(f' - [{kind}] línea {ln}: {snippet[:180]}')
         report_lines.append('')
+        report[loc_name] = entry
+
     output_dir = FAILED
     output_dir.mkdir(parents=True, exist_ok=True)
     out = output_dir / 'report.txt'
     out.write_text('\n'.join(report_lines), encoding='utf-8')
+    (output_dir / 'report.json').write_text(json.dumps({'locales': report}, ensure_ascii=False, indent=2),
+                                            encoding='utf-8')
+    save_cache(cache)
     print(out)
+    print(f'{len(targets)} ficheros, {scanned} analizados, {len(targets) - scanned} sin cambios')
+    return 0
 
 
 if __name__ == '__main__':
-    main()
+    raise SystemExit(main())
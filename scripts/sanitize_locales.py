@@ -2,24 +2,36 @@
 """
 Sanitize locale resource backups in `app/src/main/res_disabled_locales/`.
 
-For each `values-xx` folder found there, this script:
+For each `values-xx` folder found there, this script (in parallel, one process per locale):
  - reads the original `strings.xml` (best-effort extraction of first <resources>..</resources> block),
  - sanitizes each string value:
      - convierte `\n` o saltos reales a `&#10;`
      - convierte `\\uXXXX` a carácter Unicode real (no a entidades hex)
      - normaliza apóstrofos ASCII `'` a tipográfico `’` (U+2019), especialmente si hay placeholders `%`
      - escapa `&` sueltos a `&amp;` (manteniendo entidades válidas)
- - writes a safe fallback into `app/src/main/res/values-xx/strings.xml` (backing up any existing target),
- - runs `./gradlew :app:mergeDebugResources` and records success/failure. On failure, it restores the backup and leaves the original in the disabled folder for manual review.
+ - pre-checks the sanitized XML in-process with the checks aapt2 applies when flattening
+   (well-formedness, resource names, duplicates, unescaped apostrophes, invalid `\\u` escapes,
+   several non-positional substitutions without `formatted="false"`); a locale that fails
+   never reaches Gradle.
+
+Then every locale that passed is written into `app/src/main/res/values-xx/strings.xml`
+(backing up any existing target) and verified with a single `./gradlew :app:mergeDebugResources`.
+Only if that merge fails are the locales bisected (restoring the backup of each culprit),
+so the usual case costs one Gradle run instead of one per locale. Failures leave the
+original in the disabled folder for manual review and their sanitized XML and log in
+`failed_sanitized/`.
 
 Usage: run from project root:
-    ./scripts/sanitize_locales.py
+    ./scripts/sanitize_locales.py [--workers N] [--check-only]
 
 """
+import argparse
 import os
 import re
 import shutil
 import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from xml.etree import ElementTree as ET
 
@@ -27,6 +39,10 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 DISABLED = PROJECT_ROOT / 'app' / 'src' / 'main' / 'res_disabled_locales'
 RES = PROJECT_ROOT / 'app' / 'src' / 'main' / 'res'
 GRADLE_CMD = ['./gradlew', ':app:mergeDebugResources', '--stacktrace']
+FAILED_DIR = DISABLED / 'failed_sanitized'
+
+_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+_FORMAT_RE = re.compile(r'%(\d+\$)?[-#+ 0,(<]*\d*(?:\.\d+)?([a-zA-Z%])')
 
 
 def extract_resources_block(text):
@@ -103,12 +119,16 @@ def parse_and_sanitize(file_path):
     return root
 
 
-def write_resource(root, target_path):
-    target_path.parent.mkdir(parents=True, exist_ok=True)
+def resource_bytes(root):
     # pretty print minimal
     xml = ET.tostring(root, encoding='utf-8')
     prolog = b'<?xml version="1.0" encoding="utf-8"?>\n'
-    target_path.write_bytes(prolog + xml)
+    return prolog + xml
+
+
+def write_resource(root, target_path):
+    target_path.parent.mkdir(parents=True, exist_ok=True)
+    target_path.write_bytes(resource_bytes(root))
 
 
 def run_gradle_merge():
@@ -116,93 +136,207 @@ def run_gradle_merge():
     return (proc.returncode == 0, proc.stdout)
 
 
-def main():
+def target_locale(locale):
+    # Normalize target resource directory name: strip any suffixes like _auto_move
+    m = re.match(r'^(values(?:-[A-Za-z0-9]+(?:-r[A-Za-z0-9]+)?)?)', locale)
+    if m:
+        return m.group(1)
+    # fallback: if folder is 'values-xx_extra', take first hyphen chunk
+    parts = locale.split('_')[0].split('-')
+    if len(parts) >= 2:
+        return 'values-' + parts[1]
+    return 'values'
+
+
+def _check_string(ref, text, formatted):
+    """Errores que aapt2 daría al aplanar el valor `text` (ya sin entidades XML) de `ref`."""
+    issues = []
+    quoted = escaped = False
+    for i, ch in enumerate(text):
+        if escaped:
+            if ch == 'u' and not re.match(r'[0-9A-Fa-f]{4}', text[i + 1:i + 5]):
+                issues.append(f'{ref}: invalid unicode escape sequence')
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif ch == "'" and not quoted:
+            issues.append(f'{ref}: unescaped apostrophe')
+            break
+    if formatted != 'false':
+        args = [m for m in _FORMAT_RE.finditer(text) if m.group(2) not in '%n']
+        if sum(1 for m in args if not m.group(1)) > 1:
+            issues.append(f'{ref}: multiple substitutions specified in non-positional format')
+    return issues
+
+
+def precheck(xml_bytes):
+    """Comprobación en proceso equivalente a la de aapt2; devuelve la lista de errores (vacía si pasa)."""
+    try:
+        root = ET.fromstring(xml_bytes)
+    except ET.ParseError as e:
+        return [f'XML mal formado: {e}']
+    if root.tag != 'resources':
+        return [f'raíz <{root.tag}> en lugar de <resources>']
+    issues, seen = [], set()
+    for child in root:
+        name = child.get('name')
+        ref = f'{child.tag}/{name}'
+        if not name or not _NAME_RE.match(name):
+            issues.append(f'{ref}: invalid resource name')
+            continue
+        if ref in seen:
+            issues.append(f'{ref}: duplicate value for resource')
+        seen.add(ref)
+        formatted = child.get('formatted')
+        if child.tag == 'string':
+            issues.extend(_check_string(ref, ''.join(child.itertext()), formatted))
+        elif child.tag in ('plurals', 'string-array'):
+            for item in child.iter('item'):
+                issues.extend(_check_string(ref, ''.join(item.itertext()), formatted))
+    return issues
+
+
+def prepare_locale(locale_dir):
+    """Sanea y pre-comprueba un `values-xx` de DISABLED (se ejecuta en un proceso del pool)."""
+    locale = locale_dir.name  # e.g., values-tr or a backup like values-tr_auto_move
+    result = {'locale': locale, 'target': target_locale(locale), 'xml': None, 'issues': []}
+    src = locale_dir / 'strings.xml'
+    if not src.exists():
+        return dict(result, status='no-strings', detail='skipped')
+    try:
+        root = parse_and_sanitize(src)
+    except Exception as e:
+        return dict(result, status='parse-error', detail=str(e))
+    result['xml'] = resource_bytes(root)
+    result['issues'] = precheck(result['xml'])
+    if result['issues']:
+        return dict(result, status='precheck-fail', detail='left-disabled')
+    return dict(result, status='ready', detail='')
+
+
+def save_failure(cand, log_name, log_text):
+    # Save sanitized version and the log for diagnosis
+    FAILED_DIR.mkdir(parents=True, exist_ok=True)
+    if cand['xml'] is not None:
+        (FAILED_DIR / f"{cand['locale']}.sanitized.xml").write_bytes(cand['xml'])
+    (FAILED_DIR / f"{cand['locale']}.{log_name}.log").write_text(log_text, encoding='utf-8')
+
+
+def install(cand):
+    target_file = RES / cand['target'] / 'strings.xml'
+    # Backup existing target if any (only once: a bisection round may install it again)
+    if 'backup' not in cand:
+        cand['backup'] = None
+        if target_file.exists():
+            cand['backup'] = DISABLED / f"{cand['locale']}.pre_sanitize_backup.xml"
+            shutil.copy2(target_file, cand['backup'])
+            print(' - backed up existing', target_file, '->', cand['backup'])
+    target_file.parent.mkdir(parents=True, exist_ok=True)
+    target_file.write_bytes(cand['xml'])
+
+
+def uninstall(cand):
+    # restore backup or remove target
+    target_file = RES / cand['target'] / 'strings.xml'
+    if cand.get('backup') and cand['backup'].exists():
+        shutil.copy2(cand['backup'], target_file)
+    else:
+        try:
+            target_file.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class GradleVerifier:
+    """Verifica grupos de locales con un solo merge y biseca únicamente los grupos que fallan."""
+
+    def __init__(self):
+        self.runs = 0
+
+    def merge(self, cands):
+        self.runs += 1
+        print(f" - running gradle merge #{self.runs} ({len(cands)} locales: "
+              f"{', '.join(c['locale'] for c in cands)})...")
+        return run_gradle_merge()
+
+    def verify(self, cands, failed_out=None):
+        """Instala `cands` y devuelve (buenos, [(malo, salida de gradle)]); los buenos quedan instalados.
+
+        Con `failed_out` ya se sabe que el grupo falla (su salida de Gradle) y se biseca directamente.
+        """
+        if failed_out is None:
+            for c in cands:
+                install(c)
+            ok, failed_out = self.merge(cands)
+            if ok:
+                return cands, []
+            for c in cands:
+                uninstall(c)
+        if len(cands) == 1:
+            return [], [(cands[0], failed_out)]
+        mid = len(cands) // 2
+        good, bad = self.verify(cands[:mid])
+        # si la primera mitad pasa entera, el fallo está en la segunda: no hace falta volver a probarla
+        more_good, more_bad = self.verify(cands[mid:], None if bad else failed_out)
+        return good + more_good, bad + more_bad
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Sanitize and reintroduce disabled locales.')
+    ap.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='procesos de saneado')
+    ap.add_argument('--check-only', action='store_true', help='solo sanear y pre-comprobar, sin escribir en res/ ni Gradle')
+    args = ap.parse_args(argv)
+
     if not DISABLED.exists():
         print('No disabled locales folder found at', DISABLED)
         return 1
 
-    results = []
-    for child in DISABLED.iterdir():
-        if not child.is_dir():
-            continue
-        if not child.name.startswith('values'):
-            continue
-        locale = child.name  # e.g., values-tr or a backup like values-tr_auto_move
-        print('\nProcessing', locale)
-        src = child / 'strings.xml'
-        if not src.exists():
-            print(' - no strings.xml in', child, '; skipping')
-            results.append((locale, 'no-strings', 'skipped'))
-            continue
+    t0 = time.perf_counter()
+    dirs = sorted(d for d in DISABLED.iterdir() if d.is_dir() and d.name.startswith('values'))
+    with ProcessPoolExecutor(max(1, args.workers)) as pool:
+        prepared = list(pool.map(prepare_locale, dirs))
+    print(f'Sanitized and pre-checked {len(prepared)} locales in {time.perf_counter() - t0:.2f}s')
 
-        try:
-            root = parse_and_sanitize(src)
-        except Exception as e:
-            print(' - parse failed:', e)
-            results.append((locale, 'parse-error', str(e)))
+    results, ready, claimed = [], [], {}
+    for cand in prepared:
+        locale = cand['locale']
+        if cand['status'] == 'precheck-fail':
+            print('\n', locale, 'pre-check FAILED:')
+            for issue in cand['issues'][:20]:
+                print('   -', issue)
+            if not args.check_only:
+                save_failure(cand, 'precheck', '\n'.join(cand['issues']) + '\n')
+        elif cand['status'] == 'ready' and cand['target'] in claimed:
+            # dos carpetas (p. ej. values-it y values-it-disabled) para el mismo destino: gana la primera
+            cand.update(status='duplicate-target', detail=f"skipped ({claimed[cand['target']]})")
+        elif cand['status'] == 'ready':
+            claimed[cand['target']] = locale
+            ready.append(cand)
             continue
+        results.append((locale, cand['status'], cand['detail']))
 
-        # Normalize target resource directory name: strip any suffixes like _auto_move
-        m = re.match(r'^(values(?:-[A-Za-z0-9]+(?:-r[A-Za-z0-9]+)?)?)', locale)
-        if m:
-            safe_locale = m.group(1)
-        else:
-            # fallback: if folder is 'values-xx_extra', take first hyphen chunk
-            parts = locale.split('_')[0].split('-')
-            if len(parts) >= 2:
-                safe_locale = 'values-' + parts[1]
-            else:
-                safe_locale = 'values'
-
-        target_dir = RES / safe_locale
-        target_file = target_dir / 'strings.xml'
-
-        # Backup existing target if any
-        backup = None
-        if target_file.exists():
-            backup = DISABLED / f'{locale}.pre_sanitize_backup.xml'
-            shutil.copy2(target_file, backup)
-            print(' - backed up existing', target_file, '->', backup)
-
-        # Write sanitized
-        print(' - writing sanitized to', target_file)
-        write_resource(root, target_file)
-
-        # Run gradle merge
-        print(' - running gradle merge...')
-        ok, gradle_out = run_gradle_merge()
-        if ok:
-            print(' - merge OK; locale reintroduced:', locale)
-            results.append((locale, 'ok', 'reintroduced'))
-        else:
-            print(' - merge FAILED; restoring backup and moving sanitized aside')
-            # restore backup or remove target
-            if backup and backup.exists():
-                shutil.copy2(backup, target_file)
-            else:
-                try:
-                    target_file.unlink()
-                except Exception:
-                    pass
-            # Save sanitized version and gradle output for diagnosis
-            failed_dir = DISABLED / 'failed_sanitized'
-            failed_dir.mkdir(parents=True, exist_ok=True)
-            sanitized_save = failed_dir / f'{locale}.sanitized.xml'
-            try:
-                shutil.copy2(target_file, sanitized_save)
-            except Exception:
-                pass
-            log_file = failed_dir / f'{locale}.gradle.log'
-            try:
-                log_file.write_text(gradle_out, encoding='utf-8')
-            except Exception:
-                pass
+    if ready and not args.check_only:
+        print('\nVerifying', len(ready), 'locales with gradle')
+        verifier = GradleVerifier()
+        good, bad = verifier.verify(ready)
+        for cand in good:
+            print(' - merge OK; locale reintroduced:', cand['locale'])
+            results.append((cand['locale'], 'ok', 'reintroduced'))
+        for cand, gradle_out in bad:
+            print(' - merge FAILED; backup restored:', cand['locale'])
+            save_failure(cand, 'gradle', gradle_out)
             # leave original in disabled for manual review
-            results.append((locale, 'merge-fail', 'left-disabled'))
+            results.append((cand['locale'], 'merge-fail', 'left-disabled'))
+        print(f'{verifier.runs} gradle run(s)')
+    else:
+        results.extend((c['locale'], 'precheck-ok', 'not-written') for c in ready)
 
     print('\nSummary:')
-    for r in results:
+    for r in sorted(results):
         print(' -', r[0], r[1], r[2])
+    print(f'Total {time.perf_counter() - t0:.1f}s')
     return 0
 
 
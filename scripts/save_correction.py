@@ -1,17 +1,24 @@
 #!/usr/bin/env python3
 import json,sys
 from pathlib import Path
-from datetime import datetime
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from scripts.corrections_index import open_index, persist
+from scripts.corrections_store import get_store
 
 OUT_DIR = Path("artifacts_device/persisted_corrections")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
 def save_correction(payload):
-    ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
-    debug = payload.get("debug_id","debug_unknown")
-    fname = OUT_DIR / f"{debug}_corr_{ts}.json"
-    fname.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-    print("WROTE", fname)
+    # CORRECTIONS_STORAGE=files mantiene un JSON por corrección
+    store = get_store(OUT_DIR)
+    # también al índice SQLite, para que la API la liste
+    loc, _ = persist(store, open_index(OUT_DIR), payload)
+    store.flush()
+    print("WROTE", loc)
 
 if __name__ == "__main__":
     # usage: cat payload.json | python3 scripts/save_correction.py